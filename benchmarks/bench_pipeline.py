@@ -0,0 +1,276 @@
+"""
+Benchmark por etapa del pipeline ETL sobre facturas sintéticas.
+
+Mide por separado cada etapa del procesamiento de un documento y reporta
+documentos por segundo, latencias p50/p99 y memoria pico. Los resultados se
+pueden guardar como línea base y comparar contra ella en ejecuciones futuras.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_pipeline --documentos 500 --detalles 5 50
+    python -m benchmarks.bench_pipeline --guardar-baseline
+    python -m benchmarks.bench_pipeline --baseline benchmarks/baseline.json --umbral 10
+
+Sin --mongo-uri el sumidero se mide contra una colección en memoria que
+serializa cada documento a BSON; con --mongo-uri se usa un mongod real.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bson
+
+from src.extraction.schema_registry import XSD_FACTURA_PATH, obtener_registro
+from src.extraction.xml_parse import (
+    extraer_comprobante_xml,
+    leer_comprobante_xml,
+    leer_contenido_xml,
+    obtener_version_factura,
+    validar_y_convertir_a_json,
+)
+from src.transformation.factura_transformer import transformar_factura
+from src.utils.mongo_store import MongoWriter
+
+from .generador_facturas import VERSIONES, generar_directorio
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+ETAPAS = [
+    "leer_contenido_xml",
+    "extraer_comprobante_xml",
+    "obtener_version_factura",
+    "validar_y_convertir_a_json",
+    "transformar_factura",
+    "mongo_sink",
+    "leer_comprobante_xml",
+]
+
+
+class ColeccionEnMemoria:
+    """Colección mínima compatible con MongoWriter que serializa a BSON."""
+
+    def __init__(self):
+        self.documentos = {}
+
+    def bulk_write(self, operaciones, ordered=True):
+        for operacion in operaciones:
+            documento = operacion._doc
+            self.documentos[documento.get("_id")] = bson.encode(documento)
+
+        class _Resultado:
+            bulk_api_result = {"nUpserted": len(operaciones), "nModified": 0}
+
+        return _Resultado()
+
+
+def _writer(coleccion, batch_size):
+    """
+    MongoWriter del benchmark: sólo las escrituras de los documentos, sin rollups
+    ni índices, para que la etapa mida lo mismo que la línea base.
+    """
+    return MongoWriter(
+        collection=coleccion,
+        batch_size=batch_size,
+        flush_interval=float("inf"),
+        rollups=False,
+        indices=False,
+    )
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+def _resumen(tiempos, pico_bytes):
+    total = sum(tiempos)
+    return {
+        "docs_s": round(len(tiempos) / total, 1) if total else 0.0,
+        "p50_ms": round(_percentil(tiempos, 50) * 1000, 4),
+        "p99_ms": round(_percentil(tiempos, 99) * 1000, 4),
+        "media_ms": round(statistics.fmean(tiempos) * 1000, 4) if tiempos else 0.0,
+        "pico_kb": round(pico_bytes / 1024, 1),
+    }
+
+
+def _medir_etapas(rutas, coleccion, batch_size):
+    """Ejecuta todas las etapas sobre los documentos y retorna los tiempos por etapa."""
+    tiempos = {etapa: [] for etapa in ETAPAS}
+    writer = _writer(coleccion, batch_size)
+    reloj = time.perf_counter
+
+    for ruta in rutas:
+        t0 = reloj()
+        contenido = leer_contenido_xml(ruta)
+        t1 = reloj()
+        comprobante = extraer_comprobante_xml(contenido)
+        t2 = reloj()
+        version, root = obtener_version_factura(comprobante)
+        t3 = reloj()
+        data = validar_y_convertir_a_json(root, version, XSD_FACTURA_PATH)
+        t4 = reloj()
+        transformado = transformar_factura(data)
+        t5 = reloj()
+        writer.add(transformado)
+        t6 = reloj()
+        leer_comprobante_xml(ruta)
+        t7 = reloj()
+
+        tiempos["leer_contenido_xml"].append(t1 - t0)
+        tiempos["extraer_comprobante_xml"].append(t2 - t1)
+        tiempos["obtener_version_factura"].append(t3 - t2)
+        tiempos["validar_y_convertir_a_json"].append(t4 - t3)
+        tiempos["transformar_factura"].append(t5 - t4)
+        tiempos["mongo_sink"].append(t6 - t5)
+        tiempos["leer_comprobante_xml"].append(t7 - t6)
+
+    t0 = reloj()
+    writer.flush()
+    # El último lote se reparte entre los documentos que lo componen
+    if tiempos["mongo_sink"]:
+        tiempos["mongo_sink"][-1] += reloj() - t0
+    return tiempos
+
+
+def _medir_memoria(rutas, coleccion, batch_size):
+    """Memoria pico por etapa (pasada separada: tracemalloc distorsiona los tiempos)."""
+    picos = {etapa: 0 for etapa in ETAPAS}
+    writer = _writer(coleccion, batch_size)
+
+    def medir(etapa, funcion, *args):
+        tracemalloc.reset_peak()
+        inicio, _ = tracemalloc.get_traced_memory()
+        resultado = funcion(*args)
+        _, pico = tracemalloc.get_traced_memory()
+        picos[etapa] = max(picos[etapa], pico - inicio)
+        return resultado
+
+    tracemalloc.start()
+    try:
+        for ruta in rutas:
+            contenido = medir("leer_contenido_xml", leer_contenido_xml, ruta)
+            comprobante = medir("extraer_comprobante_xml", extraer_comprobante_xml, contenido)
+            version, root = medir("obtener_version_factura", obtener_version_factura, comprobante)
+            data = medir("validar_y_convertir_a_json", validar_y_convertir_a_json, root, version, XSD_FACTURA_PATH)
+            transformado = medir("transformar_factura", transformar_factura, data)
+            medir("mongo_sink", writer.add, transformado)
+            medir("leer_comprobante_xml", leer_comprobante_xml, ruta)
+        medir("mongo_sink", writer.flush)
+    finally:
+        tracemalloc.stop()
+    return picos
+
+
+def ejecutar_escenario(directorio, n, version, detalles, envoltorio, firma, coleccion, batch_size):
+    """Genera los documentos de un escenario y retorna el resumen por etapa."""
+    destino = os.path.join(directorio, f"{version}-{detalles}-{envoltorio}")
+    rutas = generar_directorio(
+        destino, n, versiones=[version], detalles=(detalles,), envoltorio=envoltorio, firma=firma
+    )
+    # Calentamiento: esquema compilado y cachés del sistema de archivos
+    _medir_etapas(rutas[: min(5, len(rutas))], coleccion, batch_size)
+    tiempos = _medir_etapas(rutas, coleccion, batch_size)
+    picos = _medir_memoria(rutas[: min(50, len(rutas))], coleccion, batch_size)
+    return {etapa: _resumen(tiempos[etapa], picos[etapa]) for etapa in ETAPAS}
+
+
+def comparar(resultados, baseline, umbral):
+    """
+    Compara docs/s contra la línea base.
+
+    Returns:
+        list[str]: Descripción de las regresiones mayores al umbral (%).
+    """
+    regresiones = []
+    for escenario, etapas in resultados.items():
+        for etapa, metricas in etapas.items():
+            base = baseline.get(escenario, {}).get(etapa)
+            if not base or not base.get("docs_s"):
+                continue
+            cambio = (metricas["docs_s"] - base["docs_s"]) / base["docs_s"] * 100
+            metricas["vs_baseline_%"] = round(cambio, 1)
+            if cambio < -umbral:
+                regresiones.append(f"{escenario} / {etapa}: {cambio:.1f}% docs/s")
+    return regresiones
+
+
+def imprimir(resultados):
+    for escenario, etapas in resultados.items():
+        print("=" * 96)
+        print(escenario)
+        print("=" * 96)
+        print(f"{'etapa':<28}{'docs/s':>12}{'p50 ms':>12}{'p99 ms':>12}{'pico KB':>12}{'vs base':>12}")
+        for etapa, m in etapas.items():
+            cambio = m.get("vs_baseline_%")
+            cambio = f"{cambio:+.1f}%" if cambio is not None else "-"
+            print(f"{etapa:<28}{m['docs_s']:>12}{m['p50_ms']:>12}{m['p99_ms']:>12}{m['pico_kb']:>12}{cambio:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapa del pipeline ETL")
+    parser.add_argument("--documentos", type=int, default=200)
+    parser.add_argument("--versiones", nargs="+", default=VERSIONES, choices=VERSIONES)
+    parser.add_argument("--detalles", type=int, nargs="+", default=[5, 50])
+    parser.add_argument("--envoltorios", nargs="+", default=["cdata", "escapado"], choices=["cdata", "escapado"])
+    parser.add_argument("--sin-firma", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--mongo-uri", help="Medir el sumidero contra un mongod real")
+    parser.add_argument("--baseline", default=None, help="Archivo de línea base para comparar")
+    parser.add_argument("--guardar-baseline", nargs="?", const=BASELINE_PATH, default=None)
+    parser.add_argument("--umbral", type=float, default=10.0, help="Regresión tolerada en %% de docs/s")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    obtener_registro().precargar()
+    if args.mongo_uri:
+        from pymongo import MongoClient
+
+        coleccion = MongoClient(args.mongo_uri)["tfm_benchmark"]["invoice_collection"]
+        coleccion.drop()
+    else:
+        coleccion = ColeccionEnMemoria()
+
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="tfm-bench-") as directorio:
+        for version in args.versiones:
+            for detalles in args.detalles:
+                for envoltorio in args.envoltorios:
+                    escenario = f"factura {version} | {detalles} detalles | {envoltorio}"
+                    resultados[escenario] = ejecutar_escenario(
+                        directorio, args.documentos, version, detalles, envoltorio,
+                        not args.sin_firma, coleccion, args.batch_size,
+                    )
+
+    regresiones = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.umbral)
+
+    imprimir(resultados)
+
+    metadatos = {"python": platform.python_version(), "plataforma": platform.platform(), "documentos": args.documentos}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"metadatos": metadatos, "resultados": resultados}, f, indent=2, ensure_ascii=False)
+    if args.guardar_baseline:
+        with open(args.guardar_baseline, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"Línea base guardada en {args.guardar_baseline}")
+
+    if regresiones:
+        print("Regresiones respecto a la línea base:")
+        for regresion in regresiones:
+            print(f"  - {regresion}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Generador de facturas electrónicas sintéticas del SRI para los benchmarks.
+
+Produce archivos de autorización (<autorizacion> con el <comprobante> en CDATA
+o escapado) con facturas válidas contra los XSD de src/xsd/factura, con un
+número configurable de detalles y firma electrónica opcional.
+
+Uso:
+    python -m benchmarks.generador_facturas destino --documentos 1000 --detalles 5
+"""
+import argparse
+import base64
+import os
+import random
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+VERSIONES = ["1.0.0", "1.1.0", "2.0.0", "2.1.0"]
+
+_PRODUCTOS = [
+    ("ARROZ SUPERIOR 2KG", "UND", 2.35),
+    ("ACEITE VEGETAL 1L", "UND", 3.10),
+    ("LECHE ENTERA 1L", "UND", 0.95),
+    ("CEMENTO PORTLAND 50KG", "SACO", 8.25),
+    ("SERVICIO DE MANTENIMIENTO", "SRV", 45.00),
+    ("CABLE ELECTRICO #12 & ACCESORIOS", "M", 0.65),
+    ("CUADERNO <100 HOJAS>", "UND", 1.40),
+]
+_FORMAS_PAGO = ["01", "16", "19", "20"]
+
+
+def digito_verificador(clave48: str) -> str:
+    """Dígito verificador módulo 11 de la clave de acceso (ficha técnica del SRI)."""
+    total = 0
+    factor = 2
+    for digito in reversed(clave48):
+        total += int(digito) * factor
+        factor = 2 if factor == 7 else factor + 1
+    verificador = 11 - total % 11
+    if verificador == 11:
+        return "0"
+    if verificador == 10:
+        return "1"
+    return str(verificador)
+
+
+def clave_acceso(fecha: date, cod_doc: str, ruc: str, ambiente: str, estab: str,
+                 pto_emi: str, secuencial: int, codigo_numerico: int, tipo_emision: str = "1") -> str:
+    """Construye una clave de acceso de 49 dígitos."""
+    clave48 = (
+        fecha.strftime("%d%m%Y") + cod_doc + ruc + ambiente + estab + pto_emi
+        + f"{secuencial:09d}" + f"{codigo_numerico:08d}" + tipo_emision
+    )
+    return clave48 + digito_verificador(clave48)
+
+
+def _firma(rng: random.Random) -> str:
+    """Bloque ds:Signature con tamaño similar al de un comprobante real."""
+    valor = base64.b64encode(rng.randbytes(256)).decode()
+    certificado = base64.b64encode(rng.randbytes(1800)).decode()
+    return (
+        '<ds:Signature xmlns:ds="http://www.w3.org/2000/09/xmldsig#" Id="Signature1">'
+        "<ds:SignedInfo><ds:CanonicalizationMethod Algorithm=\"http://www.w3.org/TR/2001/REC-xml-c14n-20010315\"/>"
+        "<ds:SignatureMethod Algorithm=\"http://www.w3.org/2000/09/xmldsig#rsa-sha1\"/>"
+        "<ds:Reference URI=\"#comprobante\"><ds:DigestMethod Algorithm=\"http://www.w3.org/2000/09/xmldsig#sha1\"/>"
+        f"<ds:DigestValue>{base64.b64encode(rng.randbytes(20)).decode()}</ds:DigestValue></ds:Reference></ds:SignedInfo>"
+        f"<ds:SignatureValue>{valor}</ds:SignatureValue>"
+        f"<ds:KeyInfo><ds:X509Data><ds:X509Certificate>{certificado}</ds:X509Certificate></ds:X509Data></ds:KeyInfo>"
+        "</ds:Signature>"
+    )
+
+
+def generar_factura(version: str, clave: str, fecha: date, ruc: str, ambiente: str,
+                    estab: str, pto_emi: str, secuencial: int, n_detalles: int,
+                    firma: bool, rng: random.Random) -> str:
+    """
+    Genera el XML de una factura válida contra el XSD de la versión indicada.
+
+    Returns:
+        str: XML del comprobante (<factura>).
+    """
+    detalles = []
+    subtotal = 0.0
+    for i in range(n_detalles):
+        descripcion, unidad, precio = rng.choice(_PRODUCTOS)
+        cantidad = rng.randint(1, 20)
+        total_linea = round(cantidad * precio, 2)
+        iva = round(total_linea * 0.12, 2)
+        subtotal += total_linea
+        detalles.append(
+            "<detalle>"
+            f"<codigoPrincipal>P{i:05d}</codigoPrincipal>"
+            f"<descripcion>{escape(descripcion)}</descripcion>"
+            f"<cantidad>{cantidad}.00</cantidad>"
+            f"<precioUnitario>{precio:.2f}</precioUnitario>"
+            "<descuento>0.00</descuento>"
+            f"<precioTotalSinImpuesto>{total_linea:.2f}</precioTotalSinImpuesto>"
+            "<impuestos><impuesto><codigo>2</codigo><codigoPorcentaje>2</codigoPorcentaje>"
+            f"<tarifa>12</tarifa><baseImponible>{total_linea:.2f}</baseImponible>"
+            f"<valor>{iva:.2f}</valor></impuesto></impuestos>"
+            "</detalle>"
+        )
+    subtotal = round(subtotal, 2)
+    iva_total = round(subtotal * 0.12, 2)
+    importe = round(subtotal + iva_total, 2)
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<factura id="comprobante" version="{version}">'
+        "<infoTributaria>"
+        f"<ambiente>{ambiente}</ambiente><tipoEmision>1</tipoEmision>"
+        "<razonSocial>COMERCIAL SINTETICA S.A.</razonSocial>"
+        f"<ruc>{ruc}</ruc><claveAcceso>{clave}</claveAcceso><codDoc>01</codDoc>"
+        f"<estab>{estab}</estab><ptoEmi>{pto_emi}</ptoEmi><secuencial>{secuencial:09d}</secuencial>"
+        "<dirMatriz>AV. AMAZONAS Y COLON</dirMatriz>"
+        "</infoTributaria>"
+        "<infoFactura>"
+        f"<fechaEmision>{fecha.strftime('%d/%m/%Y')}</fechaEmision>"
+        "<dirEstablecimiento>AV. 10 DE AGOSTO &amp; RIOFRIO</dirEstablecimiento>"
+        "<obligadoContabilidad>SI</obligadoContabilidad>"
+        "<tipoIdentificacionComprador>05</tipoIdentificacionComprador>"
+        "<razonSocialComprador>CONSUMIDOR SINTETICO</razonSocialComprador>"
+        f"<identificacionComprador>17{rng.randint(10000000, 99999999)}</identificacionComprador>"
+        "<direccionComprador>QUITO</direccionComprador>"
+        f"<totalSinImpuestos>{subtotal:.2f}</totalSinImpuestos>"
+        "<totalDescuento>0.00</totalDescuento>"
+        "<totalConImpuestos><totalImpuesto><codigo>2</codigo><codigoPorcentaje>2</codigoPorcentaje>"
+        f"<baseImponible>{subtotal:.2f}</baseImponible><valor>{iva_total:.2f}</valor>"
+        "</totalImpuesto></totalConImpuestos>"
+        "<propina>0.00</propina>"
+        f"<importeTotal>{importe:.2f}</importeTotal>"
+        "<moneda>DOLAR</moneda>"
+        f"<pagos><pago><formaPago>{rng.choice(_FORMAS_PAGO)}</formaPago><total>{importe:.2f}</total></pago></pagos>"
+        "</infoFactura>"
+        f"<detalles>{''.join(detalles)}</detalles>"
+        '<infoAdicional><campoAdicional nombre="Email">cliente@example.com</campoAdicional></infoAdicional>'
+        f"{_firma(rng) if firma else ''}"
+        "</factura>"
+    )
+
+
+def envolver_autorizacion(comprobante: str, numero_autorizacion: str, cdata: bool = True) -> str:
+    """Envuelve el comprobante en el XML de autorización que entrega el SRI."""
+    contenido = f"<![CDATA[{comprobante}]]>" if cdata else escape(comprobante)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        "<autorizacion>"
+        "<estado>AUTORIZADO</estado>"
+        f"<numeroAutorizacion>{numero_autorizacion}</numeroAutorizacion>"
+        "<fechaAutorizacion>2022-06-02T10:15:30-05:00</fechaAutorizacion>"
+        "<ambiente>PRODUCCIÓN</ambiente>"
+        f"<comprobante>{contenido}</comprobante>"
+        "<mensajes/>"
+        "</autorizacion>"
+    )
+
+
+def generar_documentos(n: int, versiones=None, detalles=(5,), envoltorio: str = "cdata",
+                       firma: bool = True, semilla: int = 0):
+    """
+    Genera documentos de autorización sintéticos.
+
+    Args:
+        n (int): Número de documentos.
+        versiones (list): Versiones de factura a alternar (por defecto todas).
+        detalles (tuple): Cantidades de líneas de detalle a alternar.
+        envoltorio (str): 'cdata', 'escapado' o 'mixto'.
+        firma (bool): Incluir el bloque ds:Signature.
+        semilla (int): Semilla del generador aleatorio.
+
+    Yields:
+        tuple: (claveAcceso, contenido del archivo XML).
+    """
+    rng = random.Random(semilla)
+    versiones = versiones or VERSIONES
+    fecha_base = date(2022, 1, 1)
+    rucs = [f"17{rng.randint(10000000, 99999999)}001" for _ in range(20)]
+    for i in range(n):
+        fecha = fecha_base + timedelta(days=rng.randint(0, 364))
+        ruc = rng.choice(rucs)
+        estab = f"{rng.randint(1, 3):03d}"
+        pto_emi = "001"
+        clave = clave_acceso(fecha, "01", ruc, "2", estab, pto_emi, i + 1, rng.randint(0, 99999999))
+        comprobante = generar_factura(
+            versiones[i % len(versiones)], clave, fecha, ruc, "2", estab, pto_emi,
+            i + 1, detalles[i % len(detalles)], firma, rng,
+        )
+        cdata = envoltorio == "cdata" or (envoltorio == "mixto" and i % 2 == 0)
+        yield clave, envolver_autorizacion(comprobante, clave, cdata)
+
+
+def generar_directorio(destino: str, n: int, **opciones) -> list:
+    """
+    Escribe documentos sintéticos en un directorio (<claveAcceso>.xml).
+
+    Returns:
+        list[str]: Rutas de los archivos generados.
+    """
+    os.makedirs(destino, exist_ok=True)
+    rutas = []
+    for clave, contenido in generar_documentos(n, **opciones):
+        ruta = os.path.join(destino, f"{clave}.xml")
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(contenido)
+        rutas.append(ruta)
+    return rutas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera facturas sintéticas del SRI")
+    parser.add_argument("destino")
+    parser.add_argument("--documentos", type=int, default=100)
+    parser.add_argument("--versiones", nargs="+", default=VERSIONES, choices=VERSIONES)
+    parser.add_argument("--detalles", type=int, nargs="+", default=[5])
+    parser.add_argument("--envoltorio", choices=["cdata", "escapado", "mixto"], default="cdata")
+    parser.add_argument("--sin-firma", action="store_true")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+    rutas = generar_directorio(
+        args.destino,
+        args.documentos,
+        versiones=args.versiones,
+        detalles=tuple(args.detalles),
+        envoltorio=args.envoltorio,
+        firma=not args.sin_firma,
+        semilla=args.semilla,
+    )
+    print(f"{len(rutas)} documentos generados en {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,475 @@
-from src.utils.file_operation import add_id_to_process_index, map_directory_to_dataframe
-from src.utils.mongo_store import save_dict_to_mongo
-from src.extraction.xml_parse import procesar_factura_desde_archivo
-from src.transformation.factura_transformer import transformar_factura
+# Sólo módulos livianos al inicio: status y dry-run no cargan el parseo (lxml,
+# xmlschema) ni MongoDB (pymongo); se importan dentro de main, al ejecutar.
+from src.utils.file_operation import (
+    INDEX_FILE_NAME,
+    add_id_to_process_index,
+    flush_process_index,
+    iter_pending_files,
+)
+from src.utils.clave_acceso import (
+    DOC_TYPE_INVOICE,
+    DOC_TYPES,
+    ENVIRONMENT_PRODUCTION,
+    ENVIRONMENT_TEST,
+    Shard,
+    access_key_filter,
+    decode_access_key,
+)
+from src.utils.dedupe import FINGERPRINTS_INDEX_FILE_NAME, KEYS_INDEX_FILE_NAME, DedupeCache
+from src.utils.failure_ledger import LEDGER_FILE_NAME, FailureLedger
+from src.utils.logger import setup_queue_logging
+from src.utils.manifest import (
+    MANIFEST_FILE_NAME,
+    STATUS_EXCLUDED,
+    STATUS_FAILED,
+    STATUS_PENDING,
+    STATUS_PROCESSED,
+    STATUS_SKIPPED,
+    FileManifest,
+)
+from src.utils.metrics import MetricasPipeline
+from src.utils.process_index import count_ids, get_process_index, seed_index
 
+import argparse
 import logging
-from datetime import datetime
+import os
+import time
+from collections import Counter
+from datetime import date, datetime
+from functools import partial
+from itertools import chain
 import subprocess
 import sys
 
+# Variable de entorno (o del .env) con los directorios de origen, separados por os.pathsep
+ORIGEN_XML_ENV = "ORIGEN_XML"
 
-def main():
+COMANDOS = ("run", "status", "dry-run")
+
+
+def archivo_estado(nombre, shard=None):
+    """Archivo de estado (índice, manifiesto, registro de fallos, ...) de una partición."""
+    return nombre if shard is None else shard.file_name(nombre)
+
+
+def sembrar_particion(shard):
+    """
+    Crea los índices de una partición a partir de los globales, si aún no existen.
+
+    En la primera ejecución con --shard la partición no tiene archivos de
+    estado: sin esto volvería a parsear todo lo ingerido sin particionar y no
+    detectaría como duplicados los documentos ya ingeridos. El índice de
+    procesamiento y el de claves de acceso reciben los IDs de la partición;
+    el de huellas, todas (el contenido no dice a qué partición pertenece). El
+    manifiesto y el registro de fallos no se copian: sin manifiesto sólo se
+    vuelven a listar los directorios, y los fallidos no están en el índice,
+    así que se reprocesan igual.
+
+    Args:
+        shard (Shard): Partición a iniciar.
+
+    Returns:
+        int: IDs copiados al índice de procesamiento de la partición.
+    """
+    def en_particion(file_id):
+        return file_id in shard
+
+    seed_index(archivo_estado(KEYS_INDEX_FILE_NAME, shard), KEYS_INDEX_FILE_NAME, en_particion)
+    seed_index(archivo_estado(FINGERPRINTS_INDEX_FILE_NAME, shard), FINGERPRINTS_INDEX_FILE_NAME)
+    return seed_index(archivo_estado(INDEX_FILE_NAME, shard), INDEX_FILE_NAME, en_particion)
+
+
+def indice_lectura(shard=None):
+    """
+    Índice de procesamiento para los comandos de sólo lectura (status, dry-run).
+
+    Una partición que todavía no se ejecutó no tiene índice propio: se usa el
+    global, que es con el que run la iniciará (ver sembrar_particion).
     """
-    Punto de entrada principal del programa.
+    indice = archivo_estado(INDEX_FILE_NAME, shard)
+    return indice if os.path.exists(indice) else INDEX_FILE_NAME
+
+
+def main(
+    origenes=(),
+    workers=1,
+    chunksize=16,
+    tasa_validacion=1.0,
+    umbral_streaming=None,
+    log_level="INFO",
+    intervalo_metricas=30.0,
+    metricas_json=None,
+    metricas_prometheus=None,
+    prefetch=64,
+    cola_escritura=1000,
+    deduplicar=True,
+    sink="mongo",
+    parquet_dir=None,
+    escaneo_completo=False,
+    reintentar_fallidos=False,
+    etapa_fallidos=None,
+    desde=None,
+    rucs=None,
+    ambiente=None,
+    shard=None,
+    cache_decodificados=False,
+    retransformar=False,
+    verificar_fuentes=False,
+):
+    """
+    Punto de entrada principal del programa (comando run).
+
+    Args:
+        origenes (list[str]): Directorios donde se buscan los XML (y zip/tar).
+        workers (int): Número de procesos para extraer y transformar los XML.
+        chunksize (int): Documentos enviados a cada trabajador por tarea.
+        tasa_validacion (float): Fracción de documentos validados por completo
+            con xmlschema; el resto usa el decodificador rápido.
+        umbral_streaming (int): Bytes del comprobante desde los que se decodifica
+            detalle por detalle, con memoria acotada (0 = nunca; por defecto
+            UMBRAL_STREAMING).
+        log_level (str): Nivel del log de transacciones (DEBUG muestra el detalle por documento).
+        intervalo_metricas (float): Segundos entre resúmenes de métricas.
+        metricas_json (str): Archivo donde publicar las métricas en JSON.
+        metricas_prometheus (str): Archivo donde publicar las métricas en formato Prometheus.
+        prefetch (int): Archivos leídos por anticipado por el hilo lector.
+        cola_escritura (int): Documentos en espera de escritura antes de frenar el pipeline.
+        deduplicar (bool): Omitir antes de validarlos los documentos cuyo contenido
+            o claveAcceso ya fue ingerido.
+        sink (str): Destino de los documentos: 'mongo', 'parquet' o 'ambos'.
+        parquet_dir (str): Directorio del dataset Parquet (por defecto PARQUET_DIR).
+        escaneo_completo (bool): Listar todos los directorios aunque el manifiesto
+            indique que no cambiaron.
+        reintentar_fallidos (bool): Reprocesar sólo los documentos del registro de
+            fallos en lugar de escanear el directorio.
+        etapa_fallidos (str): Con reintentar_fallidos, sólo los fallos de esta etapa.
+        desde (date): Sólo documentos emitidos desde esta fecha.
+        rucs (list[str]): Sólo documentos de estos emisores.
+        ambiente (str): Sólo documentos de este ambiente ('1' pruebas, '2' producción).
+        shard (Shard): Procesar sólo esta partición de los documentos; cada
+            partición usa sus propios índices, manifiesto, registro de fallos y log.
+        cache_decodificados (bool): Guardar el documento decodificado de cada factura
+            en la caché de decodificados (cache/decoded).
+        retransformar (bool): Volver a transformar y escribir los documentos de la
+            caché de decodificados sin leer ni validar los XML (los vencidos se
+            procesan desde el XML y se vuelven a guardar en la caché).
+        verificar_fuentes (bool): Con retransformar, leer los XML (sin parsearlos)
+            para procesar desde el XML los que cambiaron.
     """
+    # El parseo, la validación y los destinos se cargan sólo al ejecutar el pipeline
+    from src.extraction.schema_registry import CACHE_DIR, obtener_registro
+    from src.extraction.xml_parse import UMBRAL_STREAMING
+    from src.pipeline.ejecucion import iterar_resultados
+    from src.pipeline.etapas import DocumentosEnVuelo, EscritorAsincrono
+    from src.pipeline.retransformacion import iterar_retransformacion
+    from src.utils.decoded_store import DECODED_STORE_DIR, DecodedStore
+    from src.utils.mongo_store import MongoWriter
+    from src.utils.parquet_store import ParquetWriter
+
+    if umbral_streaming is None:
+        umbral_streaming = UMBRAL_STREAMING
+
     start_time = datetime.now()
     print("Ejecutando el pipeline...")
     print(f"Inicio del proceso: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
 
+    # 0. Precargar los esquemas XSD (compilados una sola vez por proceso)
+    registro_esquemas = obtener_registro().precargar(cache_dir=CACHE_DIR)
+
     # 1. Levantar el directorio para extraer los archivos XML
-    directory_contents = map_directory_to_dataframe("f:\\TFM-DATA")
+    # 2. Filtrar los archivos que no se encuentran procesados
+    # El descubrimiento es un generador: el procesamiento empieza con el primer archivo.
+    # El manifiesto guarda el mtime de cada directorio: sólo se listan los que cambiaron.
+    # Los zip/tar se leen miembro a miembro, sin extraerlos al disco.
+    # Los documentos que fallan no se marcan como procesados: quedan en el registro de
+    # fallos (etapa y tipo de error) y se reprocesan con --retry-failed.
+    # Los filtros y la partición se deciden con la claveAcceso del nombre del archivo,
+    # sin leerlo; cada partición tiene sus propios archivos de estado, así que varios
+    # nodos pueden repartirse el trabajo sin coordinarse.
+    # La primera ejecución de una partición parte del estado global
+    sembrados = sembrar_particion(shard) if shard is not None else 0
+    indice = archivo_estado(INDEX_FILE_NAME, shard)
+    filtro = access_key_filter(desde, rucs, ambiente)
+    manifiesto = FileManifest(archivo_estado(MANIFEST_FILE_NAME, shard))
+    registro_fallos = FailureLedger(archivo_estado(LEDGER_FILE_NAME, shard))
+    # Caché de decodificados: salida de la validación XSD por claveAcceso, para
+    # volver a transformar sin releer ni validar los XML (--retransform)
+    almacen = (
+        DecodedStore(archivo_estado(DECODED_STORE_DIR, shard))
+        if cache_decodificados or retransformar
+        else None
+    )
+    if retransformar:
+        # Los documentos salen de la caché de decodificados (ver iterar_retransformacion)
+        documento_to_process = None
+    elif reintentar_fallidos:
+        documento_to_process = (
+            row for row in registro_fallos.records(etapa_fallidos)
+            if filtro is None or filtro(row.id)
+        )
+    else:
+        documento_to_process = chain.from_iterable(
+            iter_pending_files(
+                origen,
+                index_file_name=indice,
+                manifest=manifiesto,
+                full_scan=escaneo_completo,
+                include_archives=True,
+                shard=shard,
+                record_filter=filtro,
+            )
+            for origen in origenes
+        )
 
-    # log registro de los archivos que se van a procesar
-    logging.basicConfig(
-        filename="log/transactionProcess.log",
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
+    # log registro de los archivos que se van a procesar (escritura en segundo plano)
+    logTransacction, log_listener = setup_queue_logging(
+        "transactionProcess", archivo_estado("log/transactionProcess.log", shard), log_level
     )
-    logTransacction = logging.getLogger("transactionProcess")
+    log_detalle = logTransacction.isEnabledFor(logging.DEBUG)
+    if sembrados:
+        logTransacction.info(f"Partición {shard}: {sembrados} IDs tomados del índice global")
 
-    # 2. Filtrar los archivos que no se encuentran procesados
-    documento_to_process = directory_contents[directory_contents["process"] == False]
+    # Métricas por etapa, emitidas periódicamente al log y a los archivos configurados
+    metricas = MetricasPipeline(
+        intervalo=intervalo_metricas,
+        ruta_json=metricas_json,
+        ruta_prometheus=metricas_prometheus,
+    )
 
-    total_documentos = len(documento_to_process)
+    total_documentos = 0
     documento_estadistitica = {
         "contador_factura": 0,
         "contador_otros": 0,
         "contador_procesados": 0,
         "contador_no_procesados": 0,
+        "contador_duplicados": 0,
+        "contador_sin_cache": 0,
     }
-    percent_complete = 0
+    documentos_por_tipo = Counter()
+
+    # Huellas de contenido y claves de acceso ya ingeridas (persisten entre ejecuciones)
+    deduplicador = (
+        DedupeCache(
+            archivo_estado(KEYS_INDEX_FILE_NAME, shard),
+            archivo_estado(FINGERPRINTS_INDEX_FILE_NAME, shard),
+        )
+        if deduplicar and not retransformar
+        else None
+    )
+
+    # Escritores por lotes (MongoDB y/o Parquet), cada uno en su propio hilo y con
+    # cola acotada (si un destino se atrasa, la lectura y el parseo esperan)
+    escritores = {}
+    if sink in ("mongo", "ambos"):
+        escritores["MongoDB"] = EscritorAsincrono(MongoWriter(), capacidad=cola_escritura)
+    if sink in ("parquet", "ambos"):
+        escritores["Parquet"] = EscritorAsincrono(
+            ParquetWriter(parquet_dir), capacidad=cola_escritura
+        )
+
+    # Documentos enviados cuya escritura aún no confirmó cada destino: sólo se
+    # marcan como procesados cuando todos los destinos los escribieron.
+    en_vuelo = DocumentosEnVuelo(len(escritores))
+
+    def documento_terminado(row):
+        # 3.5. Actualizar el índice para marcar el archivo como procesado (escritura por lotes)
+        add_id_to_process_index(row.id, indice)
+        manifiesto.set_status(row.path, STATUS_PROCESSED)
+        registro_fallos.resolve(row.id)
+        if deduplicador is not None:
+            for copia in deduplicador.confirm(row.id):
+                duplicado_confirmado(copia)
+
+    def duplicado_confirmado(row):
+        # Duplica un documento ingerido: cuenta como procesado sin escribirse
+        add_id_to_process_index(row.id, indice)
+        manifiesto.set_status(row.path, STATUS_PROCESSED)
+        registro_fallos.resolve(row.id)
+
+    def copia_pendiente(row, original):
+        # El original no se ingirió: la copia no se marca y queda pendiente
+        # para la próxima ejecución (que la procesará como un documento más)
+        logTransacction.warning(
+            f"{row.id} => Duplicate of {original}, which was not ingested: left pending"
+        )
+
+    def liberar(identifier):
+        for copia in deduplicador.release(identifier):
+            copia_pendiente(copia, identifier)
+
+    def documento_fallido(row, etapa, tipo_error, error):
+        logTransacction.error(f"{row.id} => Error processing file [{etapa}] : {error}")
+        registro_fallos.record(row.id, row.path, etapa, tipo_error, str(error))
+        manifiesto.set_status(row.path, STATUS_FAILED)
+        if deduplicador is not None:
+            liberar(row.id)
+
+    def registrar_escrituras(destino, completadas):
+        for errores, segundos, escritos in completadas:
+            metricas.observar("escritura", segundos)
+            for error in errores:
+                metricas.registrar_error("escritura", str(error["code"]))
+                en_vuelo.marcar_error(error["_id"], f"{destino}: {error['errmsg']}")
+            for row, error in en_vuelo.confirmar(escritos):
+                if error is None:
+                    documento_terminado(row)
+                    continue
+                documento_estadistitica["contador_procesados"] -= 1
+                documento_estadistitica["contador_no_procesados"] += 1
+                documento_fallido(row, "escritura", "WriteError", error)
+
+    def escritores_caidos(error):
+        # Un destino falló después de agotar los reintentos: lo que no se
+        # confirmó queda en el registro de fallos y la ejecución se detiene
+        for row in en_vuelo.todos():
+            documento_estadistitica["contador_procesados"] -= 1
+            documento_estadistitica["contador_no_procesados"] += 1
+            documento_fallido(row, "escritura", type(error.__cause__ or error).__name__, error)
+
     # 3. Iteración para procesar los archivos
-    for index, row in documento_to_process.iterrows():
-        identifier = row["id"]
-        logTransacction.info("=" * 50)
-        logTransacction.info(f"{identifier} => Starting processing for file")
-        logTransacction.info(f"{identifier} => Row data as JSON: {row.to_json()}")
-        try:
-            # 3.1 Procesamiento del archivo XML
-            factura_data = procesar_factura_desde_archivo(row["path"])
-            logTransacction.info(f"{identifier} => Successfully parsed XML file")
-
-            # 3.2 Transformador del archivo XML a Json, tambien se extrae sólo datos relevantes
-            transformed_data = transformar_factura(factura_data)
-            logTransacction.info(
-                f"{identifier} => Successfully transformed data to JSON"
+    # La extracción y transformación (CPU) se ejecuta en procesos trabajadores
+    # cuando workers > 1; la escritura en MongoDB y el índice quedan en este proceso.
+    procesar = partial(
+        iterar_resultados,
+        workers=workers,
+        chunksize=chunksize,
+        cache_dir=CACHE_DIR,
+        opciones={
+            "tasa_validacion": tasa_validacion,
+            "umbral_streaming": umbral_streaming,
+            "cachear_decodificados": almacen is not None,
+        },
+        prefetch=prefetch,
+        deduplicador=deduplicador,
+    )
+    if retransformar:
+        # Sólo la transformación y la escritura; los documentos ya se ingirieron,
+        # así que no se deduplican
+        seleccion = None
+        if filtro is not None or shard is not None:
+            def seleccion(file_id):
+                return (filtro is None or filtro(file_id)) and (shard is None or file_id in shard)
+        # Los procesados sin entrada en la caché (p. ej. ingeridos sin
+        # --cache-decodificados) no se vuelven a escribir: se informan
+        documento_estadistitica["contador_sin_cache"] = sum(
+            1
+            for file_id in get_process_index(indice)
+            if file_id not in almacen and (seleccion is None or seleccion(file_id))
+        )
+        if documento_estadistitica["contador_sin_cache"]:
+            logTransacction.warning(
+                f"{documento_estadistitica['contador_sin_cache']} documentos procesados no "
+                "tienen entrada en la caché de decodificados y no se retransforman"
             )
+        resultados = iterar_retransformacion(
+            almacen, registro_esquemas, procesar, seleccion, verificar_fuentes
+        )
+    else:
+        resultados = procesar(documento_to_process)
+    error_escritura = None
+    for row, resultado in resultados:
+        identifier = row.id
+        total_documentos += 1
+        metricas.registrar_documento(
+            identifier,
+            resultado["tiempos"],
+            resultado["ok"],
+            resultado.get("etapa"),
+            resultado.get("error_type"),
+            resultado.get("validacion"),
+            resultado.get("duplicado", False),
+        )
+        # 3.6. Mostrar el progreso de procesamiento (también durante rachas de
+        # duplicados, omitidos o fallos, que siguen con `continue`)
+        if total_documentos % 10 == 0:  # Print every 10 documents
+            print(f"Procesados {total_documentos} documentos...", end="\r")
+            metricas.tal_vez_emitir(logTransacction)
+        if log_detalle:
+            logTransacction.debug(f"{identifier} => Starting processing for file {row.path}")
+        if resultado.get("duplicado"):
+            # Ya ingerido (o en vuelo): se omitió antes de la validación XSD
+            documento_estadistitica["contador_duplicados"] += 1
+            if log_detalle:
+                logTransacction.debug(f"{identifier} => Skipped: {resultado['error']}")
+            original = resultado.get("original")
+            if original is None:
+                duplicado_confirmado(row)
+                continue
+            # Copia de un documento aún en vuelo: sólo es duplicada si el original
+            # se ingiere (si no, vuelve con deduplicador.confirm / release)
+            ingerido = deduplicador.copy_of(original, row)
+            if ingerido:
+                duplicado_confirmado(row)
+            elif ingerido is not None:
+                copia_pendiente(row, original)
+            continue
+        if resultado.get("omitido"):
+            # Tipo de comprobante sin manejador (nota de crédito, retención, ...):
+            # se omitió sin parsearlo. No entra al índice de procesamiento porque
+            # no se ingirió; el manifiesto lo marca como omitido.
+            documento_estadistitica["contador_otros"] += 1
+            documentos_por_tipo[DOC_TYPES.get(resultado["tipo"], resultado["tipo"])] += 1
+            if log_detalle:
+                logTransacction.debug(f"{identifier} => Skipped: {resultado['error']}")
+            manifiesto.set_status(row.path, STATUS_SKIPPED)
+            registro_fallos.resolve(identifier)
+            if deduplicador is not None:
+                liberar(identifier)
+            continue
+        if not resultado["ok"]:
+            documento_fallido(row, resultado["etapa"], resultado["error_type"], resultado["error"])
+            documento_estadistitica["contador_no_procesados"] += 1
+            continue
 
-            # 3.3. Guardar el documneto en MongoDB
-            status_mongo = save_dict_to_mongo(transformed_data)
-            logTransacction.info(
-                f"{identifier} => Saved data to MongoDB, status: {status_mongo}"
+        if almacen is not None and "decodificado" in resultado:
+            version, huella_fuente, decodificado = resultado["decodificado"]
+            almacen.put(
+                identifier,
+                row.path,
+                version,
+                registro_esquemas.huella(version),
+                huella_fuente,
+                decodificado,
             )
 
-            # 3.4. Actualizar estadisticas de procesamiento
-            documento_estadistitica["contador_procesados"] += 1
-            documento_estadistitica["contador_factura"] += 1
-        except Exception as e:
-            logTransacction.error(f"{identifier} => Error processing file : {e}")
-            documento_estadistitica["contador_otros"] += 1
-            documento_estadistitica["contador_no_procesados"] += 1
-        finally:
-            # 3.5. Actualizar el archivo de índice para marcar el archivo como procesado
-            add_id_to_process_index(identifier)
-            logTransacction.info(f"{identifier} => Update file for log process")
-        logTransacction.info(f"{identifier} => End processing for file")
-        # 3.6. Mostrar el progreso de procesamiento
-        if index % 10 == 0:  # Print every 10 documents
-            percent_complete = round((index + 1) / total_documentos * 100)
-        print(
-            f"{percent_complete}% - Procesando {index + 1} documentos de {total_documentos}...",
-            end="\r",
-        )
+        # 3.3. Guardar el documneto en MongoDB / Parquet (se escribe por lotes)
+        # 3.4. Actualizar estadisticas de procesamiento
+        en_vuelo.agregar(resultado["data"].get("_id"), row)
+        documento_estadistitica["contador_procesados"] += 1
+        documento_estadistitica["contador_factura"] += 1
+        documentos_por_tipo[DOC_TYPES[DOC_TYPE_INVOICE]] += 1
+        try:
+            for escritor in escritores.values():
+                escritor.enviar(resultado["data"])
+        except RuntimeError as e:
+            error_escritura = e
+            break
+        if log_detalle:
+            logTransacction.debug(f"{identifier} => Parsed, transformed and queued for writing")
+        for destino, escritor in escritores.items():
+            registrar_escrituras(destino, escritor.resultados())
+
+    resultados.close()
+
+    # Escribir el último lote en cada destino y persistir el índice de procesamiento
+    for destino, escritor in escritores.items():
+        try:
+            registrar_escrituras(destino, escritor.cerrar())
+        except RuntimeError as e:
+            registrar_escrituras(destino, escritor.resultados())
+            error_escritura = error_escritura or e
+    if error_escritura is not None:
+        logTransacction.error(f"Escritura interrumpida: {error_escritura}")
+        escritores_caidos(error_escritura)
+    flush_process_index(indice)
+    if deduplicador is not None:
+        deduplicador.flush()
+    manifiesto.close()
+    registro_fallos.close()
+    if almacen is not None:
+        almacen.close()
+    metricas.tal_vez_emitir(logTransacction, forzar=True)
+    log_listener.stop()
 
     # 4 Presentación de estadisticas de procesamiento
     print("=" * 50)
@@ -102,6 +491,140 @@ def main():
     print(
         f"Total de documentos no procesadas            : {documento_estadistitica['contador_no_procesados']}"
     )
+    print(
+        f"Duplicados omitidos antes de validar         : {documento_estadistitica['contador_duplicados']}"
+    )
+    if retransformar:
+        print(
+            f"Procesados sin entrada en la caché           : {documento_estadistitica['contador_sin_cache']}"
+        )
+    print(f"Documentos por tipo                          : {dict(documentos_por_tipo)}")
+    print(f"Documentos por modo de validación            : {dict(metricas.validaciones)}")
+    for destino, escritor in escritores.items():
+        print(f"Escrituras en {destino:<32}: {escritor.writer.estadisticas}")
+    print(f"Documentos en el registro de fallos          : {len(registro_fallos)}")
+    print(f"Escaneo incremental (manifiesto)             : {manifiesto.stats}")
+    if almacen is not None:
+        print(f"Caché de decodificados                       : {almacen.stats}")
+    if shard is not None:
+        print(f"Partición                                    : {shard.index}/{shard.count}")
+    print(f"Caché de esquemas XSD                        : {registro_esquemas.estadisticas()}")
+    print("=" * 50)
+    print("Métricas por etapa:")
+    print("=" * 50)
+    print(metricas.resumen_texto())
+
+
+def estado(shard=None):
+    """
+    Comando status: resumen del estado de la ingesta desde los archivos de estado.
+
+    No recorre los directorios ni se conecta a MongoDB: los procesados se
+    cuentan en el índice de procesamiento (sin cargarlo), los fallidos salen
+    del registro de fallos y los pendientes del manifiesto, tal como quedaron
+    en el último escaneo (dry-run los vuelve a contar).
+
+    Args:
+        shard (Shard): Mostrar el estado de esta partición.
+    """
+    inicio = time.perf_counter()
+    # Sin índice propio, los IDs de la partición en el índice global
+    indice = indice_lectura(shard)
+    procesados = count_ids(
+        indice, None if shard is None or indice != INDEX_FILE_NAME else shard.__contains__
+    )
+
+    ruta_manifiesto = archivo_estado(MANIFEST_FILE_NAME, shard)
+    por_estado = None
+    if os.path.exists(ruta_manifiesto):
+        manifiesto = FileManifest(ruta_manifiesto, read_only=True)
+        por_estado = manifiesto.counts()
+        manifiesto.close()
+
+    ruta_fallos = archivo_estado(LEDGER_FILE_NAME, shard)
+    fallos_por_etapa = Counter()
+    if os.path.exists(ruta_fallos):
+        registro_fallos = FailureLedger(ruta_fallos)
+        fallos_por_etapa.update(entrada["stage"] for entrada in registro_fallos.entries())
+
+    print("=" * 50)
+    print("Estado de la ingesta:")
+    print("=" * 50)
+    print(f"Documentos procesados (índice)               : {procesados}")
+    print(
+        f"Documentos fallidos (registro de fallos)     : {sum(fallos_por_etapa.values())}"
+        f" {dict(fallos_por_etapa)}"
+    )
+    if por_estado is None:
+        print("Pendientes (último escaneo)                  : sin manifiesto, usar dry-run")
+    else:
+        pendientes = por_estado.get(STATUS_PENDING, 0)
+        omitidos = por_estado.get(STATUS_SKIPPED, 0)
+        print(f"Pendientes (último escaneo)                  : {pendientes}")
+        print(f"Omitidos por tipo (último escaneo)           : {omitidos}")
+        if shard is not None:
+            excluidos = por_estado.get(STATUS_EXCLUDED, 0)
+            print(f"De otras particiones (último escaneo)        : {excluidos}")
+    if shard is not None:
+        print(f"Partición                                    : {shard.index}/{shard.count}")
+    print(f"Tiempo                                       : {time.perf_counter() - inicio:.3f} s")
+
+
+def simular(origenes, escaneo_completo=False, desde=None, rucs=None, ambiente=None, shard=None,
+            listar=False):
+    """
+    Comando dry-run: sólo el descubrimiento de los archivos pendientes.
+
+    Recorre los orígenes como run (manifiesto, índice de procesamiento,
+    filtros y partición), pero no lee ni parsea los documentos ni se conecta a
+    MongoDB. El manifiesto se abre en modo de sólo lectura, así que no se
+    guarda nada y la próxima ejecución sigue encontrando los mismos pendientes.
+
+    Args:
+        origenes (list[str]): Directorios donde se buscan los XML (y zip/tar).
+        escaneo_completo (bool): Listar todos los directorios aunque el manifiesto
+            indique que no cambiaron.
+        desde (date): Sólo documentos emitidos desde esta fecha.
+        rucs (list[str]): Sólo documentos de estos emisores.
+        ambiente (str): Sólo documentos de este ambiente ('1' pruebas, '2' producción).
+        shard (Shard): Sólo los documentos de esta partición.
+        listar (bool): Imprimir la ruta de cada archivo pendiente.
+    """
+    inicio = time.perf_counter()
+    indice = indice_lectura(shard)
+    filtro = access_key_filter(desde, rucs, ambiente)
+    manifiesto = FileManifest(archivo_estado(MANIFEST_FILE_NAME, shard), read_only=True)
+    pendientes_por_tipo = Counter()
+    try:
+        for origen in origenes:
+            for row in iter_pending_files(
+                origen,
+                index_file_name=indice,
+                manifest=manifiesto,
+                full_scan=escaneo_completo,
+                include_archives=True,
+                shard=shard,
+                record_filter=filtro,
+            ):
+                # El tipo sale de la claveAcceso del nombre, sin leer el archivo
+                clave = decode_access_key(row.id)
+                tipo = DOC_TYPES.get(clave.doc_type, clave.doc_type) if clave else "desconocido"
+                pendientes_por_tipo[tipo] += 1
+                if listar:
+                    print(row.path)
+    finally:
+        manifiesto.close()
+
+    print("=" * 50)
+    print("Descubrimiento (dry-run):")
+    print("=" * 50)
+    print(f"Orígenes                                     : {list(origenes)}")
+    print(f"Documentos pendientes                        : {sum(pendientes_por_tipo.values())}")
+    print(f"Pendientes por tipo                          : {dict(pendientes_por_tipo)}")
+    print(f"Escaneo incremental (manifiesto)             : {manifiesto.stats}")
+    if shard is not None:
+        print(f"Partición                                    : {shard.index}/{shard.count}")
+    print(f"Tiempo                                       : {time.perf_counter() - inicio:.3f} s")
 
 
 def check_and_install_requirements():
@@ -128,6 +651,260 @@ def check_and_install_requirements():
         sys.exit(1)
 
 
+def _fecha(texto):
+    try:
+        return date.fromisoformat(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida '{texto}': se espera AAAA-MM-DD")
+
+
+def _rucs(texto):
+    return [ruc.strip() for ruc in texto.split(",") if ruc.strip()]
+
+
+def _shard(texto):
+    try:
+        return Shard.parse(texto)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _origenes_entorno():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return [origen for origen in os.getenv(ORIGEN_XML_ENV, "").split(os.pathsep) if origen]
+
+
+def parse_args(argv=None):
+    """
+    Argumentos de línea de comandos del pipeline.
+
+    Comandos: run (ingesta; el predeterminado, así que `main.py --workers 4`
+    sigue funcionando), status (estado desde los archivos de estado) y dry-run
+    (sólo el descubrimiento de los pendientes).
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] not in COMANDOS + ("-h", "--help"):
+        argv = ["run"] + argv
+
+    # Opciones compartidas por los comandos
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument(
+        "--shard",
+        type=_shard,
+        help="Procesar sólo la partición k de N (k/N) con sus propios índices, p. ej. 2/4",
+    )
+    descubrimiento = argparse.ArgumentParser(add_help=False)
+    descubrimiento.add_argument(
+        "--origen",
+        action="append",
+        help=(
+            "Directorio donde buscar los XML (se puede repetir; "
+            f"por defecto {ORIGEN_XML_ENV} del entorno o del .env, separados por '{os.pathsep}')"
+        ),
+    )
+    descubrimiento.add_argument(
+        "--escaneo-completo",
+        action="store_true",
+        help="Listar todos los directorios, no sólo los que cambiaron desde el último escaneo",
+    )
+    descubrimiento.add_argument(
+        "--since",
+        type=_fecha,
+        help="Sólo documentos emitidos desde esta fecha (AAAA-MM-DD, según la claveAcceso)",
+    )
+    descubrimiento.add_argument(
+        "--ruc",
+        action="extend",
+        type=_rucs,
+        help="Sólo documentos de este RUC emisor (se puede repetir o separar por comas)",
+    )
+    descubrimiento.add_argument(
+        "--ambiente",
+        choices=[ENVIRONMENT_TEST, ENVIRONMENT_PRODUCTION],
+        help="Sólo documentos de este ambiente (1 = pruebas, 2 = producción)",
+    )
+
+    principal = argparse.ArgumentParser(description="Pipeline ETL de facturas electrónicas")
+    comandos = principal.add_subparsers(dest="comando", metavar="{run,status,dry-run}")
+    parser = comandos.add_parser(
+        "run", parents=[comunes, descubrimiento], help="Ingerir los documentos pendientes"
+    )
+    comandos.add_parser(
+        "status",
+        parents=[comunes],
+        help="Procesados, pendientes y fallidos según los archivos de estado",
+    )
+    simulacion = comandos.add_parser(
+        "dry-run",
+        parents=[comunes, descubrimiento],
+        help="Sólo descubrir los documentos pendientes, sin leerlos ni guardar nada",
+    )
+    simulacion.add_argument(
+        "--listar", action="store_true", help="Imprimir la ruta de cada documento pendiente"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Procesos para extraer y transformar los XML (1 = serial)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=16,
+        help="Documentos enviados a cada trabajador por tarea",
+    )
+    parser.add_argument(
+        "--tasa-validacion",
+        type=float,
+        default=1.0,
+        help="Fracción de documentos validados por completo con el XSD (1 = todos)",
+    )
+    parser.add_argument(
+        "--umbral-streaming",
+        type=int,
+        help=(
+            "Bytes del comprobante desde los que se decodifica detalle por detalle "
+            "(0 = nunca, por defecto 1 MiB)"
+        ),
+    )
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="Nivel del log de transacciones (DEBUG incluye el detalle por documento)",
+    )
+    parser.add_argument(
+        "--intervalo-metricas",
+        type=float,
+        default=30.0,
+        help="Segundos entre resúmenes periódicos de métricas",
+    )
+    parser.add_argument("--metricas-json", help="Archivo JSON con las métricas del pipeline")
+    parser.add_argument(
+        "--metricas-prometheus", help="Archivo de texto Prometheus con las métricas del pipeline"
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=64,
+        help="Archivos leídos por anticipado por el hilo lector (0 = sin lectura anticipada)",
+    )
+    parser.add_argument(
+        "--cola-escritura",
+        type=int,
+        default=1000,
+        help="Documentos en espera de escritura en MongoDB antes de frenar el pipeline",
+    )
+    parser.add_argument(
+        "--sin-deduplicacion",
+        action="store_true",
+        help="No omitir los documentos cuyo contenido o claveAcceso ya fue ingerido",
+    )
+    parser.add_argument(
+        "--sink",
+        choices=["mongo", "parquet", "ambos"],
+        default="mongo",
+        help="Destino de los documentos transformados",
+    )
+    parser.add_argument(
+        "--parquet-dir",
+        help="Directorio del dataset Parquet (por defecto PARQUET_DIR o data/parquet)",
+    )
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Reprocesar sólo los documentos del registro de fallos (log/failures.jsonl)",
+    )
+    parser.add_argument(
+        "--etapa-fallidos",
+        choices=["lectura", "parseo", "validacion", "transformacion", "escritura"],
+        help="Con --retry-failed, reprocesar sólo los fallos de esta etapa",
+    )
+    modo.add_argument(
+        "--retransform",
+        action="store_true",
+        help="Transformar y escribir de nuevo los documentos de la caché de decodificados",
+    )
+    parser.add_argument(
+        "--cache-decodificados",
+        action="store_true",
+        help="Guardar la salida de la validación XSD en la caché de decodificados",
+    )
+    parser.add_argument(
+        "--verificar-fuentes",
+        action="store_true",
+        help="Con --retransform, releer los XML para procesar desde el XML los que cambiaron",
+    )
+    parser.add_argument(
+        "--reconstruir-rollups",
+        action="store_true",
+        help="Recalcular los rollups de MongoDB desde la colección de facturas y salir",
+    )
+
+    args = principal.parse_args(argv)
+    if args.comando == "status":
+        return args
+    args.origen = args.origen or _origenes_entorno()
+    escanea = args.comando == "dry-run" or not (
+        args.retry_failed or args.retransform or args.reconstruir_rollups
+    )
+    if escanea and not args.origen:
+        principal.error(f"indicar los directorios de origen con --origen o {ORIGEN_XML_ENV}")
+    return args
+
+
 if __name__ == "__main__":
     # check_and_install_requirements()
-    main()
+    args = parse_args()
+    if args.comando == "status":
+        estado(args.shard)
+        sys.exit(0)
+    if args.comando == "dry-run":
+        simular(
+            args.origen,
+            escaneo_completo=args.escaneo_completo,
+            desde=args.since,
+            rucs=args.ruc,
+            ambiente=args.ambiente,
+            shard=args.shard,
+            listar=args.listar,
+        )
+        sys.exit(0)
+    if args.reconstruir_rollups:
+        from src.utils.mongo_rollups import reconstruir_rollups
+        from src.utils.mongo_store import get_mongo_collection
+
+        for rollup, grupos in reconstruir_rollups(get_mongo_collection()).items():
+            print(f"Rollup {rollup:<32}: {grupos} grupos")
+        sys.exit(0)
+    main(
+        origenes=args.origen,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        tasa_validacion=args.tasa_validacion,
+        umbral_streaming=args.umbral_streaming,
+        log_level=args.log_level,
+        intervalo_metricas=args.intervalo_metricas,
+        metricas_json=args.metricas_json,
+        metricas_prometheus=args.metricas_prometheus,
+        prefetch=args.prefetch,
+        cola_escritura=args.cola_escritura,
+        deduplicar=not args.sin_deduplicacion,
+        sink=args.sink,
+        parquet_dir=args.parquet_dir,
+        escaneo_completo=args.escaneo_completo,
+        reintentar_fallidos=args.retry_failed,
+        etapa_fallidos=args.etapa_fallidos,
+        desde=args.since,
+        rucs=args.ruc,
+        ambiente=args.ambiente,
+        shard=args.shard,
+        cache_decodificados=args.cache_decodificados,
+        retransformar=args.retransform,
+        verificar_fuentes=args.verificar_fuentes,
+    )
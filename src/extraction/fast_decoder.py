@@ -0,0 +1,202 @@
+import xml.etree.ElementTree as ET
+
+from xmlschema.validators import XsdAtomicBuiltin
+
+_ENTEROS = {
+    "integer", "int", "long", "short", "byte",
+    "nonNegativeInteger", "positiveInteger", "nonPositiveInteger", "negativeInteger",
+    "unsignedLong", "unsignedInt", "unsignedShort", "unsignedByte",
+}
+
+
+class ErrorDecodificacion(ValueError):
+    """El documento no se ajusta al plan compilado desde el XSD."""
+
+
+def _texto(texto):
+    return texto
+
+
+def _decimal(texto):
+    if texto is None:
+        raise ErrorDecodificacion("Valor decimal vacío")
+    return float(texto)
+
+
+def _entero(texto):
+    if texto is None:
+        raise ErrorDecodificacion("Valor entero vacío")
+    return int(texto)
+
+
+def _booleano(texto):
+    valor = (texto or "").strip()
+    if valor in ("true", "1"):
+        return True
+    if valor in ("false", "0"):
+        return False
+    raise ErrorDecodificacion(f"Valor booleano inválido: {texto!r}")
+
+
+def _conversor(xsd_type):
+    """Retorna la función que convierte el texto de un tipo simple a Python."""
+    builtin = xsd_type
+    while builtin is not None and not isinstance(builtin, XsdAtomicBuiltin):
+        builtin = getattr(builtin, "base_type", None)
+    nombre = builtin.local_name if builtin is not None else "string"
+    if nombre == "decimal":
+        return _decimal
+    if nombre in _ENTEROS:
+        return _entero
+    if nombre == "boolean":
+        return _booleano
+    return _texto
+
+
+class PlanElemento:
+    """
+    Plan precomputado para decodificar un elemento del XSD.
+
+    Guarda el nombre, la conversión del contenido simple, los atributos y,
+    para tipos complejos, los hijos permitidos con su cardinalidad.
+    """
+
+    __slots__ = ("nombre", "convertir", "atributos", "atributos_requeridos", "hijos", "requeridos")
+
+    def __init__(self, xsd_element, planes):
+        planes[id(xsd_element)] = self
+        xsd_type = xsd_element.type
+        self.nombre = xsd_element.local_name
+        self.atributos = {
+            nombre: _conversor(atributo.type)
+            for nombre, atributo in xsd_element.attributes.items()
+            if nombre is not None
+        }
+        self.atributos_requeridos = frozenset(
+            nombre
+            for nombre, atributo in xsd_element.attributes.items()
+            if nombre is not None and atributo.use == "required"
+        )
+
+        grupo = getattr(xsd_type, "model_group", None)
+        if grupo is None:
+            # Contenido simple (con o sin atributos) o vacío
+            contenido = xsd_type if xsd_type.is_simple() else xsd_type.content
+            self.convertir = _conversor(contenido) if contenido is not None else _texto
+            self.hijos = None
+            self.requeridos = frozenset()
+            return
+
+        self.convertir = None
+        grupo_simple = grupo.is_single()
+        self.hijos = {}
+        requeridos = set()
+        for hijo in grupo.iter_elements():
+            if hijo.name.startswith("{"):
+                # Elementos de otros espacios de nombres (ds:Signature) se
+                # retiran antes de decodificar; si aparecen, se usa xmlschema.
+                continue
+            plan_hijo = planes.get(id(hijo)) or PlanElemento(hijo, planes)
+            es_lista = not (grupo_simple and hijo.is_single())
+            self.hijos[hijo.name] = (plan_hijo, es_lista)
+            if hijo.min_occurs > 0:
+                requeridos.add(hijo.name)
+        self.requeridos = frozenset(requeridos)
+
+
+def _decodificar(elemento, plan):
+    atributos = elemento.attrib
+    resultado = {}
+    if atributos or plan.atributos_requeridos:
+        for nombre, valor in atributos.items():
+            convertir = plan.atributos.get(nombre)
+            if convertir is None:
+                raise ErrorDecodificacion(f"Atributo no esperado '{nombre}' en <{plan.nombre}>")
+            resultado[nombre] = convertir(valor)
+        if not plan.atributos_requeridos.issubset(atributos):
+            raise ErrorDecodificacion(f"Faltan atributos requeridos en <{plan.nombre}>")
+
+    if plan.hijos is None:
+        valor = plan.convertir(elemento.text)
+        if not resultado:
+            return valor
+        resultado["value"] = valor
+        return resultado
+
+    hijos = plan.hijos
+    for hijo in elemento:
+        entrada = hijos.get(hijo.tag)
+        if entrada is None:
+            raise ErrorDecodificacion(f"Elemento no esperado <{hijo.tag}> en <{plan.nombre}>")
+        plan_hijo, es_lista = entrada
+        valor = _decodificar(hijo, plan_hijo)
+        nombre = plan_hijo.nombre
+        if es_lista:
+            lista = resultado.get(nombre)
+            if lista is None:
+                resultado[nombre] = [valor]
+            else:
+                lista.append(valor)
+        elif nombre in resultado:
+            raise ErrorDecodificacion(f"Elemento <{nombre}> repetido en <{plan.nombre}>")
+        else:
+            resultado[nombre] = valor
+
+    if plan.requeridos and not plan.requeridos.issubset(resultado):
+        faltantes = ", ".join(sorted(plan.requeridos.difference(resultado)))
+        raise ErrorDecodificacion(f"Faltan elementos requeridos en <{plan.nombre}>: {faltantes}")
+    return resultado or None
+
+
+class DecodificadorRapido:
+    """
+    Decodificador de facturas compilado desde un esquema XSD.
+
+    Convierte un elemento <factura> de ElementTree directamente al diccionario
+    que produce validar_y_convertir_a_json, verificando sólo la estructura
+    (elementos permitidos, obligatorios y cardinalidad) y los tipos numéricos.
+    Patrones, enumeraciones y longitudes no se validan: para eso se usa la
+    validación completa con xmlschema.
+    """
+
+    def __init__(self, schema, nombre_raiz="factura"):
+        """
+        Args:
+            schema (xmlschema.XMLSchema): Esquema compilado de la versión.
+            nombre_raiz (str): Elemento raíz del documento.
+        """
+        self.plan = PlanElemento(schema.elements[nombre_raiz], {})
+
+    def decodificar_elemento(self, elemento: ET.Element, *ruta) -> dict:
+        """
+        Decodifica un elemento ubicado en `ruta` bajo la raíz, p. ej.
+        ('detalles', 'detalle') para un detalle suelto; sin ruta, la raíz.
+
+        Raises:
+            ErrorDecodificacion: Si el elemento no se ajusta al plan.
+        """
+        plan = self.plan
+        for nombre in ruta:
+            entrada = (plan.hijos or {}).get(nombre)
+            if entrada is None:
+                raise ErrorDecodificacion(f"<{nombre}> no existe en <{plan.nombre}>")
+            plan = entrada[0]
+        if elemento.tag != plan.nombre:
+            raise ErrorDecodificacion(
+                f"Se esperaba <{plan.nombre}>" + ("" if ruta else " como raíz")
+            )
+        try:
+            return _decodificar(elemento, plan)
+        except (TypeError, ValueError) as e:
+            if isinstance(e, ErrorDecodificacion):
+                raise
+            raise ErrorDecodificacion(str(e)) from e
+
+    def decodificar(self, root: ET.Element) -> dict:
+        """
+        Decodifica el elemento raíz.
+
+        Raises:
+            ErrorDecodificacion: Si el documento no se ajusta al plan.
+        """
+        return self.decodificar_elemento(root)
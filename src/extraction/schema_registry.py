@@ -0,0 +1,204 @@
+import hashlib
+import os
+import pickle
+import threading
+import xmlschema
+
+from pathlib import Path
+
+from .fast_decoder import DecodificadorRapido
+
+XSD_FACTURA_PATH = Path(__file__).resolve().parent.parent / "xsd" / "factura"
+CACHE_DIR = "cache/xsd"
+
+
+class RegistroEsquemas:
+    """
+    Registro de esquemas XSD compilados, uno por versión de factura.
+
+    Cada versión se compila una sola vez por proceso. Opcionalmente el esquema
+    compilado se serializa en disco (pickle) para que otros procesos arranquen
+    con el esquema ya construido.
+    """
+
+    def __init__(self, base_xsd_path=XSD_FACTURA_PATH, prefijo="factura", cache_dir=None):
+        """
+        Args:
+            base_xsd_path (str): Directorio que contiene los archivos XSD.
+            prefijo (str): Prefijo del nombre de archivo (facturaV<version>.xsd).
+            cache_dir (str): Directorio para persistir los esquemas compilados.
+                Si es None no se usa caché en disco.
+        """
+        self.base_xsd_path = Path(base_xsd_path)
+        self.prefijo = prefijo
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._esquemas = {}
+        self._decodificadores = {}
+        self._elementos = {}
+        self._huellas = {}
+        self._lock = threading.Lock()
+
+    def ruta_xsd(self, version: str) -> Path:
+        """Retorna la ruta del XSD de una versión."""
+        return self.base_xsd_path / f"{self.prefijo}V{version}.xsd"
+
+    def versiones_disponibles(self) -> list:
+        """Lista las versiones con XSD disponible en el directorio base."""
+        inicio = f"{self.prefijo}V"
+        return sorted(
+            p.stem[len(inicio):]
+            for p in self.base_xsd_path.glob(f"{inicio}*.xsd")
+        )
+
+    def obtener(self, version: str) -> xmlschema.XMLSchema:
+        """
+        Retorna el esquema compilado de una versión, compilándolo sólo la primera vez.
+
+        Raises:
+            FileNotFoundError: Si no existe el XSD de la versión.
+        """
+        schema = self._esquemas.get(version)
+        if schema is not None:
+            self.hits += 1
+            return schema
+
+        with self._lock:
+            schema = self._esquemas.get(version)
+            if schema is not None:
+                self.hits += 1
+                return schema
+            self.misses += 1
+            schema = self._cargar(version)
+            self._esquemas[version] = schema
+            return schema
+
+    def obtener_decodificador(self, version: str) -> DecodificadorRapido:
+        """
+        Retorna el decodificador rápido compilado desde el XSD de una versión.
+
+        Raises:
+            FileNotFoundError: Si no existe el XSD de la versión.
+        """
+        decodificador = self._decodificadores.get(version)
+        if decodificador is None:
+            decodificador = DecodificadorRapido(self.obtener(version), self.prefijo)
+            self._decodificadores[version] = decodificador
+        return decodificador
+
+    def obtener_elemento(self, version: str, ruta: str):
+        """
+        Retorna la declaración XSD de un elemento de una versión, p. ej.
+        'factura/detalles/detalle'.
+
+        Raises:
+            FileNotFoundError: Si no existe el XSD de la versión.
+            KeyError: Si la ruta no existe en el esquema.
+        """
+        elemento = self._elementos.get((version, ruta))
+        if elemento is None:
+            elemento = self.obtener(version).find(ruta)
+            if elemento is None:
+                raise KeyError(f"El esquema {version} no declara {ruta}")
+            self._elementos[(version, ruta)] = elemento
+        return elemento
+
+    def huella(self, version: str) -> str:
+        """
+        Huella del contenido del XSD de una versión y de la versión de xmlschema.
+
+        Cambia si cambia la salida de la decodificación, así que sirve para
+        invalidar lo que se guardó decodificado con el esquema anterior.
+
+        Raises:
+            FileNotFoundError: Si no existe el XSD de la versión.
+        """
+        huella = self._huellas.get(version)
+        if huella is None:
+            contenido = self.ruta_xsd(version).read_bytes()
+            digest = hashlib.blake2b(contenido, digest_size=16).hexdigest()
+            huella = self._huellas[version] = f"{xmlschema.__version__}-{digest}"
+        return huella
+
+    def precargar(self, versiones=None, cache_dir=None):
+        """
+        Compila de antemano los esquemas indicados (por defecto todos los disponibles).
+
+        Args:
+            versiones (list): Versiones a precargar.
+            cache_dir (str): Directorio de caché en disco a utilizar desde ahora.
+        """
+        if cache_dir is not None:
+            self.cache_dir = cache_dir
+        for version in versiones or self.versiones_disponibles():
+            if version not in self._esquemas:
+                with self._lock:
+                    if version not in self._esquemas:
+                        self.misses += 1
+                        self._esquemas[version] = self._cargar(version)
+        return self
+
+    def estadisticas(self) -> dict:
+        """Retorna los contadores de aciertos y fallos de la caché."""
+        return {
+            "versiones": sorted(self._esquemas),
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+        }
+
+    def _cargar(self, version: str) -> xmlschema.XMLSchema:
+        """Carga el esquema desde la caché en disco o compilando el XSD."""
+        xsd_path = self.ruta_xsd(version)
+        if not xsd_path.exists():
+            raise FileNotFoundError(
+                f"No se encontró el archivo XSD para la versión {version}: {xsd_path}"
+            )
+
+        firma = self._firma(xsd_path)
+        cache_path = self._ruta_cache(version)
+        if cache_path is not None and cache_path.exists():
+            try:
+                with open(cache_path, "rb") as f:
+                    firma_cache, schema = pickle.load(f)
+                if firma_cache == firma:
+                    self.disk_hits += 1
+                    return schema
+            except Exception:
+                # Caché corrupta o de otra versión de xmlschema: se recompila
+                pass
+
+        schema = xmlschema.XMLSchema(xsd_path)
+
+        if cache_path is not None:
+            os.makedirs(cache_path.parent, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump((firma, schema), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        return schema
+
+    def _ruta_cache(self, version: str):
+        if self.cache_dir is None:
+            return None
+        return Path(self.cache_dir) / f"{self.prefijo}V{version}.pickle"
+
+    @staticmethod
+    def _firma(xsd_path: Path) -> tuple:
+        """Firma del XSD usada para invalidar la caché en disco."""
+        stat = xsd_path.stat()
+        return (xmlschema.__version__, stat.st_size, stat.st_mtime_ns)
+
+
+_registros = {}
+
+
+def obtener_registro(base_xsd_path=XSD_FACTURA_PATH) -> RegistroEsquemas:
+    """Retorna el registro de esquemas del proceso para un directorio de XSD."""
+    key = str(Path(base_xsd_path).resolve())
+    registro = _registros.get(key)
+    if registro is None:
+        registro = _registros.setdefault(key, RegistroEsquemas(base_xsd_path))
+    return registro
@@ -1,11 +1,44 @@
 import xml.etree.ElementTree as ET
-import xmlschema
+import io
 import json
-import re
+import mmap
 import os
+import random
+import re
 
 from decimal import Decimal
-from pathlib import Path
+
+from ..utils.clave_acceso import DOC_TYPES
+from .fast_decoder import ErrorDecodificacion
+from .schema_registry import XSD_FACTURA_PATH, obtener_registro
+
+# Archivos desde este tamaño se leen con mmap en lugar de copiarlos a memoria
+MMAP_THRESHOLD = 1024 * 1024
+# Comprobantes desde este tamaño se decodifican por partes (ver parsear_por_partes)
+UMBRAL_STREAMING = 1024 * 1024
+
+_TAG_INICIO = b"<comprobante>"
+_TAG_FIN = b"</comprobante>"
+_CDATA_INICIO = b"<![CDATA["
+_CDATA_FIN = b"]]>"
+_ESPACIOS = b" \t\r\n"
+_FIRMA = "{http://www.w3.org/2000/09/xmldsig#}Signature"
+_ENTIDADES = {b"lt": b"<", b"gt": b">", b"amp": b"&", b"quot": b'"', b"apos": b"'"}
+# Opciones de xmlschema equivalentes a aplicar clean_keys sobre to_dict
+OPCIONES_DECODIFICACION = {"attr_prefix": "", "text_key": "value", "decimal_type": float}
+
+# Modos de validación de un documento: completa (xmlschema), rápida
+# (decodificador compilado) o respaldo (el decodificador rápido no pudo
+# procesar el XML y se validó por completo)
+VALIDACION_COMPLETA = "completa"
+VALIDACION_RAPIDA = "rapida"
+VALIDACION_RESPALDO = "respaldo"
+
+# codDoc según el tag raíz del comprobante
+_TIPOS_POR_RAIZ = {raiz.encode(): cod_doc for cod_doc, raiz in DOC_TYPES.items()}
+_PATRON_RAIZ = re.compile(rb"<([A-Za-z_][\w.-]*)")
+
+_PATRON_ENTIDAD = re.compile(rb"&(lt|gt|amp|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);")
 
 
 def leer_contenido_xml(path_xml: str) -> str:
@@ -37,23 +70,122 @@ def clean_keys(data):
 
 def extraer_comprobante_xml(contenido_xml: str) -> str:
     """Extrae y decodifica el XML contenido en el tag <comprobante>."""
-    match = re.search(
-        r"<comprobante>(<!\[CDATA\[)?(.*?)(\]\]>)?</comprobante>",
-        contenido_xml,
-        re.DOTALL,
-    )
-    if not match:
+    return extraer_comprobante_bytes(contenido_xml.encode("utf-8")).decode("utf-8")
+
+
+def _reemplazar_entidad(match) -> bytes:
+    nombre = match.group(1)
+    if nombre.startswith(b"#x"):
+        return chr(int(nombre[2:], 16)).encode("utf-8")
+    if nombre.startswith(b"#"):
+        return chr(int(nombre[1:])).encode("utf-8")
+    return _ENTIDADES[nombre]
+
+
+def extraer_comprobante_bytes(contenido_xml) -> bytes:
+    """
+    Extrae el XML del tag <comprobante> trabajando directamente sobre bytes.
+
+    Ubica el tag con búsquedas de subcadenas (sin expresiones regulares sobre
+    todo el documento), descarta el bloque CDATA si existe y, cuando el
+    contenido viene escapado, decodifica las entidades en una sola pasada.
+
+    Args:
+        contenido_xml (bytes | mmap.mmap): Contenido del archivo de autorización.
+
+    Returns:
+        bytes: XML interno del comprobante, listo para el parser.
+    """
+    inicio = contenido_xml.find(_TAG_INICIO)
+    if inicio < 0:
+        raise ValueError("No se encontró el contenido del tag <comprobante>")
+    inicio += len(_TAG_INICIO)
+    fin = contenido_xml.find(_TAG_FIN, inicio)
+    if fin < 0:
         raise ValueError("No se encontró el contenido del tag <comprobante>")
 
-    comprobante = match.group(2).replace("&lt;", "<").replace("&gt;", ">").strip()
+    # Recortar espacios por índice para no copiar el contenido
+    while inicio < fin and contenido_xml[inicio] in _ESPACIOS:
+        inicio += 1
+    while fin > inicio and contenido_xml[fin - 1] in _ESPACIOS:
+        fin -= 1
+
+    es_cdata = contenido_xml[inicio:inicio + len(_CDATA_INICIO)] == _CDATA_INICIO
+    if es_cdata:
+        inicio += len(_CDATA_INICIO)
+        if contenido_xml[fin - len(_CDATA_FIN):fin] == _CDATA_FIN:
+            fin -= len(_CDATA_FIN)
+        while inicio < fin and contenido_xml[inicio] in _ESPACIOS:
+            inicio += 1
+        while fin > inicio and contenido_xml[fin - 1] in _ESPACIOS:
+            fin -= 1
+
+    comprobante = contenido_xml[inicio:fin]
+    if not es_cdata and b"&" in comprobante:
+        comprobante = _PATRON_ENTIDAD.sub(_reemplazar_entidad, comprobante)
     return comprobante
 
 
-def obtener_version_factura(comprobante_xml: str) -> str:
+def leer_comprobante_xml(path_xml: str) -> bytes:
+    """
+    Lee un archivo de autorización y retorna el XML del comprobante en bytes.
+
+    Los archivos grandes se mapean en memoria (mmap), de modo que sólo se
+    copia la sección del comprobante.
+    """
+    with open(path_xml, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            return extraer_comprobante_bytes(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contenido:
+            return extraer_comprobante_bytes(contenido)
+
+
+def extraer_clave_acceso(comprobante_xml: bytes):
+    """
+    Obtiene la claveAcceso del comprobante sin parsear el XML.
+
+    Returns:
+        str | None: La clave de acceso, o None si el tag no existe.
+    """
+    inicio = comprobante_xml.find(b"<claveAcceso>")
+    if inicio < 0:
+        return None
+    inicio += len(b"<claveAcceso>")
+    fin = comprobante_xml.find(b"</claveAcceso>", inicio)
+    if fin < 0:
+        return None
+    return comprobante_xml[inicio:fin].strip().decode("ascii", "replace")
+
+
+def tipo_comprobante(comprobante_xml):
+    """
+    Obtiene el tipo de comprobante (codDoc) por su tag raíz sin parsear el XML.
+
+    Sólo se examinan los primeros bytes: la declaración XML y los comentarios
+    iniciales se saltan hasta el primer elemento.
+
+    Returns:
+        str | None: codDoc ('01' factura, '04' nota de crédito, ...), o None si
+            el tag raíz no es un tipo de comprobante conocido.
+    """
+    inicio = 0
+    while True:
+        inicio = comprobante_xml.find(b"<", inicio)
+        if inicio < 0:
+            return None
+        if comprobante_xml[inicio + 1:inicio + 2] not in (b"?", b"!"):
+            break
+        inicio += 1
+    raiz = _PATRON_RAIZ.match(comprobante_xml[inicio:inicio + 64])
+    return _TIPOS_POR_RAIZ.get(raiz.group(1)) if raiz else None
+
+
+def obtener_version_factura(comprobante_xml) -> str:
     """Parses el XML del comprobante y obtiene la versión del tag <factura>."""
     root = ET.fromstring(comprobante_xml)
     # ds:Signature
-    root.remove(root.find("{http://www.w3.org/2000/09/xmldsig#}Signature"))
+    root.remove(root.find(_FIRMA))
     if root.tag != "factura":
         raise ValueError("El contenido no contiene un tag <factura> como raíz")
 
@@ -64,36 +196,155 @@ def obtener_version_factura(comprobante_xml: str) -> str:
     return version, root
 
 
+def parsear_por_partes(comprobante_xml, procesar_detalle):
+    """
+    Parsea el comprobante con iterparse entregando cada <detalle> al cerrarse.
+
+    Cada detalle, salvo el primero, se pasa a `procesar_detalle(version,
+    elemento)` y se retira del árbol, así que el árbol en memoria queda acotado
+    a la cabecera y a una línea sin importar cuántos detalles tenga la factura.
+    El primer detalle se conserva para que el árbol resultante siga siendo una
+    factura válida contra el XSD.
+
+    Args:
+        comprobante_xml (bytes): XML del <comprobante>.
+        procesar_detalle (callable): Recibe la versión y el elemento <detalle>.
+
+    Returns:
+        tuple: (versión, raíz <factura> sin la firma y con sólo el primer detalle).
+    """
+    ruta = []
+    root = detalles = version = None
+    firma = primero = False
+    for evento, elemento in ET.iterparse(io.BytesIO(comprobante_xml), events=("start", "end")):
+        if evento == "start":
+            ruta.append(elemento.tag)
+            if root is None:
+                if elemento.tag != "factura":
+                    raise ValueError("El contenido no contiene un tag <factura> como raíz")
+                version = elemento.attrib.get("version")
+                if not version:
+                    raise ValueError("No se encontró el atributo 'version' en el tag <factura>")
+                root = elemento
+            elif len(ruta) == 2 and elemento.tag == "detalles":
+                detalles = elemento
+            continue
+
+        ruta.pop()
+        if len(ruta) == 2 and elemento.tag == "detalle" and ruta[1] == "detalles":
+            if primero:
+                procesar_detalle(version, elemento)
+                # Es el segundo hijo (el parser puede haber abierto ya los siguientes)
+                detalles.remove(elemento)
+            primero = True
+        elif len(ruta) == 1 and elemento.tag == _FIRMA:
+            root.remove(elemento)
+            firma = True
+
+    if not firma:
+        raise ValueError("No se encontró la firma <ds:Signature> en la factura")
+    return version, root
+
+
+def validacion_completa(tasa_validacion: float) -> bool:
+    """Decide si un documento se valida por completo con xmlschema (ver validar_y_convertir_a_json)."""
+    return tasa_validacion >= 1.0 or random.random() < tasa_validacion
+
+
+def decodificar_detalle(
+    elemento: ET.Element, version: str, base_xsd_path: str = "xsd", completa: bool = True,
+    modos=None,
+) -> dict:
+    """
+    Valida y convierte un elemento <detalle> suelto (ver parsear_por_partes).
+
+    Produce el mismo diccionario que el detalle dentro de validar_y_convertir_a_json.
+
+    Args:
+        elemento (ET.Element): Elemento <detalle>.
+        version (str): Versión de la factura.
+        base_xsd_path (str): Directorio de los XSD.
+        completa (bool): Validar con xmlschema; si es False se usa el
+            decodificador rápido (y xmlschema sólo si éste falla).
+        modos (Counter): Contador donde se suma el modo de validación usado.
+    """
+    registro = obtener_registro(base_xsd_path)
+    modo = VALIDACION_COMPLETA
+    if not completa:
+        try:
+            data_dict = registro.obtener_decodificador(version).decodificar_elemento(
+                elemento, "detalles", "detalle"
+            )
+            if modos is not None:
+                modos[VALIDACION_RAPIDA] += 1
+            return data_dict
+        except ErrorDecodificacion:
+            modo = VALIDACION_RESPALDO
+    if modos is not None:
+        modos[modo] += 1
+
+    xsd_detalle = registro.obtener_elemento(version, "factura/detalles/detalle")
+    data_dict, errores = xsd_detalle.decode(elemento, validation="lax", **OPCIONES_DECODIFICACION)
+    if errores:
+        raise ValueError(f"El XML no es válido contra el XSD: {errores[0].reason}")
+    return data_dict
+
+
 def validar_y_convertir_a_json(
-    root: ET.Element, version: str, base_xsd_path: str = "xsd"
+    root: ET.Element, version: str, base_xsd_path: str = "xsd", tasa_validacion: float = 1.0,
+    modos=None,
 ) -> str:
-    """Valida el XML contra el XSD y lo convierte a JSON."""
+    """
+    Valida el XML contra el XSD y lo convierte a JSON.
 
-    xsd_path = Path(os.path.join(base_xsd_path, f"facturaV{version}.xsd"))
+    Con tasa_validacion < 1 sólo esa fracción de documentos (elegida al azar)
+    se valida por completo con xmlschema; el resto se convierte con el
+    decodificador rápido compilado desde el XSD, que verifica la estructura
+    pero no patrones ni enumeraciones. Si el decodificador rápido falla, el
+    documento se valida por completo. El modo usado se suma en `modos` (un
+    Counter), para reportarlo por documento.
+    """
+    registro = obtener_registro(base_xsd_path)
+    modo = VALIDACION_COMPLETA
 
-    if not xsd_path.exists():
-        raise FileNotFoundError(
-            f"No se encontró el archivo XSD para la versión {version}: {xsd_path}"
-        )
+    if not validacion_completa(tasa_validacion):
+        try:
+            data_dict = registro.obtener_decodificador(version).decodificar(root)
+            if modos is not None:
+                modos[VALIDACION_RAPIDA] += 1
+            return data_dict
+        except ErrorDecodificacion:
+            modo = VALIDACION_RESPALDO
 
-    schema = xmlschema.XMLSchema(xsd_path)
+    # El esquema compilado se reutiliza entre documentos de la misma versión
+    schema = registro.obtener(version)
+    if modos is not None:
+        modos[modo] += 1
 
-    if not schema.is_valid(root):
-        raise ValueError("El XML no es válido contra el XSD")
+    # Una sola pasada: la decodificación 'lax' valida y acumula los errores,
+    # y las opciones del convertidor producen directamente las claves limpias
+    # (sin '@', '$' -> 'value') y los decimales como float, igual que clean_keys.
+    data_dict, errores = schema.to_dict(root, validation="lax", **OPCIONES_DECODIFICACION)
+    if errores:
+        raise ValueError(f"El XML no es válido contra el XSD: {errores[0].reason}")
 
-    data_dict = schema.to_dict(root) 
     # value = json.dumps(cleaned_data, indent=2, ensure_ascii=False)
     # return json.dumps(data_dict, indent=2, ensure_ascii=False)
-    return clean_keys(data_dict)
+    return data_dict
+
 
+def procesar_factura_desde_archivo(path_xml: str, tasa_validacion: float = 1.0) -> str:
+    """
+    Función principal para procesar un archivo XML y devolver su contenido en JSON.
 
-def procesar_factura_desde_archivo(path_xml: str) -> str:
-    """Función principal para procesar un archivo XML y devolver su contenido en JSON."""
+    Args:
+        path_xml (str): Ruta del archivo de autorización.
+        tasa_validacion (float): Fracción de documentos validados por completo
+            con xmlschema (ver validar_y_convertir_a_json).
+    """
 
-    root_path = os.getcwd()
-    base_xsd_path = os.path.join(root_path, "src/XSD/factura/")
+    base_xsd_path = XSD_FACTURA_PATH
 
-    contenido_xml = leer_contenido_xml(path_xml)
-    comprobante_xml = extraer_comprobante_xml(contenido_xml)
+    comprobante_xml = leer_comprobante_xml(path_xml)
     version, root = obtener_version_factura(comprobante_xml)
-    return validar_y_convertir_a_json(root, version, base_xsd_path)
+    return validar_y_convertir_a_json(root, version, base_xsd_path, tasa_validacion)
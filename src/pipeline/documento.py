@@ -0,0 +1,427 @@
+import time
+from collections import Counter
+
+import bson
+
+from ..extraction.schema_registry import XSD_FACTURA_PATH, obtener_registro
+from ..extraction.xml_parse import (
+    UMBRAL_STREAMING,
+    VALIDACION_COMPLETA,
+    VALIDACION_RAPIDA,
+    VALIDACION_RESPALDO,
+    decodificar_detalle,
+    extraer_comprobante_bytes,
+    leer_comprobante_xml,
+    obtener_version_factura,
+    parsear_por_partes,
+    tipo_comprobante,
+    validacion_completa,
+    validar_y_convertir_a_json,
+)
+from ..transformation.factura_transformer import transformar_detalle, transformar_factura
+from ..utils.clave_acceso import DOC_TYPE_INVOICE, DOC_TYPES, decode_access_key
+from ..utils.dedupe import fingerprint
+
+
+# Opciones de procesamiento del proceso actual (ver configurar)
+OPCIONES = {
+    # Fracción de documentos validados por completo con xmlschema
+    "tasa_validacion": 1.0,
+    # Bytes desde los que un comprobante se decodifica por partes (0 = nunca)
+    "umbral_streaming": UMBRAL_STREAMING,
+    # Entregar también el documento decodificado (BSON) para la caché de decodificados
+    "cachear_decodificados": False,
+}
+
+
+def configurar(**opciones):
+    """
+    Actualiza las opciones de procesamiento del proceso actual.
+
+    Raises:
+        KeyError: Si alguna opción no existe.
+    """
+    for nombre, valor in opciones.items():
+        if nombre not in OPCIONES:
+            raise KeyError(f"Opción de procesamiento desconocida: {nombre}")
+        OPCIONES[nombre] = valor
+
+
+def inicializar_trabajador(cache_dir=None, opciones=None):
+    """
+    Inicializa un proceso trabajador precargando los esquemas XSD.
+
+    Args:
+        cache_dir (str): Directorio de la caché en disco de esquemas compilados.
+        opciones (dict): Opciones de procesamiento (ver configurar).
+    """
+    obtener_registro().precargar(cache_dir=cache_dir)
+    configurar(**(opciones or {}))
+
+
+def _fallo(identifier, etapa, error, tiempos) -> dict:
+    return {
+        "id": identifier,
+        "ok": False,
+        "error": str(error),
+        "error_type": type(error).__name__,
+        "etapa": etapa,
+        "tiempos": tiempos,
+    }
+
+
+def _modo_validacion(modos):
+    """Modo de validación de un documento según el de sus partes (None si no se validó)."""
+    for modo in (VALIDACION_RESPALDO, VALIDACION_COMPLETA, VALIDACION_RAPIDA):
+        if modos[modo]:
+            return modo
+    return None
+
+
+def _con_validacion(resultado, modos) -> dict:
+    modo = _modo_validacion(modos)
+    if modo is not None:
+        resultado["validacion"] = modo
+    return resultado
+
+
+class ComprobanteOmitido(Exception):
+    """El tipo de comprobante (codDoc) no tiene manejador: se omite sin parsearlo."""
+
+    def __init__(self, cod_doc: str):
+        super().__init__(
+            f"Tipo de comprobante sin manejador: {DOC_TYPES.get(cod_doc, 'desconocido')} ({cod_doc})"
+        )
+        self.cod_doc = cod_doc
+
+
+def procesar_comprobante(identifier: str, comprobante_xml, tiempos=None) -> dict:
+    """
+    Clasifica un comprobante ya leído del disco y lo envía a su manejador.
+
+    El tipo (codDoc) se toma del tag raíz, leyendo sólo los primeros bytes; los
+    tipos sin manejador en MANEJADORES se omiten sin parsearlos. Si el tipo no
+    se reconoce, el comprobante se procesa como factura (y falla en el parseo
+    si no lo es).
+
+    Args:
+        identifier (str): Identificador del archivo (claveAcceso).
+        comprobante_xml (bytes): XML del <comprobante> (ver leer_comprobante_xml).
+        tiempos (dict): Tiempos de las etapas previas (p. ej. la lectura).
+
+    Returns:
+        dict: Resultado con las claves 'id', 'ok', 'tiempos' y 'data' o
+            'error', 'error_type' y 'etapa' ('omitido' y 'tipo' para los
+            comprobantes omitidos).
+    """
+    tiempos = {} if tiempos is None else tiempos
+    cod_doc = tipo_comprobante(comprobante_xml)
+    manejador = MANEJADORES.get(cod_doc or DOC_TYPE_INVOICE)
+    if manejador is None:
+        return resultado_omitido(identifier, ComprobanteOmitido(cod_doc), tiempos)
+    return manejador(identifier, comprobante_xml, tiempos)
+
+
+def procesar_factura(identifier: str, comprobante_xml, tiempos=None) -> dict:
+    """
+    Valida y transforma una factura ya leída del disco.
+
+    Args:
+        identifier (str): Identificador del archivo (claveAcceso).
+        comprobante_xml (bytes): XML del <comprobante> (ver leer_comprobante_xml).
+        tiempos (dict): Tiempos de las etapas previas (p. ej. la lectura).
+
+    Returns:
+        dict: Resultado con las claves 'id', 'ok', 'tiempos' y 'data' o
+            'error', 'error_type' y 'etapa', y 'validacion' con el modo de
+            validación (completa, rapida o respaldo) si se llegó a validar. Con
+            la opción cachear_decodificados incluye 'decodificado': (versión,
+            huella de la fuente, documento decodificado en BSON o None si se
+            procesó por partes).
+    """
+    tiempos = {} if tiempos is None else tiempos
+    if 0 < OPCIONES["umbral_streaming"] <= len(comprobante_xml):
+        return _procesar_por_partes(identifier, comprobante_xml, tiempos)
+    reloj = time.perf_counter
+    modos = Counter()
+    etapa, inicio = "parseo", reloj()
+    try:
+        version, root = obtener_version_factura(comprobante_xml)
+        fin = reloj()
+        tiempos["parseo"] = fin - inicio
+
+        etapa, inicio = "validacion", fin
+        factura_data = validar_y_convertir_a_json(
+            root, version, XSD_FACTURA_PATH, OPCIONES["tasa_validacion"], modos
+        )
+        fin = reloj()
+        tiempos["validacion"] = fin - inicio
+
+        decodificado = None
+        if OPCIONES["cachear_decodificados"]:
+            # Se codifica antes de transformar, que puede reutilizar partes del diccionario
+            etapa, inicio = "cache", fin
+            decodificado = (version, fingerprint(comprobante_xml), bson.encode(factura_data))
+            fin = reloj()
+            tiempos["cache"] = fin - inicio
+
+        etapa, inicio = "transformacion", fin
+        transformed_data = transformar_factura(factura_data)
+        tiempos["transformacion"] = reloj() - inicio
+        resultado = {"id": identifier, "ok": True, "data": transformed_data, "tiempos": tiempos}
+        if decodificado is not None:
+            resultado["decodificado"] = decodificado
+        return _con_validacion(resultado, modos)
+    except Exception as e:
+        tiempos[etapa] = reloj() - inicio
+        return _con_validacion(_fallo(identifier, etapa, e, tiempos), modos)
+
+
+def retransformar_decodificado(identifier: str, factura_data: dict, tiempos=None) -> dict:
+    """
+    Transforma una factura ya decodificada (leída de la caché de decodificados).
+
+    Args:
+        identifier (str): Identificador del archivo (claveAcceso).
+        factura_data (dict): Salida de validar_y_convertir_a_json.
+        tiempos (dict): Tiempos de las etapas previas (p. ej. la lectura de la caché).
+
+    Returns:
+        dict: Resultado como el de procesar_factura.
+    """
+    tiempos = {} if tiempos is None else tiempos
+    inicio = time.perf_counter()
+    try:
+        transformed_data = transformar_factura(factura_data)
+    except Exception as e:
+        tiempos["transformacion"] = time.perf_counter() - inicio
+        return _fallo(identifier, "transformacion", e, tiempos)
+    tiempos["transformacion"] = time.perf_counter() - inicio
+    return {"id": identifier, "ok": True, "data": transformed_data, "tiempos": tiempos}
+
+
+def _procesar_por_partes(identifier: str, comprobante_xml, tiempos: dict) -> dict:
+    """
+    Variante de procesar_factura para comprobantes grandes.
+
+    Los detalles se validan y transforman uno a uno a medida que el parser los
+    cierra (ver parsear_por_partes), así que nunca coexisten el árbol completo,
+    el diccionario decodificado y la lista transformada: la memoria pico es la
+    de la cabecera, una línea y la salida compacta. La salida es la misma que
+    la de procesar_factura, pero el documento decodificado para la caché de
+    decodificados es None (nunca se arma completo): la caché guarda sólo la
+    referencia y --retransform lo vuelve a procesar desde el XML.
+    """
+    reloj = time.perf_counter
+    completa = validacion_completa(OPCIONES["tasa_validacion"])
+    modos = Counter()
+    lineas = []
+    for nombre in ("parseo", "validacion", "transformacion"):
+        tiempos.setdefault(nombre, 0.0)
+    etapa, en_lineas = "parseo", 0.0
+
+    def procesar_detalle(version, elemento):
+        nonlocal etapa, en_lineas
+        etapa, inicio = "validacion", reloj()
+        detalle = decodificar_detalle(elemento, version, XSD_FACTURA_PATH, completa, modos)
+        medio = reloj()
+        etapa = "transformacion"
+        lineas.append(transformar_detalle(detalle))
+        fin = reloj()
+        tiempos["validacion"] += medio - inicio
+        tiempos["transformacion"] += fin - medio
+        en_lineas += fin - inicio
+        etapa = "parseo"
+
+    inicio_parseo = inicio = reloj()
+    try:
+        version, root = parsear_por_partes(comprobante_xml, procesar_detalle)
+        fin = reloj()
+        # El tiempo de las líneas ya se sumó a la validación y la transformación
+        tiempos["parseo"] += fin - inicio - en_lineas
+
+        etapa, inicio = "validacion", fin
+        # La cabecera (con el primer detalle) se decodifica en el mismo modo que las líneas
+        factura_data = validar_y_convertir_a_json(
+            root, version, XSD_FACTURA_PATH, 1.0 if completa else 0.0, modos
+        )
+        del root
+        fin = reloj()
+        tiempos["validacion"] += fin - inicio
+
+        etapa, inicio = "transformacion", fin
+        transformed_data = transformar_factura(factura_data)
+        transformed_data["detalles"].extend(lineas)
+        tiempos["transformacion"] += reloj() - inicio
+        resultado = {"id": identifier, "ok": True, "data": transformed_data, "tiempos": tiempos}
+        if OPCIONES["cachear_decodificados"]:
+            resultado["decodificado"] = (version, fingerprint(comprobante_xml), None)
+        return _con_validacion(resultado, modos)
+    except Exception as e:
+        if inicio is inicio_parseo:
+            # Falló durante el parseo (o en una de sus líneas)
+            tiempos["parseo"] += reloj() - inicio - en_lineas
+        else:
+            tiempos[etapa] += reloj() - inicio
+        return _con_validacion(_fallo(identifier, etapa, e, tiempos), modos)
+
+
+# Manejador de cada tipo de comprobante (codDoc). Los tipos sin manejador se
+# omiten antes de parsearlos; para procesar otro tipo basta con registrar aquí
+# una función con la firma de procesar_factura (con sus propios XSD en un
+# RegistroEsquemas con otro prefijo).
+MANEJADORES = {
+    DOC_TYPE_INVOICE: procesar_factura,
+}
+
+
+def leer_documento(path: str):
+    """
+    Lee el <comprobante> de un archivo midiendo la duración de la lectura.
+
+    Returns:
+        tuple: (comprobante en bytes o None, segundos, excepción o None).
+    """
+    inicio = time.perf_counter()
+    try:
+        comprobante_xml = leer_comprobante_xml(path)
+    except Exception as e:
+        return None, time.perf_counter() - inicio, e
+    return comprobante_xml, time.perf_counter() - inicio, None
+
+
+def leer_registro(registro):
+    """
+    Lee el <comprobante> de un registro de archivo o de miembro de un archivo comprimido.
+
+    Los miembros de zip/tar (ArchiveMember) ya traen su contenido, así que sólo
+    se extrae el comprobante sin volver al disco. Si el ID es una claveAcceso de
+    un tipo de comprobante sin manejador, el archivo no se lee y el error es
+    ComprobanteOmitido.
+
+    Returns:
+        tuple: Como leer_documento.
+    """
+    clave = decode_access_key(registro.id)
+    if clave is not None and clave.doc_type not in MANEJADORES:
+        # El tipo está en la claveAcceso del nombre: no hace falta leer el archivo
+        return None, 0.0, ComprobanteOmitido(clave.doc_type)
+    contenido = getattr(registro, "content", None)
+    if contenido is None:
+        return leer_documento(registro.path)
+    inicio = time.perf_counter()
+    try:
+        comprobante_xml = extraer_comprobante_bytes(contenido)
+    except Exception as e:
+        return None, time.perf_counter() - inicio, e
+    return comprobante_xml, time.perf_counter() - inicio, None
+
+
+def procesar_leido(identifier: str, leido) -> dict:
+    """
+    Procesa el resultado de leer_documento (lectura hecha en otro hilo).
+
+    Args:
+        identifier (str): Identificador del archivo (claveAcceso).
+        leido (tuple): Resultado de leer_documento.
+
+    Returns:
+        dict: Resultado como el de procesar_documento.
+    """
+    comprobante_xml, segundos, error = leido
+    tiempos = {"lectura": segundos}
+    if isinstance(error, ComprobanteOmitido):
+        return resultado_omitido(identifier, error, tiempos)
+    if error is not None:
+        return _fallo(identifier, "lectura", error, tiempos)
+    return procesar_comprobante(identifier, comprobante_xml, tiempos)
+
+
+def resultado_duplicado(identifier: str, duplica: str, tiempos: dict, original=None) -> dict:
+    """
+    Resultado de un documento omitido por ser duplicado de otro ya ingerido.
+
+    Args:
+        identifier (str): Identificador del archivo.
+        duplica (str): Qué documento duplica (ver DedupeCache.check).
+        tiempos (dict): Tiempos de las etapas ejecutadas.
+        original (str): Identificador del original si aún no se confirmó su
+            escritura (la copia sólo es duplicada si el original se ingiere).
+    """
+    return {
+        "id": identifier,
+        "ok": False,
+        "duplicado": True,
+        "original": original,
+        "error": f"Duplicado de {duplica}",
+        "error_type": "Duplicado",
+        "etapa": "deduplicacion",
+        "tiempos": tiempos,
+    }
+
+
+def resultado_omitido(identifier: str, omitido: ComprobanteOmitido, tiempos: dict) -> dict:
+    """
+    Resultado de un comprobante omitido por no tener manejador para su tipo.
+
+    Args:
+        identifier (str): Identificador del archivo.
+        omitido (ComprobanteOmitido): Motivo, con el codDoc del comprobante.
+        tiempos (dict): Tiempos de las etapas ejecutadas.
+    """
+    return {
+        "id": identifier,
+        "ok": False,
+        "omitido": True,
+        "tipo": omitido.cod_doc,
+        "error": str(omitido),
+        "error_type": type(omitido).__name__,
+        "etapa": "clasificacion",
+        "tiempos": tiempos,
+    }
+
+
+def procesar_documento(identifier: str, path: str) -> dict:
+    """
+    Extrae, valida y transforma un documento XML.
+
+    Es la unidad de trabajo CPU del pipeline: no escribe en MongoDB ni en el
+    índice de procesamiento, por lo que puede ejecutarse en otro proceso.
+    Mide la duración de cada etapa para las métricas del pipeline.
+
+    Args:
+        identifier (str): Identificador del archivo (claveAcceso).
+        path (str): Ruta del archivo XML.
+
+    Returns:
+        dict: Resultado con las claves 'id', 'ok', 'tiempos' y 'data' o
+            'error', 'error_type' y 'etapa'.
+    """
+    return procesar_leido(identifier, leer_documento(path))
+
+
+def procesar_lote(registros) -> list:
+    """
+    Procesa un lote de registros de archivos (tarea de un proceso trabajador).
+
+    Args:
+        registros (list): Registros con atributos 'id' y 'path' (y 'content'
+            para los miembros de archivos comprimidos).
+
+    Returns:
+        list[dict]: Resultados de procesar_documento en el mismo orden.
+    """
+    return [procesar_leido(registro.id, leer_registro(registro)) for registro in registros]
+
+
+def procesar_lote_leido(leidos) -> list:
+    """
+    Procesa un lote de documentos ya leídos (tarea de un proceso trabajador).
+
+    Args:
+        leidos (list): Pares (identificador, resultado de leer_documento).
+
+    Returns:
+        list[dict]: Resultados de procesar_leido en el mismo orden.
+    """
+    return [procesar_leido(identifier, leido) for identifier, leido in leidos]
@@ -0,0 +1,137 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from ..extraction.xml_parse import extraer_clave_acceso
+from .documento import (
+    inicializar_trabajador,
+    leer_registro,
+    procesar_leido,
+    procesar_lote,
+    procesar_lote_leido,
+    resultado_duplicado,
+)
+from .etapas import leer_anticipado
+
+
+def _lotes(registros, chunksize):
+    iterador = iter(registros)
+    while True:
+        lote = list(islice(iterador, chunksize))
+        if not lote:
+            return
+        yield lote
+
+
+def _leidos(registros, prefetch):
+    if prefetch > 0:
+        return leer_anticipado(registros, prefetch)
+    return ((registro, leer_registro(registro)) for registro in registros)
+
+
+def _filtrar_duplicados(leidos, deduplicador):
+    """
+    Separa los documentos ya ingeridos antes de validarlos.
+
+    Yields:
+        tuple: (registro, leido, resultado); resultado es None si el documento
+            debe procesarse.
+    """
+    for registro, leido in leidos:
+        comprobante_xml, segundos, error = leido
+        if error is None and deduplicador is not None:
+            duplica = deduplicador.check(
+                registro.id,
+                comprobante_xml,
+                extraer_clave_acceso(comprobante_xml),
+                getattr(registro, "modified", False),
+            )
+            if duplica:
+                yield registro, None, resultado_duplicado(
+                    registro.id, duplica.description, {"lectura": segundos}, duplica.original
+                )
+                continue
+        yield registro, leido, None
+
+
+def _enviar_leidos(pool, lote):
+    registros = [registro for registro, _ in lote]
+    tarea = [(registro.id, leido) for registro, leido in lote]
+    return registros, pool.submit(procesar_lote_leido, tarea)
+
+
+def iterar_resultados(registros, workers=1, chunksize=16, cache_dir=None, opciones=None,
+                      prefetch=64, deduplicador=None):
+    """
+    Procesa los registros de archivos y entrega sus resultados.
+
+    Los registros se consumen a medida que se necesitan (la fuente puede ser un
+    generador de descubrimiento), y en modo multiproceso sólo se mantienen
+    `2 * workers` lotes en vuelo para que la memoria no crezca con el total.
+    Un hilo lector lee hasta `prefetch` archivos por delante del procesamiento.
+    En modo multiproceso sin deduplicación cada trabajador lee sus propios
+    archivos, así que la lectura ya se solapa con el resto.
+
+    Con un `deduplicador` los archivos se leen en este proceso y los que ya
+    fueron ingeridos se entregan de inmediato, sin validarlos ni
+    transformarlos; el resto se entrega en orden.
+
+    Args:
+        registros (iterable): Registros con atributos 'id' y 'path'.
+        workers (int): Procesos trabajadores (1 = en el proceso actual).
+        chunksize (int): Documentos por tarea enviada a un trabajador.
+        cache_dir (str): Caché en disco de esquemas para los trabajadores.
+        opciones (dict): Opciones de procesamiento (ver documento.configurar).
+        prefetch (int): Archivos leídos por anticipado (0 = leer cada archivo
+            al procesarlo).
+        deduplicador (DedupeCache): Caché de documentos ya ingeridos.
+
+    Yields:
+        tuple: (registro, resultado) por cada documento.
+    """
+    if workers <= 1:
+        inicializar_trabajador(cache_dir, opciones)
+        if prefetch <= 0 and deduplicador is None:
+            for lote in _lotes(registros, chunksize):
+                yield from zip(lote, procesar_lote(lote))
+            return
+        fuente = _filtrar_duplicados(_leidos(registros, prefetch), deduplicador)
+        for registro, leido, resultado in fuente:
+            yield registro, resultado or procesar_leido(registro.id, leido)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=inicializar_trabajador,
+        initargs=(cache_dir, opciones),
+    ) as pool:
+        en_vuelo = deque()
+        try:
+            if deduplicador is None:
+                for lote in _lotes(registros, chunksize):
+                    en_vuelo.append((lote, pool.submit(procesar_lote, lote)))
+                    if len(en_vuelo) >= 2 * workers:
+                        lote_listo, futuro = en_vuelo.popleft()
+                        yield from zip(lote_listo, futuro.result())
+            else:
+                fuente = _filtrar_duplicados(_leidos(registros, prefetch), deduplicador)
+                lote = []
+                for registro, leido, resultado in fuente:
+                    if resultado is not None:
+                        yield registro, resultado
+                        continue
+                    lote.append((registro, leido))
+                    if len(lote) < chunksize:
+                        continue
+                    en_vuelo.append(_enviar_leidos(pool, lote))
+                    lote = []
+                    if len(en_vuelo) >= 2 * workers:
+                        lote_listo, futuro = en_vuelo.popleft()
+                        yield from zip(lote_listo, futuro.result())
+                if lote:
+                    en_vuelo.append(_enviar_leidos(pool, lote))
+            while en_vuelo:
+                lote_listo, futuro = en_vuelo.popleft()
+                yield from zip(lote_listo, futuro.result())
+        finally:
+            pool.shutdown(cancel_futures=True)
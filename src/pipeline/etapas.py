@@ -0,0 +1,231 @@
+import queue
+import threading
+import time
+from collections import deque
+
+from .documento import leer_registro
+
+# Marca de fin de las colas entre etapas
+_FIN = object()
+# Segundos entre comprobaciones de cancelación mientras una cola está llena
+_ESPERA = 0.5
+
+
+def leer_anticipado(registros, profundidad=64):
+    """
+    Etapa lectora: lee los archivos en un hilo por delante del consumidor.
+
+    La cola es acotada: si el procesamiento (o la escritura) se atrasa, la
+    lectura se detiene al tener `profundidad` documentos en memoria.
+
+    Args:
+        registros (iterable): Registros con atributos 'id' y 'path'.
+        profundidad (int): Máximo de documentos leídos en espera.
+
+    Yields:
+        tuple: (registro, resultado de leer_registro).
+    """
+    cola = queue.Queue(maxsize=max(1, profundidad))
+    detener = threading.Event()
+
+    def encolar(elemento):
+        while not detener.is_set():
+            try:
+                cola.put(elemento, timeout=_ESPERA)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def lector():
+        try:
+            for registro in registros:
+                if not encolar((registro, leer_registro(registro))):
+                    return
+        except BaseException as e:
+            # Error del descubrimiento de archivos: se relanza en el consumidor
+            encolar((_FIN, e))
+            return
+        encolar((_FIN, None))
+
+    hilo = threading.Thread(target=lector, name="lector-xml", daemon=True)
+    hilo.start()
+    try:
+        while True:
+            registro, leido = cola.get()
+            if registro is _FIN:
+                if leido is not None:
+                    raise leido
+                return
+            yield registro, leido
+    finally:
+        detener.set()
+        hilo.join()
+
+
+class EscritorAsincrono:
+    """
+    Etapa escritora: envía los documentos a un escritor por lotes
+    (MongoWriter, ParquetWriter) desde un hilo.
+
+    Las escrituras en MongoDB se solapan con la lectura y el procesamiento. La
+    cola es acotada, así que si MongoDB se atrasa `enviar` se bloquea y el resto
+    del pipeline se detiene en lugar de acumular documentos en memoria.
+
+    Los errores de escritura por documento, la duración de cada envío y los
+    `_id` que quedaron escritos se recogen con `resultados()` desde el hilo
+    principal; un error del escritor (p. ej. conexión perdida tras agotar los
+    reintentos) se relanza en el siguiente `enviar`.
+    """
+
+    def __init__(self, writer, capacidad=1000, flush_interval=None):
+        """
+        Args:
+            writer (MongoWriter): Escritor por lotes.
+            capacidad (int): Máximo de documentos en espera de escritura.
+            flush_interval (float): Segundos sin documentos nuevos tras los que
+                se escribe el lote parcial (por defecto el del writer).
+        """
+        self.writer = writer
+        self.flush_interval = (
+            writer.flush_interval if flush_interval is None else flush_interval
+        )
+        self._cola = queue.Queue(maxsize=max(1, capacidad))
+        self._salida = queue.SimpleQueue()
+        self._en_buffer = deque()
+        self._error = None
+        self._hilo = threading.Thread(target=self._ejecutar, name="escritor", daemon=True)
+        self._hilo.start()
+
+    def _ejecutar(self):
+        reloj = time.perf_counter
+        espera = self.flush_interval if self.flush_interval != float("inf") else None
+        try:
+            while True:
+                try:
+                    data = self._cola.get(timeout=espera)
+                except queue.Empty:
+                    # Sin documentos nuevos: escribir el lote parcial
+                    inicio = reloj()
+                    self._publicar(self.writer.flush(), reloj() - inicio)
+                    continue
+                inicio = reloj()
+                if data is _FIN:
+                    self._publicar(self.writer.flush(), reloj() - inicio)
+                    return
+                self._en_buffer.append(data.get("_id"))
+                self._publicar(self.writer.add(data), reloj() - inicio)
+        except BaseException as e:
+            self._error = e
+
+    def _publicar(self, errores, segundos):
+        escritos = []
+        if not len(self.writer):
+            # El writer escribió todo su buffer
+            escritos = list(self._en_buffer)
+            self._en_buffer.clear()
+        self._salida.put((errores, segundos, escritos))
+
+    def _verificar(self):
+        if self._error is not None:
+            raise RuntimeError(
+                f"Error en el escritor {type(self.writer).__name__}: {self._error}"
+            ) from self._error
+
+    def enviar(self, data: dict):
+        """Encola un documento; se bloquea mientras la cola esté llena."""
+        while True:
+            self._verificar()
+            try:
+                self._cola.put(data, timeout=_ESPERA)
+                return
+            except queue.Full:
+                continue
+
+    def resultados(self) -> list:
+        """
+        Retorna lo que el hilo escritor completó desde la última llamada.
+
+        Returns:
+            list[tuple]: (errores de escritura, segundos, `_id` escritos) por cada
+                envío o escritura de lote.
+        """
+        completados = []
+        while True:
+            try:
+                completados.append(self._salida.get_nowait())
+            except queue.Empty:
+                return completados
+
+    def cerrar(self) -> list:
+        """
+        Escribe lo pendiente y detiene el hilo.
+
+        Raises:
+            RuntimeError: Si el escritor falló.
+
+        Returns:
+            list[tuple]: Resultados aún no recogidos (ver resultados).
+        """
+        if self._hilo.is_alive():
+            self.enviar(_FIN)
+            self._hilo.join()
+        self._verificar()
+        return self.resultados()
+
+    def __len__(self):
+        return self._cola.qsize()
+
+
+class DocumentosEnVuelo:
+    """
+    Documentos enviados a los escritores cuya escritura aún no se confirmó.
+
+    Un documento se da por terminado cuando todos los destinos lo escribieron;
+    si alguno reportó un error, termina como fallido.
+    """
+
+    def __init__(self, destinos: int = 1):
+        self.destinos = destinos
+        self._pendientes = {}
+
+    def __len__(self):
+        return sum(len(entradas) for entradas in self._pendientes.values())
+
+    def agregar(self, doc_id, registro):
+        """Registra un documento enviado a todos los destinos."""
+        self._pendientes.setdefault(doc_id, deque()).append([registro, self.destinos, None])
+
+    def marcar_error(self, doc_id, error):
+        """Asocia un error de escritura al documento (el primero pendiente con ese `_id`)."""
+        entradas = self._pendientes.get(doc_id)
+        if entradas:
+            entradas[0][2] = entradas[0][2] or error
+
+    def confirmar(self, escritos) -> list:
+        """
+        Registra los `_id` que un destino escribió.
+
+        Returns:
+            list[tuple]: (registro, error o None) de los documentos que ya
+                fueron escritos por todos los destinos.
+        """
+        terminados = []
+        for doc_id in escritos:
+            entradas = self._pendientes.get(doc_id)
+            if not entradas:
+                continue
+            entrada = entradas[0]
+            entrada[1] -= 1
+            if entrada[1] <= 0:
+                entradas.popleft()
+                if not entradas:
+                    del self._pendientes[doc_id]
+                terminados.append((entrada[0], entrada[2]))
+        return terminados
+
+    def todos(self) -> list:
+        """Retira y retorna todos los registros pendientes."""
+        registros = [entrada[0] for entradas in self._pendientes.values() for entrada in entradas]
+        self._pendientes.clear()
+        return registros
@@ -0,0 +1,87 @@
+import os
+import time
+
+from ..utils.dedupe import fingerprint
+from ..utils.file_operation import FileRecord, iter_records
+from .documento import leer_registro, retransformar_decodificado
+
+
+def _huellas_vigentes(registro_esquemas):
+    huellas = {}
+
+    def huella(version):
+        if version not in huellas:
+            try:
+                huellas[version] = registro_esquemas.huella(version)
+            except FileNotFoundError:
+                # Ya no hay XSD para la versión: la entrada no puede validarse de nuevo
+                huellas[version] = None
+        return huellas[version]
+
+    return huella
+
+
+def _fuentes_modificadas(entradas) -> set:
+    """IDs cuyo archivo de origen cambió desde que se decodificó (sin los que ya no existen)."""
+    huellas = {entrada.id: entrada.source_hash for entrada in entradas}
+    modificados = set()
+    for registro in iter_records((entrada.id, entrada.path) for entrada in entradas):
+        comprobante_xml, _, error = leer_registro(registro)
+        if error is None and fingerprint(comprobante_xml) != huellas[registro.id]:
+            modificados.add(registro.id)
+    return modificados
+
+
+def iterar_retransformacion(almacen, registro_esquemas, procesar_vencidos, seleccion=None,
+                            verificar_fuentes=False):
+    """
+    Vuelve a transformar los documentos de la caché de decodificados.
+
+    Las entradas vigentes se leen de la caché en orden de almacenamiento y
+    sólo pasan por transformar_factura: no se lee, parsea ni valida el XML.
+    Una entrada está vencida si se decodificó con otro XSD (o versión de
+    xmlschema) que el actual o, con `verificar_fuentes`, si su archivo de
+    origen cambió; las vencidas se procesan desde el XML con
+    `procesar_vencidos`, al final (las que ya no tienen archivo se omiten).
+    Las entradas sin documento (comprobantes grandes procesados por partes,
+    ver _procesar_por_partes) se procesan igual que las vencidas.
+
+    Args:
+        almacen (DecodedStore): Caché de decodificados.
+        registro_esquemas (RegistroEsquemas): Registro con los XSD actuales.
+        procesar_vencidos (callable): Recibe los registros de archivos de las
+            entradas vencidas y retorna sus (registro, resultado), p. ej.
+            iterar_resultados.
+        seleccion (callable): Predicado sobre el ID para procesar sólo algunas entradas.
+        verificar_fuentes (bool): Leer los archivos de origen (sin parsearlos)
+            para detectar los que cambiaron.
+
+    Yields:
+        tuple: (registro, resultado) por cada documento.
+    """
+    huella = _huellas_vigentes(registro_esquemas)
+    vigentes, vencidos = [], []
+    for entrada in almacen.entries():
+        if seleccion is not None and not seleccion(entrada.id):
+            continue
+        if entrada.segment is not None and entrada.schema_hash == huella(entrada.version):
+            vigentes.append(entrada)
+        else:
+            vencidos.append((entrada.id, entrada.path))
+
+    if verificar_fuentes and vigentes:
+        modificados = _fuentes_modificadas(vigentes)
+        vencidos += [(e.id, e.path) for e in vigentes if e.id in modificados]
+        vigentes = [entrada for entrada in vigentes if entrada.id not in modificados]
+
+    reloj = time.perf_counter
+    inicio = reloj()
+    for entrada, factura_data in almacen.iter_documents(vigentes):
+        fin = reloj()
+        registro = FileRecord(entrada.id, entrada.path, os.path.basename(entrada.path))
+        tiempos = {"cache": fin - inicio}
+        yield registro, retransformar_decodificado(entrada.id, factura_data, tiempos)
+        inicio = reloj()
+
+    if vencidos:
+        yield from procesar_vencidos(iter_records(vencidos))
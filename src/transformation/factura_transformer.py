@@ -1,6 +1,156 @@
+from .dict_transformer import sumar_campo_valor
+
+
+# region Especificación declarativa del documento de salida
+#
+# Cada regla describe cómo se obtiene un campo destino a partir del documento
+# decodificado del XSD:
+#   campo(ruta...)               valor en la ruta (KeyError si falta, salvo requerido=False)
+#   suma(ruta, lista, valor)     suma de 'valor' en los elementos de la lista (sumar_campo_valor)
+#   lista(ruta, elemento, spec)  proyección de cada elemento de la lista con otra especificación
+#
+# Para agregar un campo basta con agregar una regla; la especificación se compila
+# en una sola función que construye la salida en una pasada.
+
+def campo(*ruta, requerido=True):
+    """Regla: valor ubicado en la ruta indicada."""
+    return ("campo", ruta, requerido)
+
+
+def suma(ruta, campo_lista, campo_suma):
+    """Regla: suma de `campo_suma` en los elementos de `campo_lista` dentro de la ruta."""
+    return ("suma", tuple(ruta), campo_lista, campo_suma)
+
+
+def lista(ruta, campo_elemento, especificacion):
+    """Regla: lista proyectada con `especificacion` desde `ruta[campo_elemento]`."""
+    return ("lista", tuple(ruta), campo_elemento, especificacion)
+
+
+ESPECIFICACION_PAGO = [
+    ("formaPago", campo("formaPago", requerido=False)),
+    ("total", campo("total", requerido=False)),
+]
+
+ESPECIFICACION_DETALLE = [
+    ("codigoPrincipal", campo("codigoPrincipal", requerido=False)),
+    ("codigoAuxiliar", campo("codigoAuxiliar", requerido=False)),
+    ("descripcion", campo("descripcion", requerido=False)),
+    ("unidadMedida", campo("unidadMedida", requerido=False)),
+    ("cantidad", campo("cantidad", requerido=False)),
+    ("precioUnitario", campo("precioUnitario", requerido=False)),
+    ("precioTotalSinImpuesto", campo("precioTotalSinImpuesto", requerido=False)),
+    ("totalImpuesto", suma(("impuestos",), "impuesto", "valor")),
+]
+
+ESPECIFICACION_FACTURA = [
+    # infoTributaria
+    ("_id", campo("infoTributaria", "claveAcceso")),
+    ("ambiente", campo("infoTributaria", "ambiente")),
+    ("codigoDocumento", campo("infoTributaria", "codDoc")),
+    ("establecimiento", campo("infoTributaria", "estab")),
+    ("puntoEmisor", campo("infoTributaria", "ptoEmi")),
+    ("secuencial", campo("infoTributaria", "secuencial")),
+    # infoFactura
+    ("fechaEmision", campo("infoFactura", "fechaEmision")),
+    ("direccionEstablecimiento", campo("infoFactura", "dirEstablecimiento")),
+    ("direccionComprador", campo("infoFactura", "direccionComprador")),
+    ("totalSinImpuestos", campo("infoFactura", "totalSinImpuestos")),
+    ("totalDescuento", campo("infoFactura", "totalDescuento")),
+    ("propina", campo("infoFactura", "propina")),
+    ("importeTotal", campo("infoFactura", "importeTotal")),
+    ("moneda", campo("infoFactura", "moneda")),
+    ("totalConImpuestos", suma(("infoFactura", "totalConImpuestos"), "totalImpuesto", "valor")),
+    ("pagos", lista(("infoFactura", "pagos"), "pago", ESPECIFICACION_PAGO)),
+    # detalles
+    ("detalles", lista(("detalles",), "detalle", ESPECIFICACION_DETALLE)),
+]
+
+# Campos del documento de origen que no pasan a la salida; el resto se copia tal cual
+CAMPOS_EXCLUIDOS = frozenset(
+    ["infoTributaria", "infoFactura", "detalles", "id", "version", "infoAdicional"]
+)
+
+# endregion
+
+
+# region Compilación de la especificación
+
+def _expresion_ruta(variable, ruta, requerido=True):
+    expresion = variable
+    for i, clave in enumerate(ruta):
+        if requerido:
+            expresion = f"{expresion}[{clave!r}]"
+        elif i == len(ruta) - 1:
+            expresion = f"{expresion}.get({clave!r})"
+        else:
+            expresion = f"({expresion}.get({clave!r}) or {{}})"
+    return expresion
+
+
+def _expresion_regla(variable, regla, profundidad):
+    tipo = regla[0]
+    if tipo == "campo":
+        _, ruta, requerido = regla
+        return _expresion_ruta(variable, ruta, requerido)
+    if tipo == "suma":
+        _, ruta, campo_lista, campo_suma = regla
+        return (
+            f"_sumar({_expresion_ruta(variable, ruta)}, {campo_lista!r}, {campo_suma!r})"
+        )
+    if tipo == "lista":
+        _, ruta, campo_elemento, especificacion = regla
+        elemento = f"e{profundidad + 1}"
+        proyeccion = _expresion_dict(elemento, especificacion, profundidad + 1)
+        origen = f"{_expresion_ruta(variable, ruta)}.get({campo_elemento!r}, [])"
+        return f"[{proyeccion} for {elemento} in {origen}]"
+    raise ValueError(f"Regla de transformación desconocida: {tipo}")
+
+
+def _expresion_dict(variable, especificacion, profundidad):
+    campos = ", ".join(
+        f"{destino!r}: {_expresion_regla(variable, regla, profundidad)}"
+        for destino, regla in especificacion
+    )
+    return "{" + campos + "}"
+
 
+def compilar_especificacion(especificacion, campos_excluidos=None, nombre="transformar"):
+    """
+    Compila una especificación declarativa en una función de una sola pasada.
 
-from .dict_transformer import modificar_dict, remover_dict, sumar_campo_valor
+    Args:
+        especificacion (list): Pares (campo destino, regla).
+        campos_excluidos (frozenset): Si se indica, los campos del documento de
+            origen que no estén en este conjunto se copian al inicio de la salida.
+        nombre (str): Nombre de la función generada.
+
+    Returns:
+        callable: Función doc -> dict con la salida.
+    """
+    cuerpo = _expresion_dict("e0", especificacion, 0)
+    if campos_excluidos is not None:
+        # Primero los campos copiados, después los especificados (mismo orden
+        # que producían las transformaciones encadenadas)
+        cuerpo = (
+            "{**{k: v for k, v in e0.items() if k not in _excluidos}, "
+            + cuerpo[1:]
+        )
+    codigo = f"def {nombre}(e0):\n    return {cuerpo}\n"
+    espacio = {"_sumar": sumar_campo_valor, "_excluidos": campos_excluidos}
+    exec(compile(codigo, f"<especificacion {nombre}>", "exec"), espacio)
+    funcion = espacio[nombre]
+    funcion.codigo_fuente = codigo
+    return funcion
+
+# endregion
+
+
+_transformar_factura = compilar_especificacion(
+    ESPECIFICACION_FACTURA, CAMPOS_EXCLUIDOS, "transformar_factura"
+)
+transformar_detalle = compilar_especificacion(ESPECIFICACION_DETALLE, nombre="transformar_detalle")
+transformar_pago = compilar_especificacion(ESPECIFICACION_PAGO, nombre="transformar_pago")
 
 
 def transformar_factura(doc):
@@ -13,11 +163,7 @@ def transformar_factura(doc):
     Returns:
         dict: Documento de factura transformado.
     """
-    doc = procesar_info_tributaria(doc)
-    doc = procesar_info_factura(doc)
-    doc = procesar_detalles(doc)
-    doc = procesar_info_adicional(doc)
-    return doc
+    return _transformar_factura(doc)
 
 def extraer_forma_pago_y_total(pagos_dict):
     """
@@ -29,8 +175,7 @@ def extraer_forma_pago_y_total(pagos_dict):
     Returns:
         list[dict]: Lista de diccionarios con 'formaPago' y 'total'.
     """
-    pagos = pagos_dict.get('pago', [])
-    return [{'formaPago': p.get('formaPago'), 'total': p.get('total')} for p in pagos]
+    return [transformar_pago(p) for p in pagos_dict.get('pago', [])]
 
 def transformar_detalles(detalles_dict):
     """
@@ -42,80 +187,4 @@ def transformar_detalles(detalles_dict):
     Returns:
         list[dict]: Lista de productos con campos simplificados.
     """
-    resultado = []
-    for item in detalles_dict.get('detalle', []):
-        total_impuesto = sumar_campo_valor(item["impuestos"], 'impuesto', 'valor')
-        resultado.append({
-            'codigoPrincipal': item.get('codigoPrincipal'),
-            'codigoAuxiliar': item.get('codigoAuxiliar'),
-            'descripcion': item.get('descripcion'),
-            'unidadMedida': item.get('unidadMedida'),
-            'cantidad': item.get('cantidad'),
-            'precioUnitario': item.get('precioUnitario'),
-            'precioTotalSinImpuesto': item.get('precioTotalSinImpuesto'),
-            'totalImpuesto': total_impuesto
-        })
-    return resultado
-
-def procesar_info_tributaria(doc):
-    """
-    Procesa la información tributaria del documento de factura.
-    """
-    tmp = doc['infoTributaria']
-    infoTributaria = {
-        '_id': tmp['claveAcceso'],
-        'ambiente': tmp['ambiente'],
-        'codigoDocumento': tmp['codDoc'],
-        'establecimiento': tmp['estab'],
-        'puntoEmisor': tmp['ptoEmi'],
-        'secuencial': tmp['secuencial']
-    }
-    return modificar_dict(
-        doc,
-        campos_a_remover=["infoTributaria"],
-        campos_a_agregar=infoTributaria
-    )
-
-def procesar_info_factura(doc):
-    """
-    Procesa la información de la factura del documento.
-    """
-    tmp = doc['infoFactura']
-    infoFactura = {
-        'fechaEmision': tmp['fechaEmision'],
-        'direccionEstablecimiento': tmp['dirEstablecimiento'],
-        'direccionComprador': tmp['direccionComprador'],
-        'totalSinImpuestos': tmp['totalSinImpuestos'],
-        'totalDescuento': tmp['totalDescuento'],
-        'propina': tmp['propina'],
-        'importeTotal': tmp['importeTotal'],
-        'moneda': tmp['moneda'],
-        'totalConImpuestos': sumar_campo_valor( tmp['totalConImpuestos']),
-        'pagos': extraer_forma_pago_y_total(tmp['pagos']),
-    }
-    return modificar_dict(
-        doc,
-        campos_a_remover=["infoFactura"],
-        campos_a_agregar=infoFactura
-    )
-
-def procesar_detalles(doc):
-    """
-    Procesa los detalles de la factura del documento.
-    """
-    tmp = doc['detalles']
-    detalles = transformar_detalles(tmp)
-    return modificar_dict(
-        doc,
-        campos_a_remover=["detalles", "id", "version"],
-        campos_a_agregar={"detalles": detalles}
-    )
-
-def procesar_info_adicional(doc): 
-    """
-    Procesa la información adicional del documento de factura.
-    """
-    return remover_dict(
-        doc,
-        campos_a_remover=["infoAdicional"] 
-    )
\ No newline at end of file
+    return [transformar_detalle(item) for item in detalles_dict.get('detalle', [])]
@@ -0,0 +1,161 @@
+import os
+import zlib
+from collections import namedtuple
+from datetime import date
+
+ACCESS_KEY_LENGTH = 49
+
+ENVIRONMENT_TEST = '1'
+ENVIRONMENT_PRODUCTION = '2'
+
+# Document types (codDoc) and the root tag of their comprobante
+DOC_TYPE_INVOICE = '01'
+DOC_TYPES = {
+    DOC_TYPE_INVOICE: 'factura',
+    '03': 'liquidacionCompra',
+    '04': 'notaCredito',
+    '05': 'notaDebito',
+    '06': 'guiaRemision',
+    '07': 'comprobanteRetencion',
+}
+
+# region Access key decoding
+
+# Fields of the 49-digit SRI access key (claveAcceso), in order:
+#   ddmmyyyy | codDoc (2) | RUC (13) | ambiente (1) | estab (3) | ptoEmi (3)
+#   | secuencial (9) | código numérico (8) | tipoEmision (1) | dígito verificador (1)
+AccessKey = namedtuple('AccessKey', [
+    'emission_date',
+    'doc_type',
+    'ruc',
+    'environment',
+    'establishment',
+    'emission_point',
+    'sequence',
+    'numeric_code',
+    'emission_type',
+    'check_digit',
+])
+
+
+def decode_access_key(key):
+    """
+    Decodes an SRI access key without reading the document.
+
+    File IDs are the access keys of the documents, so runs can be filtered and
+    sharded from the file names alone.
+
+    Args:
+        key (str): The 49-digit access key (e.g. a file ID).
+
+    Returns:
+        AccessKey | None: The decoded fields, or None if key is not an access key.
+    """
+    if not key or len(key) != ACCESS_KEY_LENGTH or not (key.isascii() and key.isdigit()):
+        return None
+    try:
+        emission_date = date(int(key[4:8]), int(key[2:4]), int(key[0:2]))
+    except ValueError:
+        return None
+    return AccessKey(
+        emission_date,
+        key[8:10],
+        key[10:23],
+        key[23],
+        key[24:27],
+        key[27:30],
+        key[30:39],
+        key[39:47],
+        key[47],
+        key[48],
+    )
+
+
+def access_key_filter(since=None, rucs=None, environment=None):
+    """
+    Builds a predicate that selects file IDs by the fields of their access key.
+
+    IDs that are not access keys are rejected, since nothing is known about them.
+
+    Args:
+        since (date): Only documents emitted on or after this date.
+        rucs (iterable[str]): Only documents of these issuers.
+        environment (str): Only documents of this environment
+            (ENVIRONMENT_TEST or ENVIRONMENT_PRODUCTION).
+
+    Returns:
+        callable | None: predicate(file_id) -> bool, or None without criteria.
+    """
+    rucs = frozenset(rucs) if rucs else None
+    if since is None and rucs is None and environment is None:
+        return None
+
+    def accepts(file_id):
+        key = decode_access_key(file_id)
+        if key is None:
+            return False
+        if since is not None and key.emission_date < since:
+            return False
+        if rucs is not None and key.ruc not in rucs:
+            return False
+        return environment is None or key.environment == environment
+
+    return accepts
+
+# endregion
+
+# region Sharding
+
+class Shard:
+    """
+    One of N deterministic partitions of the documents ('k/N', 1-based).
+
+    A document belongs to a shard by the CRC32 of its file ID, so every node
+    agrees on the split without any coordination and the shards are balanced
+    regardless of how issuers or dates are distributed. Each shard keeps its
+    own state files (process index, manifest, ...; see file_name).
+    """
+
+    def __init__(self, index, count):
+        """
+        Args:
+            index (int): Shard number, from 1 to count.
+            count (int): Total number of shards.
+
+        Raises:
+            ValueError: If the shard number is out of range.
+        """
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"Invalid shard {index}/{count}: expected 1 <= k <= N")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parses a 'k/N' shard specification.
+
+        Raises:
+            ValueError: If the text is not a valid specification.
+        """
+        index, sep, count = text.partition('/')
+        if not sep:
+            raise ValueError(f"Invalid shard '{text}': expected k/N")
+        return cls(int(index), int(count))
+
+    def __contains__(self, file_id):
+        return zlib.crc32(file_id.encode('utf-8')) % self.count == self.index - 1
+
+    def __repr__(self):
+        return f'Shard({self.index}/{self.count})'
+
+    def file_name(self, file_name):
+        """
+        Returns the shard's own version of a state file name.
+
+        Example: 'log/process.index' -> 'log/process.shard-2-of-4.index'.
+        """
+        root, ext = os.path.splitext(file_name)
+        return f'{root}.shard-{self.index}-of-{self.count}{ext}'
+
+# endregion
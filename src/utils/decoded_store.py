@@ -0,0 +1,272 @@
+import json
+import os
+import re
+from collections import namedtuple
+
+import bson
+
+DECODED_STORE_DIR = 'cache/decoded'
+SEGMENT_SIZE = 256 * 1024 * 1024
+
+INDEX_NAME = 'decoded.index'
+_SEGMENT_PATTERN = re.compile(r'^segment-(\d{6})\.bson$')
+
+# region Decoded document store
+
+# Location and validity of the cached decoded document of a file
+StoreEntry = namedtuple('StoreEntry', [
+    'id',
+    'path',
+    'version',
+    'schema_hash',
+    'source_hash',
+    'segment',
+    'offset',
+    'length',
+])
+
+
+class DecodedStore:
+    """
+    Persistent store of decoded documents (the XSD validation/decode output).
+
+    Re-running the transformation from this store skips reading, parsing and
+    validating the XML. Documents are appended as BSON to segment files
+    (segment-NNNNNN.bson, a new one per run and every `segment_size` bytes)
+    and located through an append-only JSON-lines index, where a later entry
+    for the same file ID supersedes the earlier one.
+
+    Every entry records the schema hash (see RegistroEsquemas.huella) and the
+    source fingerprint (see dedupe.fingerprint) it was decoded from, so callers
+    can tell stale entries apart: a different schema hash means the XSD or
+    xmlschema changed, a different source hash means the file changed.
+
+    Documents that are never decoded as a whole (large invoices processed in
+    parts) get a reference entry: the same fields without a document
+    (segment, offset and length are None), so callers know the file was
+    processed and must read it again to transform it.
+    """
+
+    def __init__(self, directory=DECODED_STORE_DIR, segment_size=SEGMENT_SIZE, batch_size=500):
+        """
+        Args:
+            directory (str): Directory of the segments and the index.
+            segment_size (int): Bytes after which a new segment is started.
+            batch_size (int): Entries buffered before they are appended to the index.
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.batch_size = batch_size
+        self.index_file_name = os.path.join(directory, INDEX_NAME)
+        self.stats = {'written': 0, 'unchanged': 0, 'read': 0}
+        self._entries = {}
+        self._pending = []
+        self._needs_newline = False
+        self._segment = None
+        self._segment_number = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __contains__(self, file_id):
+        return file_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, file_id):
+        """Returns the StoreEntry of a file ID, or None."""
+        return self._entries.get(file_id)
+
+    def put(self, file_id, path, version, schema_hash, source_hash, data: bytes):
+        """
+        Stores the decoded document of a file.
+
+        Nothing is written if the current entry was decoded from the same
+        source with the same schema (unless it is a reference entry and the
+        document is given).
+
+        Args:
+            file_id (str): File identifier (claveAcceso).
+            path (str): Path of the source file (or archive member).
+            version (str): Schema version the document was decoded with.
+            schema_hash (str): Hash of that schema.
+            source_hash (str): Fingerprint of the source content.
+            data (bytes): The decoded document encoded as BSON, or None for a
+                reference entry.
+
+        Returns:
+            bool: True if the document was written.
+        """
+        current = self._entries.get(file_id)
+        if (current is not None and current.source_hash == source_hash
+                and current.schema_hash == schema_hash and current.version == version
+                and (current.segment is not None or data is None)):
+            self.stats['unchanged'] += 1
+            return False
+
+        if data is None:
+            entry = StoreEntry(file_id, path, version, schema_hash, source_hash, None, None, None)
+        else:
+            segment = self._writable_segment()
+            offset = segment.tell()
+            segment.write(data)
+            entry = StoreEntry(file_id, path, version, schema_hash, source_hash,
+                               self._segment_number, offset, len(data))
+        self._entries[file_id] = entry
+        self._pending.append(json.dumps(entry._asdict(), ensure_ascii=False) + '\n')
+        self.stats['written'] += 1
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    def entries(self):
+        """Returns the current entries in storage order (for sequential reads), references first."""
+        return sorted(
+            self._entries.values(), key=lambda entry: (entry.segment or 0, entry.offset or 0)
+        )
+
+    def iter_documents(self, entries):
+        """
+        Reads decoded documents.
+
+        Each segment is opened once and read forward when the entries come
+        in storage order (see entries), so the store is read at disk speed.
+
+        Args:
+            entries (iterable[StoreEntry]): Entries to read (reference entries
+                are skipped).
+
+        Yields:
+            tuple: (StoreEntry, decoded document).
+        """
+        for entry, data in self._iter_raw(entries):
+            self.stats['read'] += 1
+            yield entry, bson.decode(data)
+
+    def flush(self):
+        """Syncs the current segment and appends the buffered entries to the index."""
+        if self._segment is not None:
+            # The documents must be on disk before the index points to them
+            self._segment.flush()
+            os.fsync(self._segment.fileno())
+        if not self._pending:
+            return
+        data = ''.join(self._pending)
+        if self._needs_newline:
+            # The last write was interrupted mid-line; never glue entries together
+            data = '\n' + data
+        with open(self.index_file_name, 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._needs_newline = False
+        self._pending.clear()
+
+    def compact(self):
+        """
+        Rewrites the live documents into new segments and drops the rest.
+
+        Superseded documents stay in their segments until the store is
+        compacted; close does it when they take most of the space.
+        """
+        self.flush()
+        self._close_segment()
+        live = self.entries()
+        old_segments = self._segment_numbers()
+        self._segment_number = max(old_segments, default=0)
+
+        compacted = {entry.id: entry for entry in live if entry.segment is None}
+        for entry, data in self._iter_raw(live):
+            segment = self._writable_segment()
+            compacted[entry.id] = entry._replace(
+                segment=self._segment_number, offset=segment.tell(), length=len(data)
+            )
+            segment.write(data)
+        self._close_segment()
+
+        tmp = self.index_file_name + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in compacted.values():
+                f.write(json.dumps(entry._asdict(), ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_file_name)
+        for number in old_segments:
+            os.remove(self._segment_path(number))
+        self._entries = compacted
+        self._needs_newline = False
+
+    def close(self):
+        """Persists pending entries, compacting the store if it is mostly superseded documents."""
+        self.flush()
+        self._close_segment()
+        live = sum(entry.length or 0 for entry in self._entries.values())
+        total = sum(
+            os.path.getsize(self._segment_path(number)) for number in self._segment_numbers()
+        )
+        if total - live > max(live, self.segment_size):
+            self.compact()
+
+    def _iter_raw(self, entries):
+        self.flush()
+        segment_number, segment = None, None
+        try:
+            for entry in entries:
+                if entry.segment is None:
+                    continue
+                if entry.segment != segment_number:
+                    if segment is not None:
+                        segment.close()
+                    segment_number = entry.segment
+                    segment = open(self._segment_path(segment_number), 'rb')
+                segment.seek(entry.offset)
+                yield entry, segment.read(entry.length)
+        finally:
+            if segment is not None:
+                segment.close()
+
+    def _writable_segment(self):
+        if self._segment is not None and self._segment.tell() >= self.segment_size:
+            self.flush()
+            self._close_segment()
+        if self._segment is None:
+            # Always a new segment: a segment is never appended to after it was closed
+            self._segment_number += 1
+            self._segment = open(self._segment_path(self._segment_number), 'ab')
+        return self._segment
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f'segment-{number:06d}.bson')
+
+    def _segment_numbers(self):
+        return sorted(
+            int(match.group(1))
+            for match in map(_SEGMENT_PATTERN.match, os.listdir(self.directory))
+            if match
+        )
+
+    def _load(self):
+        self._segment_number = max(self._segment_numbers(), default=0)
+        if not os.path.exists(self.index_file_name):
+            return
+        with open(self.index_file_name, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._needs_newline = not line.endswith('\n')
+                try:
+                    entry = StoreEntry(**json.loads(line))
+                except (ValueError, TypeError):
+                    continue  # Partial line from an interrupted write
+                self._entries[entry.id] = entry
+
+# endregion
@@ -0,0 +1,181 @@
+import hashlib
+from collections import Counter, namedtuple
+
+from .process_index import get_process_index
+
+KEYS_INDEX_FILE_NAME = 'log/dedupe_claves.index'
+FINGERPRINTS_INDEX_FILE_NAME = 'log/dedupe_huellas.index'
+
+# region Duplicate detection
+
+# What a document duplicates: a description ('claveAcceso <key>' or
+# 'contenido <fingerprint>') and, if the original is still in flight, its file ID
+Duplicate = namedtuple('Duplicate', ['description', 'original'])
+
+def fingerprint(content: bytes) -> str:
+    """
+    Cheap content fingerprint: size plus a 128-bit BLAKE2b digest.
+
+    Args:
+        content (bytes): Document content (the extracted <comprobante>).
+
+    Returns:
+        str: Fingerprint in the form '<size>-<hex digest>'.
+    """
+    return f"{len(content)}-{hashlib.blake2b(content, digest_size=16).hexdigest()}"
+
+
+class DedupeCache:
+    """
+    Detects documents that were already ingested, before they are parsed.
+
+    A document is a duplicate when its content fingerprint or its claveAcceso
+    was already ingested, either in a previous run (both are persisted in
+    append-only ProcessIndex files) or earlier in this run. Documents that are
+    still being processed are tracked as in flight, so copies of the same
+    invoice within one run are also skipped. Such a copy is reported with the
+    file ID of its in-flight original: it is only a duplicate once the
+    original is confirmed, and must stay pending (to be processed by a later
+    run) if the original is released. The caller hands such copies back with
+    copy_of, and gets them again from confirm/release when the original is
+    settled.
+
+    A document whose file changed after it was ingested (see FileRecord.modified)
+    replaces the earlier version: its claveAcceso is not checked against the
+    ingested ones, only its content fingerprint (an unchanged content is
+    still a duplicate).
+    """
+
+    def __init__(self, keys_index_file_name=KEYS_INDEX_FILE_NAME,
+                 fingerprints_index_file_name=FINGERPRINTS_INDEX_FILE_NAME):
+        """
+        Args:
+            keys_index_file_name (str): Index of ingested claveAcceso values.
+            fingerprints_index_file_name (str): Index of ingested content fingerprints.
+        """
+        self._keys = get_process_index(keys_index_file_name)
+        self._fingerprints = get_process_index(fingerprints_index_file_name)
+        self._in_flight = {}
+        # claveAcceso / fingerprint -> file ID of the in-flight document
+        self._in_flight_keys = {}
+        self._in_flight_fingerprints = {}
+        # Copies of in-flight documents: reported by check, waiting for their
+        # original, and the outcome of originals settled before all their
+        # copies were handed back
+        self._reported_copies = Counter()
+        self._waiting_copies = {}
+        self._outcomes = {}
+        self.duplicates = 0
+
+    def check(self, file_id, content: bytes, key=None, replace=False):
+        """
+        Checks a document and, if it is new, marks it as in flight.
+
+        Args:
+            file_id (str): File identifier used by confirm/release.
+            content (bytes): Document content to fingerprint.
+            key (str): The document claveAcceso, if known.
+            replace (bool): The document replaces an ingested one with the same
+                claveAcceso (its file was modified).
+
+        Returns:
+            Duplicate | None: What the document duplicates, or None if it is new.
+        """
+        if key and ((key in self._keys and not replace) or key in self._in_flight_keys):
+            return self._duplicate(f"claveAcceso {key}", self._in_flight_keys.get(key))
+        content_fingerprint = fingerprint(content)
+        if (content_fingerprint in self._fingerprints
+                or content_fingerprint in self._in_flight_fingerprints):
+            return self._duplicate(
+                f"contenido {content_fingerprint}",
+                self._in_flight_fingerprints.get(content_fingerprint),
+            )
+
+        self._in_flight[file_id] = (key, content_fingerprint)
+        if key:
+            self._in_flight_keys[key] = file_id
+        self._in_flight_fingerprints[content_fingerprint] = file_id
+        return None
+
+    def copy_of(self, original, copy):
+        """
+        Hands back a copy reported by check with an in-flight original.
+
+        Args:
+            original (str): File ID of the original (Duplicate.original).
+            copy: Caller's record of the copy, returned by confirm/release.
+
+        Returns:
+            bool | None: True if the original was ingested (the copy is a
+                duplicate), False if it was released (the copy must stay
+                pending), None if it is still in flight (the copy is returned
+                by confirm/release).
+        """
+        if original in self._in_flight:
+            self._waiting_copies.setdefault(original, []).append(copy)
+            return None
+        self._reported_copies[original] -= 1
+        if self._reported_copies[original] > 0:
+            return self._outcomes[original]
+        del self._reported_copies[original]
+        return self._outcomes.pop(original)
+
+    def confirm(self, file_id):
+        """
+        Records an in-flight document as ingested (persisted on flush).
+
+        Returns:
+            list: The copies waiting for it (see copy_of), now duplicates.
+        """
+        entry = self._release(file_id)
+        if entry is None:
+            return []
+        key, content_fingerprint = entry
+        if key:
+            self._keys.add(key)
+        self._fingerprints.add(content_fingerprint)
+        return self._settle_copies(file_id, True)
+
+    def release(self, file_id):
+        """
+        Forgets an in-flight document that could not be ingested.
+
+        Returns:
+            list: The copies waiting for it (see copy_of), which must stay pending.
+        """
+        if self._release(file_id) is None:
+            return []
+        return self._settle_copies(file_id, False)
+
+    def flush(self):
+        """Persists the ingested keys and fingerprints."""
+        self._keys.flush()
+        self._fingerprints.flush()
+
+    def _duplicate(self, description, original):
+        self.duplicates += 1
+        if original is not None:
+            self._reported_copies[original] += 1
+        return Duplicate(description, original)
+
+    def _settle_copies(self, file_id, ingested):
+        copies = self._waiting_copies.pop(file_id, [])
+        if file_id in self._reported_copies:
+            self._reported_copies[file_id] -= len(copies)
+            if self._reported_copies[file_id] > 0:
+                # Copies reported by check but not handed back yet
+                self._outcomes[file_id] = ingested
+            else:
+                del self._reported_copies[file_id]
+                self._outcomes.pop(file_id, None)
+        return copies
+
+    def _release(self, file_id):
+        entry = self._in_flight.pop(file_id, None)
+        if entry is not None:
+            key, content_fingerprint = entry
+            self._in_flight_keys.pop(key, None)
+            self._in_flight_fingerprints.pop(content_fingerprint, None)
+        return entry
+
+# endregion
@@ -0,0 +1,171 @@
+import json
+import os
+import time
+
+from .file_operation import iter_records
+
+LEDGER_FILE_NAME = 'log/failures.jsonl'
+
+# region Failure ledger
+
+class FailureLedger:
+    """
+    Ledger of documents that could not be ingested, for targeted retries.
+
+    Each failure is recorded with the file ID, path, pipeline stage, exception
+    class and message. The ledger is an append-only JSON-lines file: a later
+    entry for the same ID replaces the earlier one, and a 'resolved' entry
+    removes it. Like ProcessIndex, entries are buffered and appended in
+    batches with a single write + fsync.
+    """
+
+    def __init__(self, ledger_file_name=LEDGER_FILE_NAME, batch_size=100):
+        """
+        Args:
+            ledger_file_name (str): Path of the ledger file.
+            batch_size (int): Number of buffered entries that triggers a flush.
+        """
+        self.ledger_file_name = ledger_file_name
+        self.batch_size = batch_size
+        self._entries = {}
+        self._pending = []
+        self._lines = 0
+        self._needs_newline = False
+        self._load()
+
+    def __contains__(self, file_id):
+        return file_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def record(self, file_id, path, stage, error_type, error):
+        """
+        Records (or updates) the failure of a document.
+
+        Args:
+            file_id (str): The file ID.
+            path (str): Path of the file (or '<archive>::<member>').
+            stage (str): Pipeline stage where it failed.
+            error_type (str): Exception class name.
+            error (str): Error message.
+        """
+        previous = self._entries.get(file_id)
+        entry = {
+            'id': file_id,
+            'path': path,
+            'stage': stage,
+            'error_type': error_type,
+            'error': error,
+            'attempts': (previous['attempts'] if previous else 0) + 1,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        self._entries[file_id] = entry
+        self._append(entry)
+
+    def resolve(self, file_id):
+        """Removes a document from the ledger once it was ingested."""
+        if self._entries.pop(file_id, None) is not None:
+            self._append({'id': file_id, 'resolved': True})
+
+    def entries(self, stage=None):
+        """
+        Returns the unresolved failures.
+
+        Args:
+            stage (str): Only failures of this stage (default all).
+
+        Returns:
+            list[dict]: Ledger entries.
+        """
+        return [
+            entry for entry in self._entries.values()
+            if stage is None or entry['stage'] == stage
+        ]
+
+    def records(self, stage=None):
+        """
+        Returns the records to reprocess the unresolved failures.
+
+        Files are yielded as FileRecord; archive members are grouped by
+        archive so that every archive is streamed only once.
+
+        Args:
+            stage (str): Only failures of this stage (default all).
+
+        Returns:
+            iterator: FileRecord | ArchiveMember records for the pipeline.
+        """
+        # Snapshot now: the pipeline records and resolves entries while the
+        # records are consumed (from the reader thread)
+        return iter_records((entry['id'], entry['path']) for entry in self.entries(stage))
+
+    def flush(self):
+        """Appends the buffered entries to the ledger file and syncs it to disk."""
+        if not self._pending:
+            return
+        data = ''.join(self._pending)
+        if self._needs_newline:
+            # The last write was interrupted mid-line; never glue entries together
+            data = '\n' + data
+        with open(self.ledger_file_name, 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._needs_newline = False
+        self._pending.clear()
+
+    def compact(self):
+        """Rewrites the ledger file with only the unresolved entries."""
+        self._pending.clear()
+        tmp = self.ledger_file_name + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.ledger_file_name)
+        self._needs_newline = False
+        self._lines = len(self._entries)
+
+    def close(self):
+        """Persists pending entries, compacting the file if it is mostly resolved entries."""
+        self.flush()
+        if self._lines > 2 * len(self._entries) + 1000:
+            self.compact()
+
+    def _append(self, entry):
+        self._pending.append(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._lines += 1
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def _load(self):
+        if not os.path.exists(self.ledger_file_name):
+            directory = os.path.dirname(self.ledger_file_name)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            return
+
+        line = ''
+        with open(self.ledger_file_name, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line torn by an interrupted write
+                    continue
+                self._lines += 1
+                if entry.get('resolved'):
+                    self._entries.pop(entry['id'], None)
+                else:
+                    self._entries[entry['id']] = entry
+        self._needs_newline = bool(line) and not line.endswith('\n')
+
+# endregion
@@ -1,37 +1,277 @@
+import logging
 import os
-import pandas as pd
+import tarfile
+import zipfile
+from collections import namedtuple
+
+from .clave_acceso import decode_access_key
+from .process_index import get_process_index
 
 INDEX_FILE_NAME = 'log/process.index'
 
 # region Function Definitions for File Operations
 
-def map_directory(root_path, file_extension='.xml', index_file_name=INDEX_FILE_NAME):
+# 'modified' is True when the manifest saw the file change after it was
+# recorded, so the document replaces the version ingested before
+FileRecord = namedtuple('FileRecord', ['id', 'path', 'filename', 'modified'], defaults=(False,))
+
+# A file inside a zip/tar archive. 'path' is '<archive path>::<member name>' and
+# 'content' holds the member bytes, so the read stage never touches the disk.
+ArchiveMember = namedtuple(
+    'ArchiveMember', ['id', 'path', 'filename', 'content', 'modified'], defaults=(False,)
+)
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+ARCHIVE_MEMBER_SEPARATOR = '::'
+
+
+def is_archive(filename):
+    """Returns True if the file name has a supported archive extension."""
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def iter_archive_members(archive_path, file_extension='.xml'):
+    """
+    Streams the matching members of a zip or tar archive without extracting it.
+
+    Members are read one at a time in archive order (tar archives, compressed
+    or not, are read as a single forward stream), so memory stays bounded by
+    the largest member.
+
+    Args:
+        archive_path (str): Path of the .zip / .tar[.gz|.bz2|.xz] file.
+        file_extension (str): The member extension to filter. Default is '.xml'.
+
+    Yields:
+        ArchiveMember: One record per matching member, with its bytes.
+    """
+    def member_record(name, content):
+        filename = name.rsplit('/', 1)[-1]
+        return ArchiveMember(
+            os.path.splitext(filename)[0],
+            f'{archive_path}{ARCHIVE_MEMBER_SEPARATOR}{name}',
+            filename,
+            content,
+        )
+
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith(file_extension):
+                    yield member_record(info.filename, archive.read(info))
+        return
+
+    with tarfile.open(archive_path, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and member.name.endswith(file_extension):
+                yield member_record(member.name, archive.extractfile(member).read())
+
+
+def iter_records(entries):
+    """
+    Rebuilds pipeline records from known (file ID, path) pairs.
+
+    Files are yielded as FileRecord; archive members are grouped by archive
+    so that every archive is streamed only once. Missing archives are skipped.
+
+    Args:
+        entries (iterable[tuple]): (file_id, path) pairs, as recorded by the pipeline.
+
+    Yields:
+        FileRecord | ArchiveMember: One record per entry that still exists.
+    """
+    archives = {}
+    for file_id, path in entries:
+        if ARCHIVE_MEMBER_SEPARATOR in path:
+            archive_path = path.split(ARCHIVE_MEMBER_SEPARATOR, 1)[0]
+            archives.setdefault(archive_path, set()).add(path)
+        else:
+            yield FileRecord(file_id, path, os.path.basename(path))
+
+    for archive_path, wanted in archives.items():
+        if not os.path.exists(archive_path):
+            continue
+        for member in iter_archive_members(archive_path):
+            if member.path in wanted:
+                yield member
+
+
+def scan_directory(root_path, file_extension='.xml'):
+    """
+    Lazily walks the directory tree with os.scandir and yields matching files.
+
+    Files are yielded as soon as their directory is listed, so consumers can
+    start processing before the whole tree has been walked.
+
+    Args:
+        root_path (str): The root directory to start scanning.
+        file_extension (str | tuple): The file extension(s) to filter files. Default is '.xml'.
+
+    Yields:
+        FileRecord: Lightweight record with the file id, path and filename.
+    """
+    pending_dirs = [root_path]
+    while pending_dirs:
+        current = pending_dirs.pop()
+        try:
+            with os.scandir(current) as entries:
+                subdirs = []
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith(file_extension):
+                        yield FileRecord(os.path.splitext(entry.name)[0], entry.path, entry.name)
+        except OSError:
+            # Unreadable directory (permissions, removed while scanning)
+            continue
+        # Keep os.walk's top-down order: first subdirectory is visited next
+        pending_dirs.extend(reversed(subdirs))
+
+
+def _selected(file_id, shard=None, record_filter=None):
+    """Returns True if the file ID belongs to the shard and passes the filter."""
+    return (shard is None or file_id in shard) and (record_filter is None or record_filter(file_id))
+
+
+def _pending_members(archive_path, file_extension, process_index, modified=False,
+                     shard=None, record_filter=None, manifest=None):
+    """
+    Yields the pending members of an archive.
+
+    Members of other shards are ignored; members rejected by record_filter
+    leave the archive pending for a later run. With a manifest, every member
+    is registered (see FileManifest.expect_member) before it is yielded.
+
+    Returns:
+        str | None: 'processed' if every member was yielded or done, 'failed'
+            if the archive could not be read completely, None if the filter
+            left members out.
+    """
+    filtered = False
+    try:
+        for member in iter_archive_members(archive_path, file_extension):
+            if shard is not None and member.id not in shard:
+                continue
+            if record_filter is not None and not record_filter(member.id):
+                filtered = True
+            elif modified or member.id not in process_index:
+                if manifest is not None:
+                    manifest.expect_member(member.path)
+                yield member._replace(modified=True) if modified else member
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        logging.getLogger(__name__).error(f"{archive_path} => Error reading archive : {e}")
+        return 'failed'
+    return None if filtered else 'processed'
+
+
+def iter_pending_files(root_path, file_extension='.xml', index_file_name=INDEX_FILE_NAME,
+                       manifest=None, full_scan=False, include_archives=False,
+                       shard=None, record_filter=None):
+    """
+    Yields the files under root_path whose ID is not in the process index.
+
+    With a manifest (see FileManifest) only directories whose mtime changed
+    are listed; files modified since they were recorded are yielded even if
+    their ID was already processed, with modified=True (see
+    DedupeCache.check).
+
+    With include_archives, zip/tar archives found in the tree are streamed and
+    their pending members yielded as ArchiveMember records. With a manifest,
+    an archive is marked processed once the status of every member it yielded
+    was set (see FileManifest.archive_done).
+
+    With a shard (see Shard) only the files of that shard are yielded; with a
+    manifest the files of other shards are marked 'excluded' so later scans
+    skip them. record_filter (see access_key_filter) selects files by ID; the
+    files it rejects stay pending for later runs. Both only look at the file
+    IDs (the access keys), never at the file contents.
+
+    Args:
+        root_path (str): The root directory to start scanning.
+        file_extension (str): The file extension to filter files. Default is '.xml'.
+        index_file_name (str): The name of the index file to check IDs against.
+        manifest (FileManifest): Persisted manifest for incremental rescans.
+        full_scan (bool): With a manifest, list every directory anyway.
+        include_archives (bool): Also read the members of zip/tar archives.
+        shard (Shard): Only yield the files of this shard.
+        record_filter (callable): predicate(file_id) selecting the files to yield.
+
+    Yields:
+        FileRecord | ArchiveMember: Records of the files pending to process.
+    """
+    process_index = get_process_index(index_file_name)
+    extensions = (file_extension,) + (ARCHIVE_EXTENSIONS if include_archives else ())
+
+    if manifest is None:
+        for record in scan_directory(root_path, extensions):
+            if include_archives and is_archive(record.filename):
+                yield from _pending_members(
+                    record.path, file_extension, process_index,
+                    shard=shard, record_filter=record_filter,
+                )
+            elif record.id not in process_index and _selected(record.id, shard, record_filter):
+                yield record
+        return
+
+    for record, modified in manifest.scan(root_path, extensions, full=full_scan):
+        if include_archives and is_archive(record.filename):
+            status = yield from _pending_members(
+                record.path, file_extension, process_index, modified, shard, record_filter,
+                manifest,
+            )
+            # The archive is only marked once its members were written or failed
+            manifest.archive_done(record.path, status)
+        elif shard is not None and record.id not in shard:
+            manifest.set_status(record.path, 'excluded')
+        elif record_filter is not None and not record_filter(record.id):
+            continue
+        elif modified or record.id not in process_index:
+            yield record._replace(modified=True) if modified else record
+        else:
+            # Processed before the manifest knew about it
+            manifest.set_status(record.path, 'processed')
+
+
+def map_directory(root_path, file_extension='.xml', index_file_name=INDEX_FILE_NAME,
+                  shard=None, record_filter=None):
     """
     Maps the directory structure starting from the given root path and filters files by extension.
 
+    The access key encoded in each file ID is decoded up front, so the map
+    includes the emission date, document type, issuer RUC and environment of
+    every document without reading it (None for IDs that are not access keys).
+
     Args:
         root_path (str): The root directory to start mapping.
         file_extension (str): The file extension to filter files. Default is '.xml'.
         index_file_name (str): The name of the index file to check IDs against.
+        shard (Shard): Only map the files of this shard.
+        record_filter (callable): predicate(file_id) selecting the files to map.
 
     Returns:
         list: A list of dictionaries containing file metadata.
     """
+    process_index = get_process_index(index_file_name)
     directory_list = []
-    for root, dirs, files in os.walk(root_path):
-        for name in dirs + files:
-            if name.endswith(file_extension):
-                file_id = os.path.splitext(name)[0]
-                directory_list.append({
-                    'id': file_id,
-                    'path': os.path.join(root, name),
-                    'filename': name,
-                    'process': check_id_in_process_index(file_id, index_file_name),
-                })
+    for record in scan_directory(root_path, file_extension):
+        if not _selected(record.id, shard, record_filter):
+            continue
+        key = decode_access_key(record.id)
+        directory_list.append({
+            'id': record.id,
+            'path': record.path,
+            'filename': record.filename,
+            'process': record.id in process_index,
+            'emission_date': key.emission_date if key else None,
+            'doc_type': key.doc_type if key else None,
+            'ruc': key.ruc if key else None,
+            'environment': key.environment if key else None,
+        })
     return directory_list
 
 
-def map_directory_to_dataframe(root_path=None, file_extension='.xml', index_file_name=INDEX_FILE_NAME):
+def map_directory_to_dataframe(root_path=None, file_extension='.xml', index_file_name=INDEX_FILE_NAME,
+                               shard=None, record_filter=None):
     """
     Converts the directory structure into a pandas DataFrame.
 
@@ -39,14 +279,18 @@ def map_directory_to_dataframe(root_path=None, file_extension='.xml', index_file
         root_path (str): The root directory to start mapping. Defaults to the current working directory.
         file_extension (str): The file extension to filter files. Default is '.xml'.
         index_file_name (str): The name of the index file to check IDs against.
+        shard (Shard): Only map the files of this shard.
+        record_filter (callable): predicate(file_id) selecting the files to map.
 
     Returns:
         pd.DataFrame: A DataFrame containing file metadata.
     """
+    import pandas as pd
+
     if root_path is None:
         root_path = os.getcwd()
 
-    directory_list = map_directory(root_path, file_extension, index_file_name)
+    directory_list = map_directory(root_path, file_extension, index_file_name, shard, record_filter)
     return pd.DataFrame(directory_list)
 
 
@@ -54,6 +298,9 @@ def check_id_in_process_index(file_id, index_file_name=INDEX_FILE_NAME):
     """
     Checks if a file ID exists in the process index file.
 
+    The index file is loaded once into an in-memory set (see ProcessIndex),
+    so repeated checks do not re-read the file.
+
     Args:
         file_id (str): The file ID to check.
         index_file_name (str): The name of the index file.
@@ -61,27 +308,30 @@ def check_id_in_process_index(file_id, index_file_name=INDEX_FILE_NAME):
     Returns:
         bool: True if the ID exists in the index file, False otherwise.
     """
-    if not os.path.exists(index_file_name):
-        # Create the file if it doesn't exist and return False
-        with open(index_file_name, 'w') as f:
-            pass
-        return False
-    else:
-        # Check if the file contains the ID
-        with open(index_file_name, 'r') as f:
-            lines = f.readlines()
-        return file_id in [line.strip() for line in lines]
+    return file_id in get_process_index(index_file_name)
 
 
 def add_id_to_process_index(file_id, index_file_name=INDEX_FILE_NAME):
     """
     Adds a file ID to the process index file.
 
+    IDs are buffered and appended in batches; call flush_process_index to
+    persist them immediately.
+
     Args:
         file_id (str): The file ID to add.
         index_file_name (str): The name of the index file.
     """
-    with open(index_file_name, 'a') as f:
-        f.write(file_id + '\n')
+    get_process_index(index_file_name).add(file_id)
+
+
+def flush_process_index(index_file_name=INDEX_FILE_NAME):
+    """
+    Persists the buffered IDs of the process index file.
+
+    Args:
+        index_file_name (str): The name of the index file.
+    """
+    get_process_index(index_file_name).flush()
 
-# endregion
\ No newline at end of file
+# endregion
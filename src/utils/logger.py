@@ -1,5 +1,7 @@
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import os
+import queue
 import sys
 
 def setup_logging(log_file: str = 'data/logs/xml_processor.log'):
@@ -28,4 +30,44 @@ def setup_logging(log_file: str = 'data/logs/xml_processor.log'):
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
     
-    return logger
\ No newline at end of file
+    return logger
+
+def setup_queue_logging(name: str, log_file: str, level=logging.INFO):
+    """
+    Configura un logger cuyo manejo (formato y escritura a disco) se hace en
+    un hilo en segundo plano, de modo que registrar un mensaje sólo encola el
+    registro y no bloquea el procesamiento.
+
+    Args:
+        name: Nombre del logger.
+        log_file: Archivo de log (con rotación).
+        level: Nivel mínimo de los mensajes.
+
+    Returns:
+        tuple: (logger, listener). Llamar a listener.stop() al terminar para
+        vaciar la cola.
+    """
+    directory = os.path.dirname(log_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=1024*1024*50,  # 50MB
+        backupCount=5,
+        encoding='utf-8',
+    )
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+    listener.start()
+    return logger, listener
@@ -4,32 +4,37 @@ import time
 
 logger = logging.getLogger('log/pipelineError')
 
-def handle_errors(retries: int = 3, delay: float = 1.0):
+def handle_errors(retries: int = 3, delay: float = 1.0, backoff: float = 1.0,
+                  exceptions: tuple = (Exception,)):
     """
     Decorador para manejo robusto de errores con reintentos
     
     Args:
         retries: Número de reintentos
         delay: Tiempo de espera entre reintentos (segundos)
+        backoff: Factor por el que se multiplica la espera después de cada intento
+        exceptions: Excepciones que se reintentan; el resto se propaga de inmediato
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             last_error = None
+            wait = delay
             for attempt in range(retries):
                 try:
                     return func(*args, **kwargs)
-                except Exception as e:
+                except exceptions as e:
                     last_error = e
                     logger.warning(
                         f"Intento {attempt + 1} fallido para {func.__name__}: {str(e)}"
                     )
                     if attempt < retries - 1:
-                        time.sleep(delay)
+                        time.sleep(wait)
+                        wait *= backoff
             
             logger.error(
                 f"Todos los intentos fallaron para {func.__name__}. Último error: {str(last_error)}"
             )
             raise last_error
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
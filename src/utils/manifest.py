@@ -0,0 +1,331 @@
+import os
+import sqlite3
+import threading
+
+from .file_operation import ARCHIVE_MEMBER_SEPARATOR, FileRecord
+
+MANIFEST_FILE_NAME = 'log/manifest.sqlite'
+
+STATUS_PENDING = 'pending'
+STATUS_PROCESSED = 'processed'
+STATUS_FAILED = 'failed'
+# Files of another shard (see Shard): skipped until they change
+STATUS_EXCLUDED = 'excluded'
+# Documents of a type the pipeline does not handle: skipped until they change
+STATUS_SKIPPED = 'skipped'
+
+# region File manifest
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+"""
+
+
+class FileManifest:
+    """
+    Persisted manifest of the scanned directory tree (SQLite).
+
+    Stores every directory with its mtime and every matching file with its
+    size, mtime and processing status. A rescan stats the known directories
+    and only lists those whose mtime changed (a file was added, removed or
+    renamed in them), so startup time is proportional to what changed rather
+    than to the size of the archive.
+
+    A file rewritten in place does not change its directory's mtime; use a
+    full rescan (scan(..., full=True)) to pick up such changes.
+
+    Archives are one row each. Their members are tracked in memory from the
+    moment they are yielded (expect_member) until their outcome is set
+    (set_status with the member path): the archive keeps its pending status,
+    and is picked up again by the next scan, until every yielded member was
+    written or recorded as failed.
+
+    A read-only manifest behaves the same but never persists anything: its
+    changes stay in one transaction that is rolled back on close, so a dry
+    run does not consume the new/modified state the next real run relies on.
+    """
+
+    def __init__(self, db_path=MANIFEST_FILE_NAME, batch_size=500, read_only=False):
+        """
+        Args:
+            db_path (str): Path of the SQLite database.
+            batch_size (int): Number of buffered status updates that triggers a flush.
+            read_only (bool): Roll back every change on close; a missing
+                database is not created (an empty in-memory one is used).
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.read_only = read_only
+        self.stats = {'listed_dirs': 0, 'skipped_dirs': 0, 'new': 0, 'modified': 0, 'removed': 0}
+        # The scan runs in the reader thread while statuses are set from the
+        # main loop, so the connection is shared behind a lock
+        self._lock = threading.Lock()
+        if read_only and not os.path.exists(db_path):
+            self._conn = sqlite3.connect(':memory:', check_same_thread=False)
+        else:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            if not read_only:
+                self._conn.execute('PRAGMA journal_mode=WAL')
+                self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._pending_status = {}
+        # archive path -> [members awaiting an outcome, any member failed,
+        #                  status once every member was yielded (see archive_done)]
+        self._archives = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def scan(self, root_path, file_extension='.xml', full=False):
+        """
+        Yields the files under root_path that are new, modified or not yet done.
+
+        Files left pending by an interrupted run are yielded first, then the
+        tree is walked, listing only directories whose mtime changed.
+
+        Args:
+            root_path (str): The root directory to scan.
+            file_extension (str): The file extension to filter files.
+            full (bool): List every directory regardless of its mtime.
+
+        Yields:
+            tuple: (FileRecord, modified) where modified is True for files whose
+                size or mtime changed since they were recorded.
+        """
+        root_path = os.path.normpath(root_path)
+        yielded = set()
+        with self._lock:
+            pending = self._conn.execute(
+                'SELECT path, id FROM files WHERE status = ? AND '
+                '(directory = ? OR substr(directory, 1, ?) = ?)',
+                (STATUS_PENDING, root_path, len(root_path) + 1, root_path + os.sep),
+            ).fetchall()
+            known_dirs = {}
+            children = {}
+            for path, parent, mtime_ns in self._conn.execute(
+                'SELECT path, parent, mtime_ns FROM directories'
+            ):
+                known_dirs[path] = mtime_ns
+                children.setdefault(parent, []).append(path)
+
+        for path, file_id in pending:
+            if path.endswith(file_extension) and os.path.exists(path):
+                yielded.add(path)
+                yield FileRecord(file_id, path, os.path.basename(path)), False
+
+        pending_dirs = [root_path]
+        while pending_dirs:
+            current = pending_dirs.pop()
+            try:
+                mtime_ns = os.stat(current).st_mtime_ns
+            except OSError:
+                self._forget_directory(current)
+                continue
+
+            if not full and known_dirs.get(current) == mtime_ns:
+                self.stats['skipped_dirs'] += 1
+                pending_dirs.extend(sorted(children.get(current, ()), reverse=True))
+                continue
+
+            self.stats['listed_dirs'] += 1
+            try:
+                subdirs, changes = self._list_directory(
+                    current, file_extension, children.get(current, ()), mtime_ns
+                )
+            except OSError:
+                # Unreadable directory (permissions, removed while scanning)
+                continue
+            for record, modified in changes:
+                if record.path not in yielded:
+                    yield record, modified
+            pending_dirs.extend(reversed(subdirs))
+        self.flush()
+
+    def _list_directory(self, current, file_extension, known_subdirs, mtime_ns):
+        """Lists a directory and reconciles it with the manifest."""
+        subdirs = []
+        found = {}
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith(file_extension):
+                    stat = entry.stat(follow_symlinks=False)
+                    found[entry.path] = (entry.name, stat.st_size, stat.st_mtime_ns)
+
+        changes = []
+        with self._lock:
+            recorded = {
+                path: (size, file_mtime, status)
+                for path, size, file_mtime, status in self._conn.execute(
+                    'SELECT path, size, mtime_ns, status FROM files WHERE directory = ?',
+                    (current,),
+                )
+            }
+            upserts = []
+            for path, (name, size, file_mtime) in found.items():
+                record = FileRecord(os.path.splitext(name)[0], path, name)
+                previous = recorded.get(path)
+                if previous is None:
+                    self.stats['new'] += 1
+                    upserts.append((path, current, record.id, size, file_mtime, STATUS_PENDING))
+                    changes.append((record, False))
+                elif previous[:2] != (size, file_mtime):
+                    self.stats['modified'] += 1
+                    upserts.append((path, current, record.id, size, file_mtime, STATUS_PENDING))
+                    changes.append((record, True))
+                elif previous[2] == STATUS_PENDING:
+                    changes.append((record, False))
+            self._conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', upserts)
+
+            removed = [(path,) for path in recorded if path not in found]
+            self.stats['removed'] += len(removed)
+            self._conn.executemany('DELETE FROM files WHERE path = ?', removed)
+
+            # The mtime read before listing is stored, so changes made while
+            # listing are picked up by the next scan
+            self._conn.execute(
+                'INSERT OR REPLACE INTO directories VALUES (?, ?, ?)',
+                (current, os.path.dirname(current), mtime_ns),
+            )
+            self._commit()
+
+        current_subdirs = set(subdirs)
+        for path in known_subdirs:
+            if path not in current_subdirs:
+                self._forget_directory(path)
+        return subdirs, changes
+
+    def _forget_directory(self, path):
+        """Removes a directory, its subdirectories and their files from the manifest."""
+        prefix = path + os.sep
+        with self._lock:
+            for table, column in (('directories', 'path'), ('files', 'directory')):
+                self._conn.execute(
+                    f'DELETE FROM {table} WHERE {column} = ? OR substr({column}, 1, ?) = ?',
+                    (path, len(prefix), prefix),
+                )
+            self._commit()
+
+    def set_status(self, path, status):
+        """
+        Records the processing status of a file. Persisted on the next flush.
+
+        The status of an archive member settles that member only; its archive
+        gets a status once all its members have one (see archive_done).
+
+        Args:
+            path (str): Path of the file (or archive member), as yielded by scan.
+            status (str): STATUS_PROCESSED, STATUS_FAILED, STATUS_EXCLUDED,
+                STATUS_SKIPPED or STATUS_PENDING.
+        """
+        with self._lock:
+            if ARCHIVE_MEMBER_SEPARATOR in path:
+                self._settle_member(path, status)
+            else:
+                self._pending_status[path] = status
+            if len(self._pending_status) < self.batch_size:
+                return
+        self.flush()
+
+    def expect_member(self, member_path):
+        """
+        Registers an archive member that is about to be processed.
+
+        Args:
+            member_path (str): '<archive path>::<member name>' (see ArchiveMember).
+        """
+        archive_path = member_path.split(ARCHIVE_MEMBER_SEPARATOR, 1)[0]
+        with self._lock:
+            state = self._archives.setdefault(archive_path, [set(), False, None])
+            state[0].add(member_path)
+
+    def archive_done(self, archive_path, status):
+        """
+        Records that every pending member of an archive was yielded.
+
+        The archive gets `status` once the outcome of all its expected members
+        is known (STATUS_FAILED instead if any of them failed); with status
+        None it stays pending.
+
+        Args:
+            archive_path (str): Path of the archive.
+            status (str | None): STATUS_PROCESSED, STATUS_FAILED or None.
+        """
+        with self._lock:
+            state = self._archives.setdefault(archive_path, [set(), False, None])
+            if status is None:
+                # Members were left out (filtered): the archive stays pending
+                del self._archives[archive_path]
+                return
+            state[2] = status
+            self._settle_archive(archive_path)
+
+    def _settle_member(self, member_path, status):
+        archive_path = member_path.split(ARCHIVE_MEMBER_SEPARATOR, 1)[0]
+        state = self._archives.get(archive_path)
+        if state is None:
+            return  # e.g. a member retried from the failure ledger
+        state[0].discard(member_path)
+        if status == STATUS_FAILED:
+            state[1] = True
+        self._settle_archive(archive_path)
+
+    def _settle_archive(self, archive_path):
+        expected, failed, status = self._archives[archive_path]
+        if status is None or expected:
+            return
+        del self._archives[archive_path]
+        self._pending_status[archive_path] = STATUS_FAILED if failed else status
+
+    def counts(self):
+        """Returns the number of files per status."""
+        with self._lock:
+            return dict(self._conn.execute('SELECT status, COUNT(*) FROM files GROUP BY status'))
+
+    def flush(self):
+        """Persists the buffered status updates."""
+        with self._lock:
+            if not self._pending_status:
+                return
+            self._conn.executemany(
+                'UPDATE files SET status = ? WHERE path = ?',
+                [(status, path) for path, status in self._pending_status.items()],
+            )
+            self._commit()
+            self._pending_status.clear()
+
+    def close(self):
+        """Flushes pending updates and closes the database."""
+        self.flush()
+        with self._lock:
+            if self.read_only:
+                self._conn.rollback()
+            self._conn.close()
+
+    def _commit(self):
+        if not self.read_only:
+            self._conn.commit()
+
+# endregion
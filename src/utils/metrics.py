@@ -0,0 +1,248 @@
+import bisect
+import heapq
+import json
+import math
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Límites superiores (en segundos) de los buckets de los histogramas de latencia
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf,
+)
+
+
+class Histograma:
+    """Histograma de latencias con buckets fijos (acumulables entre procesos)."""
+
+    __slots__ = ("conteos", "total", "suma", "maximo")
+
+    def __init__(self):
+        self.conteos = [0] * len(BUCKETS)
+        self.total = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def observar(self, segundos: float):
+        self.conteos[bisect.bisect_left(BUCKETS, segundos)] += 1
+        self.total += 1
+        self.suma += segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def percentil(self, p: float) -> float:
+        """
+        Percentil aproximado, interpolado linealmente dentro del bucket que lo contiene.
+
+        Como en histogram_quantile de Prometheus, se asume que las observaciones
+        de un bucket se reparten uniformemente entre sus límites (el superior
+        acotado por el máximo observado).
+        """
+        if not self.total:
+            return 0.0
+        objetivo = p / 100 * self.total
+        acumulado, inferior = 0, 0.0
+        for limite, conteo in zip(BUCKETS, self.conteos):
+            if conteo and acumulado + conteo >= objetivo:
+                superior = min(limite, self.maximo)
+                return inferior + (superior - inferior) * (objetivo - acumulado) / conteo
+            acumulado += conteo
+            inferior = limite
+        return self.maximo
+
+    def resumen(self) -> dict:
+        return {
+            "conteo": self.total,
+            "media_ms": round(self.suma / self.total * 1000, 3) if self.total else 0.0,
+            "p50_ms": round(self.percentil(50) * 1000, 3),
+            "p99_ms": round(self.percentil(99) * 1000, 3),
+            "max_ms": round(self.maximo * 1000, 3),
+        }
+
+
+class MetricasPipeline:
+    """
+    Métricas del pipeline: tiempos por etapa, documentos por segundo, errores
+    por etapa y tipo de excepción, duplicados omitidos, documentos por modo de
+    validación y los N documentos más lentos.
+
+    Los tiempos de las etapas que corren en procesos trabajadores llegan en el
+    resultado de cada documento y se registran aquí, en el proceso principal.
+    """
+
+    def __init__(self, top_n=10, intervalo=30.0, ruta_json=None, ruta_prometheus=None):
+        """
+        Args:
+            top_n (int): Cantidad de documentos más lentos a conservar.
+            intervalo (float): Segundos entre resúmenes periódicos.
+            ruta_json (str): Archivo donde escribir el resumen en JSON.
+            ruta_prometheus (str): Archivo donde escribir las métricas en formato Prometheus.
+        """
+        self.top_n = top_n
+        self.intervalo = intervalo
+        self.ruta_json = ruta_json
+        self.ruta_prometheus = ruta_prometheus
+        self.etapas = {}
+        self.errores = Counter()
+        self.validaciones = Counter()
+        self.documentos = 0
+        self.documentos_ok = 0
+        self.duplicados = 0
+        self._mas_lentos = []
+        self._inicio = time.monotonic()
+        self._ultimo_resumen = self._inicio
+
+    def observar(self, etapa: str, segundos: float):
+        """Registra la duración de una etapa."""
+        histograma = self.etapas.get(etapa)
+        if histograma is None:
+            histograma = self.etapas[etapa] = Histograma()
+        histograma.observar(segundos)
+
+    @contextmanager
+    def medir(self, etapa: str):
+        """Mide la duración del bloque como una observación de la etapa."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(etapa, time.perf_counter() - inicio)
+
+    def registrar_error(self, etapa: str, tipo_error: str):
+        """Cuenta un error por etapa y tipo de excepción."""
+        self.errores[(etapa, tipo_error)] += 1
+
+    def registrar_documento(self, identifier: str, tiempos: dict, ok: bool = True,
+                            etapa_error: str = None, tipo_error: str = None,
+                            validacion: str = None, duplicado: bool = False):
+        """
+        Registra un documento procesado con los tiempos de sus etapas.
+
+        Args:
+            identifier (str): Identificador del documento.
+            tiempos (dict): Segundos por etapa.
+            ok (bool): Si el documento se procesó sin errores.
+            etapa_error (str): Etapa donde falló.
+            tipo_error (str): Nombre de la excepción.
+            validacion (str): Modo de validación (completa, rapida o respaldo).
+            duplicado (bool): Si se omitió por duplicado (no cuenta como error).
+        """
+        self.documentos += 1
+        if validacion is not None:
+            self.validaciones[validacion] += 1
+        total = 0.0
+        for etapa, segundos in tiempos.items():
+            self.observar(etapa, segundos)
+            total += segundos
+        self.observar("documento", total)
+        if ok:
+            self.documentos_ok += 1
+        elif duplicado:
+            self.duplicados += 1
+        else:
+            self.registrar_error(etapa_error or "desconocida", tipo_error or "Exception")
+
+        entrada = (total, identifier)
+        if len(self._mas_lentos) < self.top_n:
+            heapq.heappush(self._mas_lentos, entrada)
+        elif entrada > self._mas_lentos[0]:
+            heapq.heapreplace(self._mas_lentos, entrada)
+
+    def docs_por_segundo(self) -> float:
+        transcurrido = time.monotonic() - self._inicio
+        return self.documentos / transcurrido if transcurrido > 0 else 0.0
+
+    def resumen(self) -> dict:
+        """Retorna todas las métricas como diccionario."""
+        return {
+            "documentos": self.documentos,
+            "documentos_ok": self.documentos_ok,
+            "duplicados": self.duplicados,
+            "docs_por_segundo": round(self.docs_por_segundo(), 2),
+            "segundos": round(time.monotonic() - self._inicio, 2),
+            "etapas": {etapa: h.resumen() for etapa, h in self.etapas.items()},
+            "validaciones": dict(self.validaciones),
+            "errores": [
+                {"etapa": etapa, "tipo": tipo, "conteo": conteo}
+                for (etapa, tipo), conteo in self.errores.most_common()
+            ],
+            "mas_lentos": [
+                {"id": identifier, "ms": round(total * 1000, 3)}
+                for total, identifier in sorted(self._mas_lentos, reverse=True)
+            ],
+        }
+
+    def resumen_texto(self) -> str:
+        """Resumen corto en una línea por etapa, para el log."""
+        lineas = [
+            f"{self.documentos} documentos ({self.documentos_ok} ok, "
+            f"{self.duplicados} duplicados) - "
+            f"{self.docs_por_segundo():.1f} docs/s"
+        ]
+        for etapa, h in self.etapas.items():
+            r = h.resumen()
+            lineas.append(
+                f"  {etapa:<14} n={r['conteo']:<8} media={r['media_ms']}ms "
+                f"p50={r['p50_ms']}ms p99={r['p99_ms']}ms max={r['max_ms']}ms"
+            )
+        if self.validaciones:
+            modos = ", ".join(f"{modo}={conteo}" for modo, conteo in self.validaciones.items())
+            lineas.append(f"  modos de validacion: {modos}")
+        for (etapa, tipo), conteo in self.errores.most_common():
+            lineas.append(f"  error {etapa}/{tipo}: {conteo}")
+        return "\n".join(lineas)
+
+    def formato_prometheus(self) -> str:
+        """Métricas en el formato de texto de Prometheus."""
+        lineas = [
+            "# TYPE tfm_documentos_total counter",
+            f"tfm_documentos_total {self.documentos}",
+            f'tfm_documentos_total{{resultado="ok"}} {self.documentos_ok}',
+            f'tfm_documentos_total{{resultado="duplicado"}} {self.duplicados}',
+            "# TYPE tfm_docs_por_segundo gauge",
+            f"tfm_docs_por_segundo {self.docs_por_segundo():.3f}",
+            "# TYPE tfm_errores_total counter",
+        ]
+        for (etapa, tipo), conteo in self.errores.items():
+            lineas.append(f'tfm_errores_total{{etapa="{etapa}",tipo="{tipo}"}} {conteo}')
+        lineas.append("# TYPE tfm_validaciones_total counter")
+        for modo, conteo in self.validaciones.items():
+            lineas.append(f'tfm_validaciones_total{{modo="{modo}"}} {conteo}')
+        lineas.append("# TYPE tfm_etapa_segundos histogram")
+        for etapa, h in self.etapas.items():
+            acumulado = 0
+            for limite, conteo in zip(BUCKETS, h.conteos):
+                acumulado += conteo
+                le = "+Inf" if math.isinf(limite) else repr(limite)
+                lineas.append(f'tfm_etapa_segundos_bucket{{etapa="{etapa}",le="{le}"}} {acumulado}')
+            lineas.append(f'tfm_etapa_segundos_sum{{etapa="{etapa}"}} {h.suma:.6f}')
+            lineas.append(f'tfm_etapa_segundos_count{{etapa="{etapa}"}} {h.total}')
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self):
+        """Escribe los archivos JSON y/o Prometheus configurados."""
+        if self.ruta_json:
+            _escribir_atomico(self.ruta_json, json.dumps(self.resumen(), indent=2, ensure_ascii=False))
+        if self.ruta_prometheus:
+            _escribir_atomico(self.ruta_prometheus, self.formato_prometheus())
+
+    def tal_vez_emitir(self, logger, forzar=False):
+        """Emite el resumen al log y a los archivos si pasó el intervalo configurado."""
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo_resumen < self.intervalo:
+            return
+        self._ultimo_resumen = ahora
+        logger.info("Métricas del pipeline\n" + self.resumen_texto())
+        self.exportar()
+
+
+def _escribir_atomico(ruta, contenido):
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    os.replace(tmp, ruta)
@@ -0,0 +1,236 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import pandas as pd
+
+from .mongo_store import get_mongo_collection
+from .parquet_store import TABLAS
+
+# region Tipos de las columnas
+#
+# Las tablas tienen las mismas columnas que las del dataset Parquet
+# (parquet_store.TABLAS), así que un análisis sirve para ambas fuentes.
+
+try:
+    import pyarrow  # noqa: F401
+
+    # Texto respaldado por Arrow: mucho menos memoria que objetos str de Python
+    _TEXTO_PANDAS = "string[pyarrow]"
+except ImportError:
+    _TEXTO_PANDAS = "string"
+
+# Tipo de pandas de cada tipo de columna de TABLAS (fechaEmision, la única
+# fecha, se convierte desde el formato del SRI en _tipar)
+TIPOS_PANDAS = {
+    "string": _TEXTO_PANDAS,
+    "float64": "float64",
+    "int32": "int32",
+}
+
+# Columnas de texto con pocos valores distintos: se cargan como categorías
+CATEGORICAS = frozenset({
+    "ambiente",
+    "codigoDocumento",
+    "establecimiento",
+    "puntoEmisor",
+    "moneda",
+    "unidadMedida",
+    "formaPago",
+})
+
+# Columnas que no salen del propio elemento (cabecera, detalle o pago)
+_COLUMNAS_DOCUMENTO = ("claveAcceso", "fechaEmision", "linea")
+
+# endregion
+
+
+def _columnas_solicitadas(columnas) -> dict:
+    """Valida las columnas pedidas por tabla (por defecto todas las de todas las tablas)."""
+    if columnas is None:
+        return {tabla: [nombre for nombre, _ in definicion] for tabla, definicion in TABLAS.items()}
+    solicitadas = {}
+    for tabla, nombres in columnas.items():
+        if tabla not in TABLAS:
+            raise ValueError(f"Tabla desconocida: {tabla} (se espera una de {list(TABLAS)})")
+        disponibles = [nombre for nombre, _ in TABLAS[tabla]]
+        if nombres is None:
+            nombres = disponibles
+        desconocidas = set(nombres) - set(disponibles)
+        if desconocidas:
+            raise ValueError(f"Columnas desconocidas en {tabla}: {sorted(desconocidas)}")
+        # claveAcceso siempre, para relacionar las tablas
+        solicitadas[tabla] = [n for n in disponibles if n == "claveAcceso" or n in nombres]
+    return solicitadas
+
+
+def _pipeline(tabla: str, columnas: list, filtro: dict) -> list:
+    """
+    Agregación que entrega las filas planas de una tabla con sólo las columnas pedidas.
+
+    Los detalles y pagos se desanidan en el servidor ($unwind), así que el
+    cliente sólo recibe los campos que va a cargar.
+    """
+    etapas = [{"$match": filtro}] if filtro else []
+    propias = [nombre for nombre in columnas if nombre not in _COLUMNAS_DOCUMENTO]
+    salida = {"_id": 0, "claveAcceso": "$_id"}
+    if "fechaEmision" in columnas:
+        salida["fechaEmision"] = 1
+
+    if tabla == "facturas":
+        salida.update((nombre, 1) for nombre in propias)
+        return etapas + [{"$project": salida}]
+
+    # Proyección previa: el $unwind sólo copia los campos pedidos de cada elemento
+    previa = {"fechaEmision": 1}
+    if propias:
+        previa.update((f"{tabla}.{nombre}", 1) for nombre in propias)
+    else:
+        previa[tabla] = 1
+    if "linea" in columnas:
+        salida["linea"] = {"$add": ["$linea", 1]}
+    salida.update((nombre, f"${tabla}.{nombre}") for nombre in propias)
+    return etapas + [
+        {"$project": previa},
+        {"$unwind": {"path": f"${tabla}", "includeArrayIndex": "linea"}},
+        {"$project": salida},
+    ]
+
+
+def _tipar(df: pd.DataFrame, tabla: str, categoricas) -> pd.DataFrame:
+    """Convierte las columnas de un bloque a sus tipos de pandas."""
+    tipos = dict(TABLAS[tabla])
+    for nombre in df.columns:
+        if nombre == "fechaEmision":
+            # Formato del SRI (dd/mm/aaaa), convertido en bloque
+            df[nombre] = pd.to_datetime(df[nombre], format="%d/%m/%Y", errors="coerce")
+        elif nombre in categoricas:
+            df[nombre] = df[nombre].astype("category")
+        else:
+            df[nombre] = df[nombre].astype(TIPOS_PANDAS[tipos[nombre]])
+    return df
+
+
+def _cargar_bloques(coleccion, tabla, columnas, filtro, batch_size, tamano_bloque, categoricas):
+    """
+    Lee una tabla (o un rango de `_id` de ella) en DataFrames tipados de hasta
+    `tamano_bloque` filas, de modo que nunca se acumulan todos los documentos
+    del cursor como diccionarios.
+    """
+    cursor = coleccion.aggregate(
+        _pipeline(tabla, columnas, filtro), batchSize=batch_size, allowDiskUse=True
+    )
+    partes = []
+    with cursor:
+        while True:
+            bloque = list(islice(cursor, tamano_bloque))
+            if not bloque:
+                return partes
+            df = pd.DataFrame.from_records(bloque, columns=columnas)
+            partes.append(_tipar(df, tabla, categoricas))
+
+
+def _concatenar(partes, tabla, columnas, categoricas) -> pd.DataFrame:
+    """Une los bloques de una tabla conservando los tipos (y las categorías)."""
+    if not partes:
+        return _tipar(pd.DataFrame({nombre: [] for nombre in columnas}), tabla, categoricas)
+    # Con categorías distintas pandas convertiría la columna a object: se unifican antes
+    for nombre in columnas:
+        if nombre in categoricas and nombre != "fechaEmision":
+            categorias = pd.api.types.union_categoricals(
+                [parte[nombre] for parte in partes]
+            ).categories
+            for parte in partes:
+                parte[nombre] = parte[nombre].cat.set_categories(categorias)
+    return pd.concat(partes, ignore_index=True)
+
+
+def rangos_id(coleccion, filtro=None, particiones=1) -> list:
+    """
+    Divide los documentos en rangos de `_id` de tamaño similar ($bucketAuto).
+
+    Args:
+        coleccion: Colección de facturas.
+        filtro (dict): Consulta que deben cumplir los documentos.
+        particiones (int): Cantidad de rangos.
+
+    Returns:
+        list[dict | None]: Condiciones sobre `_id`, en orden; [None] si no se divide.
+    """
+    if particiones <= 1:
+        return [None]
+    etapas = [{"$match": filtro}] if filtro else []
+    etapas += [
+        {"$project": {"_id": 1}},
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": particiones}},
+    ]
+    limites = [bucket["_id"] for bucket in coleccion.aggregate(etapas, allowDiskUse=True)]
+    rangos = []
+    for i, limite in enumerate(limites):
+        # El máximo de cada bucket es el mínimo del siguiente; el último lo incluye
+        operador = "$lte" if i == len(limites) - 1 else "$lt"
+        rangos.append({"$gte": limite["min"], operador: limite["max"]})
+    return rangos or [None]
+
+
+def cargar_facturas(filtro=None, columnas=None, particiones=1, batch_size=10000,
+                    tamano_bloque=100000, categoricas=CATEGORICAS, coleccion=None) -> dict:
+    """
+    Carga las facturas ingeridas en DataFrames de pandas para su análisis.
+
+    Cada tabla se lee con una agregación que proyecta en el servidor sólo las
+    columnas pedidas y se convierte a DataFrames tipados por bloques, en lugar
+    de traer documentos completos y armar las filas una a una. Con
+    `particiones > 1` la colección se divide en rangos de `_id` que se leen en
+    paralelo (hilos, cada uno con su cursor); conviene cuando el servidor o la
+    red son el cuello de botella.
+
+    Args:
+        filtro (dict): Consulta de MongoDB sobre los documentos (p. ej.
+            {"establecimiento": "001"}).
+        columnas (dict): Columnas por tabla ('facturas', 'detalles', 'pagos'),
+            p. ej. {"facturas": ["importeTotal"], "pagos": None}; None en una
+            tabla pide todas sus columnas y las tablas ausentes no se cargan.
+            Por defecto todas las columnas de todas las tablas. 'claveAcceso'
+            se incluye siempre.
+        particiones (int): Rangos de `_id` leídos en paralelo.
+        batch_size (int): Documentos por lote del cursor.
+        tamano_bloque (int): Filas convertidas a DataFrame de una vez.
+        categoricas (set): Columnas de texto que se cargan como categorías.
+        coleccion: Colección de facturas. Por defecto la configurada en el .env.
+
+    Returns:
+        dict[str, pandas.DataFrame]: Un DataFrame por tabla pedida (los rangos de
+            `_id` en orden, sin ordenar las filas dentro de cada rango).
+    """
+    coleccion = coleccion if coleccion is not None else get_mongo_collection()
+    solicitadas = _columnas_solicitadas(columnas)
+    rangos = rangos_id(coleccion, filtro, particiones)
+
+    def filtro_rango(rango):
+        if rango is None:
+            return filtro
+        condicion = {"_id": rango}
+        return {"$and": [filtro, condicion]} if filtro else condicion
+
+    tareas = [
+        (tabla, cols, filtro_rango(rango))
+        for tabla, cols in solicitadas.items()
+        for rango in rangos
+    ]
+
+    def cargar(tarea):
+        return _cargar_bloques(coleccion, *tarea, batch_size, tamano_bloque, categoricas)
+
+    if particiones <= 1:
+        bloques = [cargar(tarea) for tarea in tareas]
+    else:
+        with ThreadPoolExecutor(max_workers=particiones) as pool:
+            bloques = list(pool.map(cargar, tareas))
+
+    partes = {tabla: [] for tabla in solicitadas}
+    for (tabla, _, _), partes_tarea in zip(tareas, bloques):
+        partes[tabla].extend(partes_tarea)
+    return {
+        tabla: _concatenar(partes[tabla], tabla, cols, categoricas)
+        for tabla, cols in solicitadas.items()
+    }
@@ -0,0 +1,228 @@
+import logging
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from .clave_acceso import decode_access_key
+
+logger = logging.getLogger(__name__)
+
+# region Especificación de índices y rollups
+#
+# Los rollups son colecciones con totales pre-agregados por período ('dia'
+# AAAA-MM-DD y 'mes' AAAA-MM) y dimensión. Cada grupo es un documento cuyo
+# `_id` es {'periodo', 'fecha', <dimensiones>...}; las dimensiones también se
+# guardan como campos para que las consultas usen los índices.
+
+# Medidas sumadas por documento (además de 'documentos', el conteo)
+MEDIDAS_DOCUMENTO = ("importeTotal", "totalSinImpuestos", "totalDescuento", "totalConImpuestos")
+
+# rollup -> (dimensiones del grupo, unidad agregada: 'documento' o 'pago')
+ROLLUPS = {
+    "por_emisor": (("ruc",), "documento"),
+    "por_establecimiento": (("ruc", "establecimiento"), "documento"),
+    "por_forma_pago": (("formaPago",), "pago"),
+}
+
+# período -> largo del prefijo de la fecha AAAA-MM-DD
+PERIODOS = {"dia": 10, "mes": 7}
+
+# Índices secundarios de la colección de facturas para las consultas de los tableros
+INDICES_FACTURAS = [
+    IndexModel([("fechaEmision", ASCENDING)]),
+    IndexModel([("establecimiento", ASCENDING)]),
+    IndexModel([("pagos.formaPago", ASCENDING)]),
+    IndexModel([("detalles.codigoPrincipal", ASCENDING)]),
+]
+
+# Campos de la factura que intervienen en los rollups (proyección de las lecturas)
+CAMPOS_ROLLUP = ("fechaEmision", "establecimiento", "pagos") + MEDIDAS_DOCUMENTO
+
+# endregion
+
+
+def nombre_rollup(coleccion, rollup: str) -> str:
+    """Nombre de la colección de un rollup, p. ej. 'invoice_collection_por_emisor'."""
+    return f"{coleccion.name}_{rollup}"
+
+
+def indices_rollup(rollup: str) -> list:
+    """Índices de la colección de un rollup: por período y fecha, y por dimensiones."""
+    dimensiones, _ = ROLLUPS[rollup]
+    return [
+        IndexModel([("periodo", ASCENDING), ("fecha", ASCENDING)]),
+        IndexModel(
+            [(dimension, ASCENDING) for dimension in dimensiones]
+            + [("periodo", ASCENDING), ("fecha", ASCENDING)]
+        ),
+    ]
+
+
+def _fecha_iso(fecha_emision):
+    """Convierte 'dd/mm/aaaa' (formato del SRI) a 'aaaa-mm-dd'; None si no es válida."""
+    if not isinstance(fecha_emision, str) or len(fecha_emision) != 10:
+        return None
+    dia, mes, anio = fecha_emision[0:2], fecha_emision[3:5], fecha_emision[6:10]
+    if not (dia + mes + anio).isdigit():
+        return None
+    return f"{anio}-{mes}-{dia}"
+
+
+def aportes(doc: dict):
+    """
+    Aporte de un documento a cada grupo de los rollups.
+
+    Los documentos sin claveAcceso o fecha de emisión válidas no aportan.
+
+    Yields:
+        tuple: (rollup, _id del grupo, medidas).
+    """
+    clave = decode_access_key(str(doc.get("_id", "")))
+    fecha = _fecha_iso(doc.get("fechaEmision"))
+    if clave is None or fecha is None:
+        return
+    valores = {"ruc": clave.ruc, "establecimiento": doc.get("establecimiento")}
+    medidas = {"documentos": 1}
+    for medida in MEDIDAS_DOCUMENTO:
+        medidas[medida] = doc.get(medida) or 0.0
+
+    for periodo, largo in PERIODOS.items():
+        for rollup, (dimensiones, unidad) in ROLLUPS.items():
+            grupo = {"periodo": periodo, "fecha": fecha[:largo]}
+            if unidad == "documento":
+                grupo.update((dimension, valores[dimension]) for dimension in dimensiones)
+                yield rollup, grupo, medidas
+                continue
+            for pago in doc.get("pagos") or []:
+                yield (
+                    rollup,
+                    {**grupo, "formaPago": pago.get("formaPago")},
+                    {"pagos": 1, "total": pago.get("total") or 0.0},
+                )
+
+
+def calcular_deltas(escritos, previos: dict) -> dict:
+    """
+    Calcula cuánto cambia cada grupo de los rollups al escribir un lote.
+
+    Cada documento suma su aporte y resta el de la versión que reemplaza, así
+    que reingresar un documento sin cambios no modifica los rollups y uno
+    corregido sólo mueve la diferencia (incluso entre grupos, p. ej. si cambió
+    la fecha de emisión).
+
+    Args:
+        escritos (iterable[dict]): Documentos escritos, en orden.
+        previos (dict): Versión anterior por `_id` de los que ya existían
+            (se actualiza con los escritos).
+
+    Returns:
+        dict: {(rollup, grupo como tupla): {medida: delta}} sin los grupos sin cambios.
+    """
+    deltas = {}
+    for doc in escritos:
+        anterior = previos.get(doc.get("_id"))
+        for signo, version in ((1, doc), (-1, anterior)):
+            if version is None:
+                continue
+            for rollup, grupo, medidas in aportes(version):
+                acumulado = deltas.setdefault((rollup, tuple(grupo.items())), {})
+                for medida, valor in medidas.items():
+                    acumulado[medida] = acumulado.get(medida, 0) + signo * valor
+        previos[doc.get("_id")] = doc
+
+    resultado = {}
+    for clave, medidas in deltas.items():
+        # Redondeo: las sumas y restas de float dejan residuos en grupos sin cambios
+        medidas = {medida: round(valor, 6) for medida, valor in medidas.items()}
+        if any(medidas.values()):
+            resultado[clave] = medidas
+    return resultado
+
+
+def operaciones_rollup(deltas: dict) -> dict:
+    """
+    Convierte los deltas en upserts con $inc agrupados por rollup.
+
+    Returns:
+        dict: {rollup: [UpdateOne, ...]}.
+    """
+    operaciones = {}
+    for (rollup, grupo), medidas in deltas.items():
+        grupo = dict(grupo)
+        operaciones.setdefault(rollup, []).append(
+            UpdateOne({"_id": grupo}, {"$inc": medidas, "$setOnInsert": grupo}, upsert=True)
+        )
+    return operaciones
+
+
+def _pipeline_reconstruccion(destino: str, rollup: str, periodo: str) -> list:
+    """Agregación que recalcula un rollup y período desde la colección de facturas."""
+    dimensiones, unidad = ROLLUPS[rollup]
+    fecha_iso = {
+        "$concat": [
+            {"$substrCP": ["$fechaEmision", 6, 4]}, "-",
+            {"$substrCP": ["$fechaEmision", 3, 2]}, "-",
+            {"$substrCP": ["$fechaEmision", 0, 2]},
+        ]
+    }
+    etapas = [
+        {"$match": {
+            "_id": {"$regex": "^[0-9]{49}$"},
+            "fechaEmision": {"$regex": "^[0-9]{2}/[0-9]{2}/[0-9]{4}$"},
+        }},
+        {"$project": {
+            "ruc": {"$substrCP": ["$_id", 10, 13]},
+            "fecha": {"$substrCP": [fecha_iso, 0, PERIODOS[periodo]]},
+            "establecimiento": 1,
+            "pagos": 1,
+            **{medida: 1 for medida in MEDIDAS_DOCUMENTO},
+        }},
+    ]
+    if unidad == "pago":
+        etapas.append({"$unwind": "$pagos"})
+        valores = {"formaPago": "$pagos.formaPago"}
+        medidas = {
+            "pagos": {"$sum": 1},
+            "total": {"$sum": {"$ifNull": ["$pagos.total", 0]}},
+        }
+    else:
+        valores = {"ruc": "$ruc", "establecimiento": "$establecimiento"}
+        medidas = {"documentos": {"$sum": 1}}
+        for medida in MEDIDAS_DOCUMENTO:
+            medidas[medida] = {"$sum": {"$ifNull": [f"${medida}", 0]}}
+
+    # Mismo orden de campos del _id que en aportes
+    grupo = {"periodo": {"$literal": periodo}, "fecha": "$fecha"}
+    grupo.update((dimension, valores[dimension]) for dimension in dimensiones)
+    etapas += [
+        {"$group": {"_id": grupo, **medidas}},
+        {"$addFields": {campo: f"$_id.{campo}" for campo in grupo}},
+        {"$merge": {"into": destino, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    return etapas
+
+
+def reconstruir_rollups(coleccion) -> dict:
+    """
+    Recalcula todos los rollups desde la colección de facturas.
+
+    Necesario la primera vez sobre una colección con documentos ingeridos
+    antes de mantener los rollups, o si una escritura de rollups se
+    interrumpió después de escribir sus documentos.
+
+    Args:
+        coleccion: Colección de facturas.
+
+    Returns:
+        dict: Grupos por rollup.
+    """
+    base = coleccion.database
+    grupos = {}
+    for rollup in ROLLUPS:
+        destino = nombre_rollup(coleccion, rollup)
+        base.drop_collection(destino)
+        for periodo in PERIODOS:
+            coleccion.aggregate(_pipeline_reconstruccion(destino, rollup, periodo), allowDiskUse=True)
+        base[destino].create_indexes(indices_rollup(rollup))
+        grupos[rollup] = base[destino].estimated_document_count()
+        logger.info(f"Rollup {destino} reconstruido: {grupos[rollup]} grupos")
+    return grupos
@@ -1,25 +1,56 @@
+import logging
 import os
-from pymongo import MongoClient
+import time
+from functools import lru_cache
+from pymongo import InsertOne, MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
 from dotenv import load_dotenv
- 
+
+from .logger_decorator import handle_errors
+from .mongo_rollups import (
+    CAMPOS_ROLLUP,
+    INDICES_FACTURAS,
+    ROLLUPS,
+    calcular_deltas,
+    indices_rollup,
+    nombre_rollup,
+    operaciones_rollup,
+)
+
+logger = logging.getLogger(__name__)
+
 def get_mongo_collection():
     """Retorna la colección de MongoDB usando la configuración de entorno."""
-    
-    [MONGO_URI,MONGO_DB, MONGO_COLLECTION]=load_env_variables() 
 
-    client = MongoClient(MONGO_URI)
+    [MONGO_URI,MONGO_DB, MONGO_COLLECTION]=load_env_variables()
+
+    client = get_mongo_client(MONGO_URI)
     db = client[MONGO_DB]
     collection = db[MONGO_COLLECTION]
     return collection
 
+@lru_cache(maxsize=None)
+def get_mongo_client(uri: str) -> MongoClient:
+    """
+    Retorna un cliente de MongoDB compartido por URI.
+
+    MongoClient mantiene su propio pool de conexiones y es seguro entre hilos,
+    por lo que se crea una sola vez por proceso.
+    """
+    return MongoClient(uri)
+
+@lru_cache(maxsize=None)
+def _cargar_dotenv():
+    load_dotenv()
+
 def load_env_variables():
     """
     Carga las variables de entorno desde el archivo .env.
-    
+
     Returns:
         dict: Diccionario con las variables de entorno cargadas.
     """
-    load_dotenv()  # Carga las variables de entorno desde el archivo .env
+    _cargar_dotenv()  # Carga las variables de entorno desde el archivo .env (una sola vez)
     # return {
     #     "MONGO_URI": os.getenv("MONGO_URI"),
     #     "MONGO_DB": os.getenv("MONGO_DB"),
@@ -30,17 +61,200 @@ def load_env_variables():
 def save_dict_to_mongo(data: dict):
     """
     Guarda un diccionario en la colección configurada de MongoDB.
-    
+
     Args:
         data (dict): Diccionario a guardar.
-    
+
     Returns:
         InsertOneResult: Resultado de la operación de inserción.
     """
     try:
         collection = get_mongo_collection()
-        result = collection.insert_one(data)    
-        return result.acknowledged 
+        result = collection.insert_one(data)
+        return result.acknowledged
     except Exception as e:
         print(f"Error inserting data: {e}")
-        return False 
\ No newline at end of file
+        return False
+
+
+class MongoWriter:
+    """
+    Escritor de MongoDB de larga duración que agrupa documentos en lotes.
+
+    Los documentos se acumulan en memoria y se guardan con un único
+    `bulk_write` no ordenado de upserts por `_id` (claveAcceso), de modo que
+    reingresar un documento lo reemplaza en lugar de fallar, y el error de un
+    documento no detiene al resto del lote.
+
+    Además mantiene los índices de consulta (creados en la primera escritura) y
+    los rollups de mongo_rollups: tras escribir cada lote aplica con `$inc` la
+    diferencia entre los documentos escritos y las versiones que reemplazaron,
+    así los tableros consultan totales ya agregados en lugar de recorrer la
+    colección. Sin transacciones (MongoDB sin replica set), si el proceso se
+    interrumpe entre ambas escrituras los rollups quedan desfasados y deben
+    reconstruirse con mongo_rollups.reconstruir_rollups.
+    """
+
+    def __init__(self, collection=None, batch_size=None, flush_interval=None,
+                 intentos=None, espera_reintento=None, rollups=None, indices=None):
+        """
+        Args:
+            collection: Colección destino. Por defecto la configurada en el .env.
+            batch_size (int): Documentos por lote (MONGO_BATCH_SIZE, 500 por defecto).
+            flush_interval (float): Segundos máximos entre escrituras
+                (MONGO_FLUSH_INTERVAL, 5 por defecto).
+            intentos (int): Intentos de escritura de un lote ante errores de
+                conexión (MONGO_INTENTOS, 3 por defecto).
+            espera_reintento (float): Espera inicial entre intentos, que se duplica
+                en cada reintento (MONGO_ESPERA_REINTENTO, 1 segundo por defecto).
+            rollups (bool): Mantener los rollups al escribir (MONGO_ROLLUPS, 1 por defecto).
+            indices (bool): Crear los índices de consulta (MONGO_INDICES, 1 por defecto).
+        """
+        _cargar_dotenv()
+        self.collection = collection if collection is not None else get_mongo_collection()
+        self.batch_size = batch_size or int(os.getenv("MONGO_BATCH_SIZE", 500))
+        self.flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else float(os.getenv("MONGO_FLUSH_INTERVAL", 5))
+        )
+        self.intentos = intentos or int(os.getenv("MONGO_INTENTOS", 3))
+        self.espera_reintento = (
+            espera_reintento
+            if espera_reintento is not None
+            else float(os.getenv("MONGO_ESPERA_REINTENTO", 1))
+        )
+        self.rollups = rollups if rollups is not None else os.getenv("MONGO_ROLLUPS", "1") == "1"
+        self.indices = indices if indices is not None else os.getenv("MONGO_INDICES", "1") == "1"
+        self.estadisticas = {"insertados": 0, "actualizados": 0, "errores": 0, "lotes": 0}
+        if self.rollups:
+            self.estadisticas.update(grupos_rollup=0, errores_rollup=0)
+        self._indices_creados = False
+        self._buffer = []
+        self._ultimo_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def add(self, data: dict) -> list:
+        """
+        Agrega un documento al lote y lo escribe si se alcanzó el tamaño o el intervalo.
+
+        Args:
+            data (dict): Documento transformado.
+
+        Returns:
+            list[dict]: Errores por documento del lote escrito (vacío si no hubo escritura).
+        """
+        self._buffer.append(data)
+        if (
+            len(self._buffer) >= self.batch_size
+            or time.monotonic() - self._ultimo_flush >= self.flush_interval
+        ):
+            return self.flush()
+        return []
+
+    def _reintentable(self, funcion):
+        # Las operaciones del writer son idempotentes o de sólo lectura
+        return handle_errors(
+            self.intentos, self.espera_reintento, backoff=2.0, exceptions=(ConnectionFailure,)
+        )(funcion)
+
+    def _rollup(self, rollup: str):
+        return self.collection.database[nombre_rollup(self.collection, rollup)]
+
+    def _crear_indices(self):
+        """Crea los índices de la colección y de los rollups (no hace nada si ya existen)."""
+        self._reintentable(self.collection.create_indexes)(INDICES_FACTURAS)
+        if self.rollups:
+            for rollup in ROLLUPS:
+                self._reintentable(self._rollup(rollup).create_indexes)(indices_rollup(rollup))
+        self._indices_creados = True
+
+    def _versiones_previas(self, documentos) -> dict:
+        """Lee los campos de los rollups de los documentos que el lote va a reemplazar."""
+        ids = [doc["_id"] for doc in documentos if "_id" in doc]
+        if not ids:
+            return {}
+        cursor = self._reintentable(
+            lambda: list(self.collection.find({"_id": {"$in": ids}}, list(CAMPOS_ROLLUP)))
+        )()
+        return {doc["_id"]: doc for doc in cursor}
+
+    def _actualizar_rollups(self, escritos, previos: dict):
+        """
+        Aplica a los rollups la diferencia que produjo el lote.
+
+        Un fallo aquí no revierte los documentos, que ya están escritos: se
+        registra y los rollups deben reconstruirse.
+        """
+        try:
+            for rollup, operaciones in operaciones_rollup(calcular_deltas(escritos, previos)).items():
+                self._reintentable(self._rollup(rollup).bulk_write)(operaciones, ordered=False)
+                self.estadisticas["grupos_rollup"] += len(operaciones)
+        except Exception as e:
+            self.estadisticas["errores_rollup"] += 1
+            logger.error(
+                f"No se pudieron actualizar los rollups ({type(e).__name__}: {e}); "
+                "ejecute la reconstrucción de rollups (--reconstruir-rollups)"
+            )
+
+    def flush(self) -> list:
+        """
+        Escribe los documentos acumulados.
+
+        Los errores de conexión se reintentan con espera exponencial (ver
+        handle_errors); si se agotan los intentos, o el error no es de
+        documento ni de conexión, la excepción se propaga y el lote se conserva.
+
+        Returns:
+            list[dict]: Un elemento por documento fallido con las claves
+                '_id', 'code' y 'errmsg'.
+        """
+        self._ultimo_flush = time.monotonic()
+        if not self._buffer:
+            return []
+
+        documentos = self._buffer
+        if self.indices and not self._indices_creados:
+            self._crear_indices()
+        # Versiones que el lote reemplaza, para restar su aporte a los rollups
+        previos = self._versiones_previas(documentos) if self.rollups else {}
+        operaciones = [
+            ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) if "_id" in doc else InsertOne(doc)
+            for doc in documentos
+        ]
+        self.estadisticas["lotes"] += 1
+        try:
+            # Los upserts por _id son idempotentes: reintentar un lote es seguro
+            resultado = self._reintentable(self.collection.bulk_write)(operaciones, ordered=False)
+            detalles = resultado.bulk_api_result
+            errores = []
+        except BulkWriteError as bwe:
+            detalles = bwe.details
+            errores = [
+                {
+                    "_id": documentos[error["index"]].get("_id"),
+                    "code": error.get("code"),
+                    "errmsg": error.get("errmsg"),
+                }
+                for error in detalles.get("writeErrors", [])
+            ]
+        self._buffer = []
+
+        if self.rollups:
+            fallidos = {error["index"] for error in detalles.get("writeErrors", [])}
+            self._actualizar_rollups(
+                (doc for i, doc in enumerate(documentos) if i not in fallidos), previos
+            )
+
+        self.estadisticas["insertados"] += detalles.get("nUpserted", 0) + detalles.get("nInserted", 0)
+        self.estadisticas["actualizados"] += detalles.get("nModified", 0)
+        self.estadisticas["errores"] += len(errores)
+        return errores
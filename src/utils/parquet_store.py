@@ -0,0 +1,319 @@
+import os
+import time
+import uuid
+from datetime import date
+
+from dotenv import load_dotenv
+
+# region Esquema de las tablas
+#
+# Las columnas de partición (mes de emisión y RUC del emisor) no se guardan en
+# los archivos: quedan en la ruta (particionado estilo Hive, mes=AAAA-MM/ruc=...)
+# y pyarrow.dataset / pandas las reconstruyen al leer.
+
+_TEXTO = "string"
+_DECIMAL = "float64"
+_FECHA = "date32"
+_ENTERO = "int32"
+
+COLUMNAS_FACTURAS = [
+    ("claveAcceso", _TEXTO),
+    ("ambiente", _TEXTO),
+    ("codigoDocumento", _TEXTO),
+    ("establecimiento", _TEXTO),
+    ("puntoEmisor", _TEXTO),
+    ("secuencial", _TEXTO),
+    ("fechaEmision", _FECHA),
+    ("direccionEstablecimiento", _TEXTO),
+    ("direccionComprador", _TEXTO),
+    ("totalSinImpuestos", _DECIMAL),
+    ("totalDescuento", _DECIMAL),
+    ("propina", _DECIMAL),
+    ("importeTotal", _DECIMAL),
+    ("moneda", _TEXTO),
+    ("totalConImpuestos", _DECIMAL),
+]
+
+COLUMNAS_DETALLES = [
+    ("claveAcceso", _TEXTO),
+    ("fechaEmision", _FECHA),
+    ("linea", _ENTERO),
+    ("codigoPrincipal", _TEXTO),
+    ("codigoAuxiliar", _TEXTO),
+    ("descripcion", _TEXTO),
+    ("unidadMedida", _TEXTO),
+    ("cantidad", _DECIMAL),
+    ("precioUnitario", _DECIMAL),
+    ("precioTotalSinImpuesto", _DECIMAL),
+    ("totalImpuesto", _DECIMAL),
+]
+
+COLUMNAS_PAGOS = [
+    ("claveAcceso", _TEXTO),
+    ("fechaEmision", _FECHA),
+    ("formaPago", _TEXTO),
+    ("total", _DECIMAL),
+]
+
+TABLAS = {
+    "facturas": COLUMNAS_FACTURAS,
+    "detalles": COLUMNAS_DETALLES,
+    "pagos": COLUMNAS_PAGOS,
+}
+
+# endregion
+
+
+def _fecha_emision(valor: str) -> date:
+    """Convierte 'dd/mm/aaaa' (formato del SRI) a fecha."""
+    dia, mes, anio = valor.split("/")
+    return date(int(anio), int(mes), int(dia))
+
+
+def _particion(data: dict):
+    """
+    Partición de un documento: (mes de emisión 'AAAA-MM', RUC del emisor).
+
+    El RUC se toma de la claveAcceso (posiciones 11 a 23).
+    """
+    fecha = _fecha_emision(data["fechaEmision"])
+    ruc = data["_id"][10:23]
+    if len(ruc) != 13 or not ruc.isdigit():
+        raise ValueError(f"claveAcceso sin RUC válido: {data['_id']}")
+    return f"{fecha.year:04d}-{fecha.month:02d}", ruc, fecha
+
+
+class ParquetWriter:
+    """
+    Escritor de Parquet que agrupa documentos transformados en lotes.
+
+    Cada documento se reparte en tres tablas: `facturas` (cabecera, una fila por
+    documento), `detalles` (una fila por línea) y `pagos` (una fila por pago),
+    particionadas por mes de emisión y RUC del emisor. Cada escritura de lote
+    agrega un archivo por tabla y partición; los archivos se escriben con un
+    nombre temporal y se renombran al terminar, así que un lector nunca ve un
+    archivo a medio escribir.
+
+    Tiene la misma interfaz que MongoWriter (add/flush/estadisticas) y, como
+    el upsert de MongoDB, las escrituras son idempotentes por claveAcceso:
+    reingresar un documento (--retransform, --retry-failed, --sin-deduplicacion)
+    reemplaza sus filas en lugar de repetirlas. Como la partición sale de la
+    claveAcceso, un documento siempre cae en la misma partición; después de
+    escribir el archivo nuevo se reescriben sin esas claves los archivos
+    anteriores de la partición que las contienen (ver _reemplazar).
+    """
+
+    def __init__(self, destino=None, batch_size=None, row_group_size=None, flush_interval=None):
+        """
+        Args:
+            destino (str): Directorio raíz del dataset (PARQUET_DIR, 'data/parquet' por defecto).
+            batch_size (int): Documentos por lote (PARQUET_BATCH_SIZE, 50000 por defecto).
+                Lotes grandes producen menos archivos y más grandes.
+            row_group_size (int): Filas máximas por row group (PARQUET_ROW_GROUP_SIZE,
+                131072 por defecto); row groups grandes favorecen las lecturas
+                analíticas por columna.
+            flush_interval (float): Segundos máximos entre escrituras
+                (PARQUET_FLUSH_INTERVAL, 300 por defecto).
+        """
+        load_dotenv()
+        self.destino = destino or os.getenv("PARQUET_DIR", "data/parquet")
+        self.batch_size = batch_size or int(os.getenv("PARQUET_BATCH_SIZE", 50000))
+        self.row_group_size = row_group_size or int(os.getenv("PARQUET_ROW_GROUP_SIZE", 131072))
+        self.flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else float(os.getenv("PARQUET_FLUSH_INTERVAL", 300))
+        )
+        self.estadisticas = {
+            "documentos": 0,
+            "filas": 0,
+            "archivos": 0,
+            "errores": 0,
+            "lotes": 0,
+            "filas_reemplazadas": 0,
+        }
+        self._particiones = {}
+        self._pendientes = 0
+        self._ultimo_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def __len__(self):
+        return self._pendientes
+
+    def add(self, data: dict) -> list:
+        """
+        Agrega un documento al lote y lo escribe si se alcanzó el tamaño o el intervalo.
+
+        Args:
+            data (dict): Documento transformado (salida de transformar_factura).
+
+        Returns:
+            list[dict]: Errores por documento ('_id', 'code', 'errmsg').
+        """
+        try:
+            mes, ruc, fecha = _particion(data)
+        except (KeyError, ValueError, AttributeError) as e:
+            self.estadisticas["errores"] += 1
+            return [{"_id": data.get("_id"), "code": "particion", "errmsg": str(e)}]
+
+        self._particiones.setdefault((mes, ruc), []).append((fecha, data))
+        self._pendientes += 1
+        if (
+            self._pendientes >= self.batch_size
+            or time.monotonic() - self._ultimo_flush >= self.flush_interval
+        ):
+            return self.flush()
+        return []
+
+    def flush(self) -> list:
+        """
+        Escribe los documentos acumulados, un archivo por tabla y partición, y
+        quita de los archivos anteriores las filas de esas claves de acceso.
+
+        Si la escritura falla (p. ej. disco lleno) la excepción se propaga y
+        los documentos pendientes se conservan para reintentar.
+
+        Returns:
+            list[dict]: Errores por documento (la escritura de Parquet no
+                rechaza documentos individuales, así que siempre está vacía).
+        """
+        self._ultimo_flush = time.monotonic()
+        if not self._particiones:
+            return []
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        esquemas = {
+            tabla: pa.schema([(nombre, pa.type_for_alias(tipo)) for nombre, tipo in columnas])
+            for tabla, columnas in TABLAS.items()
+        }
+        lote = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        for (mes, ruc), documentos in list(self._particiones.items()):
+            # Si el lote repite una claveAcceso, queda la última versión
+            ultimos = list({data["_id"]: (fecha, data) for fecha, data in documentos}.values())
+            claves = pa.array([data["_id"] for _, data in ultimos], type=pa.string())
+            for tabla, filas in _filas_por_tabla(ultimos).items():
+                directorio = os.path.join(self.destino, tabla, f"mes={mes}", f"ruc={ruc}")
+                ruta = os.path.join(directorio, f"part-{lote}.parquet")
+                if filas["claveAcceso"]:
+                    os.makedirs(directorio, exist_ok=True)
+                    pq.write_table(
+                        pa.Table.from_pydict(filas, schema=esquemas[tabla]),
+                        ruta + ".tmp",
+                        row_group_size=self.row_group_size,
+                        compression="zstd",
+                    )
+                    os.replace(ruta + ".tmp", ruta)
+                    self.estadisticas["archivos"] += 1
+                    self.estadisticas["filas"] += len(filas["claveAcceso"])
+                # Aunque el documento ya no tenga filas en la tabla (p. ej. sin
+                # pagos), se quitan las anteriores
+                self._reemplazar(directorio, claves, ruta)
+            self.estadisticas["documentos"] += len(ultimos)
+            self._pendientes -= len(documentos)
+            del self._particiones[(mes, ruc)]
+        self.estadisticas["lotes"] += 1
+        return []
+
+    def _reemplazar(self, directorio, claves, nuevo):
+        """
+        Quita las filas de `claves` de los archivos de una partición, salvo `nuevo`.
+
+        Sólo se lee la columna claveAcceso de cada archivo; los que contienen
+        alguna de las claves se reescriben sin ellas (o se borran si quedan
+        vacíos), con el mismo nombre temporal + rename que las escrituras. El
+        archivo nuevo se escribe antes, así que una interrupción deja filas
+        repetidas (que la siguiente escritura de esos documentos reemplaza),
+        nunca documentos sin filas.
+        """
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        if not os.path.isdir(directorio):
+            return
+        for nombre in sorted(os.listdir(directorio)):
+            ruta = os.path.join(directorio, nombre)
+            if not nombre.endswith(".parquet") or ruta == nuevo:
+                continue
+            archivo = pq.ParquetFile(ruta)
+            repetidas = pc.is_in(
+                archivo.read(columns=["claveAcceso"]).column("claveAcceso"), value_set=claves
+            )
+            quitadas = pc.sum(repetidas).as_py() or 0
+            if not quitadas:
+                continue
+            restantes = archivo.read().filter(pc.invert(repetidas))
+            archivo.close()
+            if restantes.num_rows:
+                pq.write_table(
+                    restantes, ruta + ".tmp", row_group_size=self.row_group_size,
+                    compression="zstd",
+                )
+                os.replace(ruta + ".tmp", ruta)
+            else:
+                os.remove(ruta)
+            self.estadisticas["filas_reemplazadas"] += quitadas
+
+
+def _filas_por_tabla(documentos) -> dict:
+    """Reparte los documentos de una partición en columnas de cada tabla."""
+    filas = {tabla: {nombre: [] for nombre, _ in columnas} for tabla, columnas in TABLAS.items()}
+    facturas, detalles, pagos = filas["facturas"], filas["detalles"], filas["pagos"]
+    columnas_factura = [nombre for nombre, _ in COLUMNAS_FACTURAS[1:] if nombre != "fechaEmision"]
+    columnas_detalle = [nombre for nombre, _ in COLUMNAS_DETALLES[3:]]
+
+    for fecha, data in documentos:
+        clave = data["_id"]
+        facturas["claveAcceso"].append(clave)
+        facturas["fechaEmision"].append(fecha)
+        for nombre in columnas_factura:
+            facturas[nombre].append(data.get(nombre))
+
+        for linea, detalle in enumerate(data.get("detalles") or [], start=1):
+            detalles["claveAcceso"].append(clave)
+            detalles["fechaEmision"].append(fecha)
+            detalles["linea"].append(linea)
+            for nombre in columnas_detalle:
+                detalles[nombre].append(detalle.get(nombre))
+
+        for pago in data.get("pagos") or []:
+            pagos["claveAcceso"].append(clave)
+            pagos["fechaEmision"].append(fecha)
+            pagos["formaPago"].append(pago.get("formaPago"))
+            pagos["total"].append(pago.get("total"))
+    return filas
+
+
+def leer_tabla(tabla: str, destino=None, columnas=None, filtro=None):
+    """
+    Lee una tabla del dataset Parquet como DataFrame de pandas.
+
+    Las columnas de partición 'mes' y 'ruc' se leen como texto (si se dejara
+    que pyarrow infiera su tipo, el RUC se convertiría a entero).
+
+    Args:
+        tabla (str): 'facturas', 'detalles' o 'pagos'.
+        destino (str): Directorio raíz del dataset (por defecto PARQUET_DIR).
+        columnas (list[str]): Columnas a leer (por defecto todas).
+        filtro: Expresión de pyarrow.dataset, p. ej. `ds.field("mes") == "2022-06"`;
+            los filtros sobre 'mes' y 'ruc' descartan particiones completas.
+
+    Returns:
+        pandas.DataFrame: Filas de la tabla.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    load_dotenv()
+    destino = destino or os.getenv("PARQUET_DIR", "data/parquet")
+    particiones = ds.partitioning(
+        pa.schema([("mes", pa.string()), ("ruc", pa.string())]), flavor="hive"
+    )
+    dataset = ds.dataset(os.path.join(destino, tabla), format="parquet", partitioning=particiones)
+    return dataset.to_table(columns=columnas, filter=filtro).to_pandas()
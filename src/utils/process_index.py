@@ -0,0 +1,166 @@
+import atexit
+import os
+
+# region Processed-ID index
+
+class ProcessIndex:
+    """
+    Set of processed file IDs backed by an append-only index file.
+
+    The index file is read once into a hash set, so membership checks are O(1).
+    New IDs are buffered and appended in batches with a single write + fsync,
+    which keeps the file consistent if the process is interrupted.
+    """
+
+    def __init__(self, index_file_name, batch_size=500):
+        """
+        Args:
+            index_file_name (str): Path of the index file (one ID per line).
+            batch_size (int): Number of buffered IDs that triggers a flush.
+        """
+        self.index_file_name = index_file_name
+        self.batch_size = batch_size
+        self._ids = set()
+        self._pending = []
+        self._needs_newline = False
+        self._load()
+
+    def __contains__(self, file_id):
+        return file_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def add(self, file_id):
+        """
+        Marks a file ID as processed. The ID is persisted on the next flush.
+
+        Args:
+            file_id (str): The file ID to add.
+        """
+        if file_id in self._ids:
+            return
+        self._ids.add(file_id)
+        self._pending.append(file_id)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Appends the buffered IDs to the index file and syncs it to disk."""
+        if not self._pending:
+            return
+        data = "\n".join(self._pending) + "\n"
+        if self._needs_newline:
+            # The last write was interrupted mid-line; never glue IDs together
+            data = "\n" + data
+        directory = os.path.dirname(self.index_file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.index_file_name, "a") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._needs_newline = False
+        self._pending.clear()
+
+    def _load(self):
+        # The file is created on the first flush, so loading (e.g. for a dry
+        # run) never writes anything
+        if not os.path.exists(self.index_file_name):
+            return
+
+        with open(self.index_file_name, "r") as f:
+            content = f.read()
+        self._ids.update(line.strip() for line in content.splitlines())
+        self._ids.discard("")
+        self._needs_newline = bool(content) and not content.endswith("\n")
+
+
+def count_ids(index_file_name, selected=None):
+    """
+    Counts the IDs of an index file without loading them into a set.
+
+    IDs are only appended once (see ProcessIndex.add), so this is the number
+    of non-empty lines.
+
+    Args:
+        index_file_name (str): Path of the index file.
+        selected (callable): Predicate on the ID to count only some of them.
+
+    Returns:
+        int: Number of IDs (0 if the file does not exist).
+    """
+    if not os.path.exists(index_file_name):
+        return 0
+    with open(index_file_name, "r") as f:
+        return sum(
+            1 for line in f
+            if line.strip() and (selected is None or selected(line.strip()))
+        )
+
+
+def seed_index(index_file_name, source_file_name, selected=None):
+    """
+    Creates an index file with the IDs of another one, unless it already exists.
+
+    The file is written under a temporary name and renamed, so an interrupted
+    seed leaves no index behind and is simply done again.
+
+    Args:
+        index_file_name (str): Path of the index file to create.
+        source_file_name (str): Path of the index file to copy the IDs from.
+        selected (callable): Predicate on the ID to copy only some of them.
+
+    Returns:
+        int: Number of IDs copied (0 if the index existed or there is no source).
+    """
+    if os.path.exists(index_file_name) or not os.path.exists(source_file_name):
+        return 0
+    directory = os.path.dirname(index_file_name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    copied = 0
+    tmp = index_file_name + ".tmp"
+    with open(source_file_name, "r") as source, open(tmp, "w") as f:
+        for line in source:
+            file_id = line.strip()
+            if file_id and (selected is None or selected(file_id)):
+                f.write(file_id + "\n")
+                copied += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, index_file_name)
+    return copied
+
+
+_indexes = {}
+
+
+def get_process_index(index_file_name):
+    """
+    Returns the shared ProcessIndex for an index file, loading it on first use.
+
+    Pending IDs of every shared index are flushed when the interpreter exits.
+    """
+    key = os.path.abspath(index_file_name)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = ProcessIndex(index_file_name)
+    return index
+
+
+@atexit.register
+def _flush_all():
+    for index in _indexes.values():
+        index.flush()
+
+# endregion
@@ -0,0 +1,64 @@
+import pytest
+
+from src.utils.dedupe import DedupeCache
+
+KEY = '0206202201179307097300120010010000000008076186312'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DedupeCache(str(tmp_path / 'keys.index'), str(tmp_path / 'fingerprints.index'))
+
+
+def _original_and_copy(cache):
+    assert cache.check('original', b'<factura/>', KEY) is None
+    duplicate = cache.check('copy', b'<factura/>', KEY)
+    assert duplicate.original == 'original'
+    return duplicate
+
+
+def test_copy_handed_back_after_confirm_is_duplicate(cache):
+    duplicate = _original_and_copy(cache)
+
+    assert cache.confirm('original') == []
+    assert cache.copy_of(duplicate.original, 'copy') is True
+    assert not cache._outcomes and not cache._reported_copies
+
+
+def test_copy_handed_back_after_release_stays_pending(cache):
+    duplicate = _original_and_copy(cache)
+
+    assert cache.release('original') == []
+    assert cache.copy_of(duplicate.original, 'copy') is False
+    assert not cache._outcomes and not cache._reported_copies
+
+
+@pytest.mark.parametrize('settle, ingested', [('confirm', True), ('release', False)])
+def test_copy_handed_back_in_flight_waits_for_original(cache, settle, ingested):
+    duplicate = _original_and_copy(cache)
+
+    assert cache.copy_of(duplicate.original, 'copy') is None
+    assert getattr(cache, settle)('original') == ['copy']
+    assert 'original' not in cache._waiting_copies
+    # A released original leaves its key free for a later run
+    assert (KEY in cache._keys) is ingested
+
+
+def test_copies_before_and_after_settlement(cache):
+    duplicate = _original_and_copy(cache)
+    second = cache.check('second copy', b'<factura/>', KEY)
+    assert second.original == 'original'
+
+    assert cache.copy_of(duplicate.original, 'copy') is None
+    assert cache.confirm('original') == ['copy']
+    assert cache.copy_of(second.original, 'second copy') is True
+    assert not cache._outcomes and not cache._reported_copies
+
+
+def test_confirmed_key_is_duplicate_in_later_checks(cache):
+    _original_and_copy(cache)
+    cache.confirm('original')
+
+    duplicate = cache.check('later', b'<factura>otra</factura>', KEY)
+    assert duplicate.original is None
+    assert duplicate.description == f'claveAcceso {KEY}'
@@ -0,0 +1,78 @@
+import zipfile
+
+import pytest
+
+from src.utils.file_operation import iter_pending_files
+from src.utils.manifest import STATUS_FAILED, STATUS_PROCESSED, FileManifest
+
+MEMBERS = ('2022-06/factura-1.xml', '2022-06/factura-2.xml')
+
+
+@pytest.fixture
+def archive_tree(tmp_path):
+    root = tmp_path / 'data'
+    root.mkdir()
+    with zipfile.ZipFile(root / '2022-06.zip', 'w') as archive:
+        for name in MEMBERS:
+            archive.writestr(name, '<autorizacion/>')
+    return str(root), str(tmp_path / 'manifest.sqlite'), str(tmp_path / 'process.index')
+
+
+def _pending(root, manifest, index_file_name):
+    return list(iter_pending_files(
+        root, index_file_name=index_file_name, manifest=manifest, include_archives=True,
+    ))
+
+
+def _counts(manifest):
+    manifest.flush()
+    return manifest.counts()
+
+
+def test_archive_stays_pending_until_every_member_is_written(archive_tree):
+    root, db_path, index_file_name = archive_tree
+    with FileManifest(db_path) as manifest:
+        members = _pending(root, manifest, index_file_name)
+        assert [member.filename for member in members] == ['factura-1.xml', 'factura-2.xml']
+        assert _counts(manifest) == {'pending': 1}
+
+        manifest.set_status(members[0].path, STATUS_PROCESSED)
+        assert _counts(manifest) == {'pending': 1}
+
+        manifest.set_status(members[1].path, STATUS_PROCESSED)
+        assert _counts(manifest) == {'processed': 1}
+
+
+def test_archive_with_a_failed_member_is_failed(archive_tree):
+    root, db_path, index_file_name = archive_tree
+    with FileManifest(db_path) as manifest:
+        members = _pending(root, manifest, index_file_name)
+        manifest.set_status(members[0].path, STATUS_FAILED)
+        manifest.set_status(members[1].path, STATUS_PROCESSED)
+        assert _counts(manifest) == {STATUS_FAILED: 1}
+
+
+def test_members_written_before_the_archive_is_read_completely(archive_tree):
+    root, db_path, index_file_name = archive_tree
+    with FileManifest(db_path) as manifest:
+        pending = iter_pending_files(
+            root, index_file_name=index_file_name, manifest=manifest, include_archives=True,
+        )
+        for member in pending:
+            manifest.set_status(member.path, STATUS_PROCESSED)
+            # Every yielded member is written, but more may follow
+            if member.filename == 'factura-1.xml':
+                assert _counts(manifest) == {'pending': 1}
+        assert _counts(manifest) == {'processed': 1}
+
+
+def test_unsettled_archive_is_scanned_again(archive_tree):
+    root, db_path, index_file_name = archive_tree
+    with FileManifest(db_path) as manifest:
+        members = _pending(root, manifest, index_file_name)
+        # Interrupted before the second member was written
+        manifest.set_status(members[0].path, STATUS_PROCESSED)
+
+    with FileManifest(db_path) as manifest:
+        assert _counts(manifest) == {'pending': 1}
+        assert len(_pending(root, manifest, index_file_name)) == len(MEMBERS)